@@ -0,0 +1,526 @@
+# Author: Lunelys RUNESHAW <lunelys.runeshaw@etudiant.univ-rennes.fr>
+#
+# This script is measuring the performance of the pipeline offline, so the timings are not network noise. It generates
+# synthetic recordings of every remote source (PSICQUIC registry xml, MITAB tab25/tab27 pages of each PSICQUIC service,
+# BioGRID json pages, Uniprot search pages and stream file, OLS terms) for a number of experimental evidences, and
+# replays them through a patched requests session (and urlopen for the registry): nothing goes to the network.
+# It then times biogrid_to_tab27, the cleaning, the removing of the redundancies and the whole main.py pipeline, and
+# appends the results, with the commit they were measured on, to benchmark_results/results.jsonl.
+# The recordings are kept in benchmark_fixtures/ and reused by the next runs (same size and seed = same data), and the
+# pipeline runs in benchmark_run/.
+#
+# Examples:
+# python benchmark.py                               (10000 experimental evidences)
+# python benchmark.py 10000 100000 1000000 10000000 --repeat 3
+# python benchmark.py 10000000 --chunk-size 500000 --partitions 64 --partition-max-workers 4
+# python benchmark.py --compare 1000000              (results of that size, commit after commit)
+
+import os
+import re
+import sys
+import json
+import gzip
+import time
+import shutil
+import string
+import argparse
+import datetime
+import platform
+import subprocess
+from urllib.parse import urlparse, parse_qs, unquote
+import numpy as np
+import pandas as pd
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+script_folder = os.path.dirname(os.path.abspath(__file__))
+fixtures_folder = os.path.join(script_folder, 'benchmark_fixtures')
+results_file = os.path.join(script_folder, 'benchmark_results', 'results.jsonl')
+run_folder = os.path.join(script_folder, 'benchmark_run')
+ols_cache_file = os.path.join('cache', 'ols_cache.json')  # in run_folder
+
+psicquic_services = ['IntAct', 'MINT', 'DIP']
+biogrid_share = 0.4  # of the experimental evidences, the rest is split between the PSICQUIC services
+biogrid_page_size = 10000
+uniprot_page_size = 500
+uniprot_release = '2024_01'
+taxid = '559292'
+# synthetic PSI-MI ontology: term -> (name, parent). MI:0999 is the obsolete term
+ontology = {'MI:0000': ('molecular interaction', None), 'MI:0001': ('interaction detection method', 'MI:0000'),
+            'MI:0045': ('experimental interaction detection', 'MI:0001'), 'MI:0401': ('biochemical', 'MI:0045'),
+            'MI:0004': ('affinity chromatography technology', 'MI:0401'), 'MI:0019': ('coimmunoprecipitation', 'MI:0004'),
+            'MI:0006': ('anti bait coimmunoprecipitation', 'MI:0019'),
+            'MI:0007': ('anti tag coimmunoprecipitation', 'MI:0019'), 'MI:0415': ('enzymatic study', 'MI:0401'),
+            'MI:0013': ('biophysical', 'MI:0045'), 'MI:0114': ('x-ray crystallography', 'MI:0013'),
+            'MI:0055': ('fluorescent resonance energy transfer', 'MI:0013'),
+            'MI:0428': ('imaging techniques', 'MI:0045'), 'MI:0047': ('far western blotting', 'MI:0401'),
+            'MI:0090': ('protein complementation assay', 'MI:0045'), 'MI:0018': ('two hybrid', 'MI:0090'),
+            'MI:0397': ('two hybrid array', 'MI:0018'), 'MI:0398': ('two hybrid pooling approach', 'MI:0018'),
+            'MI:1313': ('proximity labelling technology', 'MI:0045'), 'MI:0686': ('unspecified method', 'MI:0001'),
+            'MI:0063': ('interaction prediction', 'MI:0001'), 'MI:0064': ('interologs mapping', 'MI:0063'),
+            'MI:0362': ('inference', 'MI:0001'), 'MI:1088': ('phenotype-based detection assay', 'MI:0001'),
+            'MI:0254': ('genetic interference', 'MI:1088'), 'MI:0999': ('obsolete method', 'MI:0045')}
+# IDMs of the PSICQUIC experimental evidences, and how often they are used
+psicquic_idms = {'MI:0018': 0.25, 'MI:0397': 0.1, 'MI:0398': 0.05, 'MI:0019': 0.1, 'MI:0006': 0.1, 'MI:0007': 0.1,
+                 'MI:0004': 0.1, 'MI:0090': 0.05, 'MI:0055': 0.05, 'MI:0064': 0.05, 'MI:0686': 0.05}
+biogrid_systems = ['Two-hybrid', 'Affinity Capture-MS', 'Affinity Capture-Western', 'Reconstituted Complex', 'PCA',
+                   'Co-crystal Structure', 'Biochemical Activity', 'Co-fractionation', 'Co-localization',
+                   'Far Western', 'FRET', 'Proximity Label-MS', 'Co-purification']
+# share of the experimental evidences failing each filter of the cleaning (or of the BioGRID fetching)
+noise = {'no protein name': 0.01, 'not a protein': 0.02, 'no protein id': 0.02, 'no idm': 0.01, 'no pubmed id': 0.02,
+         'no interaction id': 0.01, 'no uniprotkb equivalency': 0.01, 'obsolete idm': 0.03, 'no gene name': 0.2}
+block_size = 1000000  # experimental evidences generated at a time
+
+
+def get_fixture_folder(size, seed):
+    return os.path.join(fixtures_folder, str(size) + '_seed' + str(seed))
+
+
+def make_accessions(numbers):
+    # a valid uniprotkb accession ([A-NR-Z][0-9][A-Z][A-Z0-9][A-Z0-9][0-9]) for each number
+    parts = []
+    for alphabet in (string.digits, string.ascii_uppercase + string.digits, string.ascii_uppercase + string.digits,
+                     string.ascii_uppercase, string.digits, 'ABCDEFGHIJKLMNRSTUVWXYZ'):
+        parts.append(pd.Series(np.array(list(alphabet))[numbers % len(alphabet)]))
+        numbers = numbers // len(alphabet)
+    return parts[5] + parts[4] + parts[3] + parts[2] + parts[1] + parts[0]
+
+
+def make_proteins(n_proteins):
+    # the Uniprot entries of the synthetic species: accession, geneID, gene name (not always), ordered locus name
+    numbers = np.arange(n_proteins)
+    proteins = pd.DataFrame({'accession': make_accessions(numbers), 'geneid': (850000 + numbers).astype(str),
+                             'gene_name': 'GEN' + pd.Series(numbers).astype(str),
+                             'ordered_locus_name': 'Y' + pd.Series(numbers).astype(str).str.zfill(6) + 'W'})
+    proteins.loc[numbers % 7 == 0, 'gene_name'] = ''
+    return proteins
+
+
+def pick(rng, mask_share, size):
+    return rng.random(size) < mask_share
+
+
+def make_groups(rng, size, n_proteins, n_groups, n_publications):
+    # each experimental evidence belongs to a (protein a, protein b, publication) group, so there are redundancies
+    group = rng.integers(0, n_groups, size)
+    protein_a = (group * 2654435761) % n_proteins
+    protein_b = (group * 40503 + 7) % n_proteins
+    protein_b = np.where(protein_b == protein_a, (protein_b + 1) % n_proteins, protein_b)
+    publication = 10000000 + (group * 97) % n_publications
+    return protein_a, protein_b, publication
+
+
+def make_psicquic_frame(rng, service, start, size, proteins, n_groups, n_publications):
+    # size experimental evidences of a PSICQUIC service, in MITAB 2.7 (42 columns, the 15 first ones are MITAB 2.5)
+    protein_a, protein_b, publication = make_groups(rng, size, proteins.shape[0], n_groups, n_publications)
+    a = proteins.iloc[protein_a].reset_index(drop=True)
+    b = proteins.iloc[protein_b].reset_index(drop=True)
+    df = pd.DataFrame('-', index=range(size), columns=range(42))
+    df[0] = 'uniprotkb:' + a['accession']
+    df[1] = 'uniprotkb:' + b['accession']
+    df.loc[pick(rng, noise['no protein id'], size), 0] = 'intact:EBI-' + pd.Series(protein_a).astype(str)
+    df[4] = 'uniprotkb:' + a['gene_name'] + '(gene name)|uniprotkb:' + a['ordered_locus_name'] + '(locus name)'
+    df[5] = 'uniprotkb:' + b['gene_name'] + '(gene name)|uniprotkb:' + b['ordered_locus_name'] + '(locus name)'
+    df.loc[pick(rng, noise['no gene name'], size), 4] = '-'
+    idms = rng.choice(list(psicquic_idms), size, p=list(psicquic_idms.values()))
+    df[6] = 'psi-mi:"' + pd.Series(idms) + '"(' + pd.Series(idms).map(lambda mi: ontology[mi][0]) + ')'
+    df.loc[pick(rng, noise['obsolete idm'], size), 6] = 'psi-mi:"MI:0999"(obsolete method)'
+    df.loc[pick(rng, noise['no idm'], size), 6] = '-'
+    df[7] = 'Smith et al. (' + pd.Series(2000 + publication % 20).astype(str) + ')'
+    df[8] = 'pubmed:' + pd.Series(publication).astype(str) + '|imex:IM-' + pd.Series(publication % 5000).astype(str)
+    df.loc[pick(rng, noise['no pubmed id'], size), 8] = 'imex:IM-1'
+    df[9] = 'taxid:' + taxid + '(yeast)|taxid:' + taxid + '(Saccharomyces cerevisiae)'
+    df[10] = df[9]
+    df[11] = 'psi-mi:"MI:0915"(physical association)'
+    df[12] = 'psi-mi:"MI:0469"(' + service + ')'
+    df[13] = service.lower() + ':EBI-' + pd.Series(np.arange(start, start + size)).astype(str)
+    df.loc[pick(rng, noise['no interaction id'], size), 13] = '-'
+    df[14] = 'intact-miscore:0.' + pd.Series(rng.integers(10, 99, size)).astype(str)
+    df[16] = 'psi-mi:"MI:0499"(unspecified role)'
+    df[17] = 'psi-mi:"MI:0499"(unspecified role)'
+    df[18] = 'psi-mi:"MI:0496"(bait)'
+    df[19] = 'psi-mi:"MI:0498"(prey)'
+    df[20] = 'psi-mi:"MI:0326"(protein)'
+    df[21] = 'psi-mi:"MI:0326"(protein)'
+    df.loc[pick(rng, noise['not a protein'], size), 21] = 'psi-mi:"MI:0320"(ribonucleic acid)'
+    df[28] = 'taxid:-1(in vitro)'
+    df[40] = 'psi-mi:"MI:0396"(predetermined participant)'
+    df[41] = 'psi-mi:"MI:0396"(predetermined participant)'
+    return df
+
+
+def make_biogrid_frame(rng, start, size, proteins, n_groups, n_publications):
+    # size BioGRID interactions, with the fields of the BioGRID json (see biogrid_fetching.make_call)
+    protein_a, protein_b, publication = make_groups(rng, size, proteins.shape[0], n_groups, n_publications)
+    a = proteins.iloc[protein_a].reset_index(drop=True)
+    b = proteins.iloc[protein_b].reset_index(drop=True)
+    df = pd.DataFrame({'ENTREZ_GENE_A': a['geneid'], 'ENTREZ_GENE_B': b['geneid'],
+                       'OFFICIAL_SYMBOL_A': a['gene_name'].where(a['gene_name'] != '', a['ordered_locus_name']),
+                       'OFFICIAL_SYMBOL_B': b['gene_name'].where(b['gene_name'] != '', b['ordered_locus_name']),
+                       'EXPERIMENTAL_SYSTEM': rng.choice(biogrid_systems, size),
+                       'PUBMED_AUTHOR': 'Smith J (' + pd.Series(2000 + publication % 20).astype(str) + ')',
+                       'PUBMED_ID': publication, 'ORGANISM_A': int(taxid), 'ORGANISM_B': int(taxid),
+                       'THROUGHPUT': rng.choice(['Low Throughput', 'High Throughput'], size), 'SOURCEDB': 'BIOGRID',
+                       'QUANTITATION': '-'})
+    df.loc[pick(rng, noise['no protein name'], size), 'ENTREZ_GENE_A'] = '-'
+    df.loc[pick(rng, noise['no uniprotkb equivalency'], size), 'ENTREZ_GENE_B'] = '990000'
+    df.index = (start + np.arange(size)).astype(str)
+    return df
+
+
+def make_ols_terms():
+    # the answers of the OLS API: for each term, its ancestors and its descendants
+    children = {}
+    for mi, (name, parent) in ontology.items():
+        children.setdefault(parent, []).append(mi)
+
+    def term(mi):
+        return {'annotation': {'id': [mi]}, 'label': ontology[mi][0], 'description': [ontology[mi][0]],
+                'is_obsolete': mi == 'MI:0999', 'has_children': mi in children}
+
+    ols = {'ancestors': {}, 'descendants': {}}
+    for mi in ontology:
+        if mi == 'MI:0999':
+            ols['ancestors'][mi] = [term(mi)]
+        else:
+            ancestors = []
+            parent = ontology[mi][1]
+            while parent:
+                ancestors.append(term(parent))
+                parent = ontology[parent][1]
+            ols['ancestors'][mi] = ancestors
+        descendants = []
+        to_visit = list(children.get(mi, []))
+        while to_visit:
+            child = to_visit.pop()
+            descendants.append(term(child))
+            to_visit.extend(children.get(child, []))
+        ols['descendants'][mi] = descendants
+    return ols
+
+
+def make_uniprot_fixtures(fixture_folder, proteins):
+    # the stream endpoint (one gzipped tsv) and the pages of the search endpoint (one json page per line)
+    stream = pd.DataFrame({'Entry': proteins['accession'], 'Gene Names (primary)': proteins['gene_name'],
+                           'GeneID': proteins['geneid'] + ';', 'Gene Names (ordered locus)': proteins['ordered_locus_name'],
+                           'Gene Names (ORF)': '', 'Gene Names (synonym)': ''})
+    with gzip.open(os.path.join(fixture_folder, 'uniprot_stream.tsv.gz'), 'wt') as stream_file:
+        stream.to_csv(stream_file, sep='\t', index=False)
+    with open(os.path.join(fixture_folder, 'uniprot_search.jsonl'), 'w') as search_file:
+        for start in range(0, proteins.shape[0], uniprot_page_size):
+            page = []
+            for accession, geneid, gene_name, ordered_locus_name in \
+                    proteins.iloc[start:start + uniprot_page_size].itertuples(index=False):
+                genes = {'orderedLocusNames': [{'value': ordered_locus_name}]}
+                if gene_name:
+                    genes['geneName'] = {'value': gene_name}
+                page.append({'primaryAccession': accession, 'genes': [genes],
+                             'uniProtKBCrossReferences': [{'database': 'GeneID', 'id': geneid}]})
+            search_file.write(json.dumps({'results': page}) + '\n')
+
+
+def make_registry(fixture_folder):
+    services = ''.join('<service><name>' + service + '</name><restUrl>http://replay.psicquic/' + service +
+                       '/webservices/current/search/</restUrl><active>true</active></service>'
+                       for service in psicquic_services)
+    with open(os.path.join(fixture_folder, 'registry.xml'), 'w') as registry:
+        registry.write('<?xml version="1.0" encoding="UTF-8"?><registry xmlns="http://hupo.psi.org/psicquic/registry">'
+                       + services + '</registry>')
+
+
+def make_fixtures(size, seed=0):
+    # the recordings of all the remote sources for size experimental evidences, generated once
+    fixture_folder = get_fixture_folder(size, seed)
+    if os.path.exists(os.path.join(fixture_folder, 'manifest.json')):
+        return fixture_folder
+    print('Generating the recordings for ' + str(size) + ' experimental evidences in ' + fixture_folder)
+    if os.path.isdir(fixture_folder):
+        shutil.rmtree(fixture_folder)
+    os.makedirs(os.path.join(fixture_folder, 'biogrid'))
+    rng = np.random.default_rng(seed)
+    n_proteins = max(1000, size // 20)
+    n_groups = max(10, size // 3)
+    n_publications = max(100, size // 50)
+    proteins = make_proteins(n_proteins)
+    make_uniprot_fixtures(fixture_folder, proteins)
+    make_registry(fixture_folder)
+    with open(os.path.join(fixture_folder, 'ols.json'), 'w') as ols:
+        json.dump(make_ols_terms(), ols)
+    n_biogrid = int(size * biogrid_share)
+    for start in range(0, n_biogrid, block_size):
+        df = make_biogrid_frame(rng, start, min(block_size, n_biogrid - start), proteins, n_groups, n_publications)
+        for page_start in range(0, df.shape[0], biogrid_page_size):
+            page_file = os.path.join(fixture_folder, 'biogrid', str(start + page_start) + '.json')
+            df.iloc[page_start:page_start + biogrid_page_size].to_json(page_file, orient='index')
+    counts = {'BioGrid': n_biogrid}
+    for number, service in enumerate(psicquic_services):
+        n_service = (size - n_biogrid) // len(psicquic_services) + (number < (size - n_biogrid) % len(psicquic_services))
+        for start in range(0, n_service, block_size):
+            df = make_psicquic_frame(rng, service, start, min(block_size, n_service - start), proteins, n_groups,
+                                     n_publications)
+            for mitab, columns in (('tab27', 42), ('tab25', 15)):
+                df.iloc[:, :columns].to_csv(os.path.join(fixture_folder, service + '.' + mitab), sep='\t',
+                                            header=False, index=False, mode='a')
+        counts[service] = n_service
+    with open(os.path.join(fixture_folder, 'manifest.json'), 'w') as manifest:
+        json.dump({'size': size, 'seed': seed, 'counts': counts, 'proteins': n_proteins,
+                   'uniprot_release': uniprot_release}, manifest)
+    return fixture_folder
+
+
+class ReplayAdapter(BaseAdapter):
+    # answers the requests of the pipeline with the recordings of a fixture folder, instead of going to the network
+
+    def __init__(self, fixture_folder):
+        super().__init__()
+        self.fixture_folder = fixture_folder
+        with open(os.path.join(fixture_folder, 'manifest.json')) as manifest:
+            self.manifest = json.load(manifest)
+        with open(os.path.join(fixture_folder, 'ols.json')) as ols:
+            self.ols = json.load(ols)
+        with open(os.path.join(fixture_folder, 'uniprot_search.jsonl'), 'rb') as search_file:
+            self.uniprot_pages = search_file.readlines()
+        self.line_offsets = {}
+
+    def get_line_offsets(self, mitab_file):
+        # the position of the start of each line of a MITAB recording (and of the end of the file), to serve the pages
+        if mitab_file not in self.line_offsets:
+            offsets = [np.zeros(1, dtype=np.int64)]
+            position = 0
+            with open(mitab_file, 'rb') as mitab:
+                while True:
+                    block = mitab.read(1 << 24)
+                    if not block:
+                        break
+                    offsets.append(np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == 10) + position + 1)
+                    position += len(block)
+            self.line_offsets[mitab_file] = np.concatenate(offsets)
+        return self.line_offsets[mitab_file]
+
+    def urlopen(self, url):
+        # replaces urlopen in psicquic_fetching.py, for the registry
+        return open(os.path.join(self.fixture_folder, 'registry.xml'), 'rb')
+
+    def biogrid(self, params):
+        if params.get('format') == 'count':
+            return {}, json.dumps(self.manifest['counts']['BioGrid']).encode()
+        with open(os.path.join(self.fixture_folder, 'biogrid', params.get('start', '0') + '.json'), 'rb') as page:
+            return {}, page.read()
+
+    def psicquic(self, path, params):
+        # the recordings answer the query of all the experimental evidences of taxid, like a service would: any other
+        # query, or paging parameters a service could not read (it would send the first page again), is refused
+        service = path.split('/')[1]
+        total = self.manifest['counts'][service]
+        paging = [params.get('firstResult', ''), params['maxResults']] if 'maxResults' in params else []
+        if unquote(path.split('/query/')[-1]) != 'species:' + taxid or not all(value.isdigit() for value in paging) \
+                or params.get('format') not in ['tab25', 'tab27', 'count']:
+            return 400, {}, b''
+        if params.get('format') == 'count':
+            return 200, {}, str(total).encode()
+        offsets = self.get_line_offsets(os.path.join(self.fixture_folder, service + '.' + params['format']))
+        first_result = min(int(params.get('firstResult', 0)), total)
+        last_result = min(first_result + int(params.get('maxResults', total)), total)
+        with open(os.path.join(self.fixture_folder, service + '.' + params['format']), 'rb') as mitab:
+            mitab.seek(offsets[first_result])
+            content = mitab.read(offsets[last_result] - offsets[first_result])
+        return 200, {'X-PSICQUIC-Count': str(total)}, content
+
+    def uniprot(self, url, path, params):
+        if path.endswith('/stream'):
+            with open(os.path.join(self.fixture_folder, 'uniprot_stream.tsv.gz'), 'rb') as stream:
+                return {}, stream.read()
+        headers = {'X-UniProt-Release': self.manifest['uniprot_release'],
+                   'x-total-results': str(self.manifest['proteins'])}
+        if params.get('size') == '1':  # asking for the release only
+            return headers, b'{"results": []}'
+        cursor = int(params.get('cursor', 0))
+        if cursor + 1 < len(self.uniprot_pages):
+            headers['Link'] = '<' + re.sub('&cursor=[0-9]+', '', url) + '&cursor=' + str(cursor + 1) + '>; rel="next"'
+        return headers, self.uniprot_pages[cursor]
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        url = urlparse(request.url)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        status_code = 200
+        if url.netloc == 'webservice.thebiogrid.org':
+            headers, content = self.biogrid(params)
+        elif url.netloc == 'replay.psicquic':
+            status_code, headers, content = self.psicquic(url.path, params)
+        elif url.netloc == 'rest.uniprot.org':
+            headers, content = self.uniprot(request.url, url.path, params)
+        elif url.netloc == 'www.ebi.ac.uk' and '/ols' in url.path:
+            kind = url.path.rstrip('/').split('/')[-1]
+            headers, content = {}, json.dumps({'_embedded': {'terms': self.ols[kind].get(params['id'], [])}}).encode()
+        else:
+            status_code, headers, content = 404, {}, b''
+        response = requests.Response()
+        response.status_code = status_code
+        response.headers = CaseInsensitiveDict(headers)
+        response._content = content
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def install_replay(fixture_folder):
+    # every requests session (and urlopen for the PSICQUIC registry) now goes to the recordings
+    import psicquic_fetching
+    adapter = ReplayAdapter(fixture_folder)
+    requests.Session.get_adapter = lambda session, url: adapter
+    psicquic_fetching.urlopen = adapter.urlopen
+    return adapter
+
+
+def get_commit():
+    # the commit the benchmark is run on (+dirty if there are uncommitted changes), None outside of a git repository
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=script_folder, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        changes = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=script_folder,
+                                 capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('+dirty' if changes else '')
+
+
+def copy_interactome(source_file, output_file, intermediate_format):
+    # copies the interactome file (or folder) and its dropped file
+    import interactome_io
+    if intermediate_format == 'parquet':
+        if os.path.isdir(interactome_io.get_parquet_folder(output_file)):
+            shutil.rmtree(interactome_io.get_parquet_folder(output_file))
+        shutil.copytree(interactome_io.get_parquet_folder(source_file), interactome_io.get_parquet_folder(output_file))
+    else:
+        shutil.copyfile(source_file, output_file)
+    shutil.copyfile(source_file.replace('interactome', 'dropped'), output_file.replace('interactome', 'dropped'))
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+# -----------------------------------------------------
+
+
+def benchmark(size, seed=0, repeat=1, intermediate_format='csv', chunk_size=None, partitions=None,
+              partition_max_workers=1, clean_while_fetching=False):
+    # times each step on the recordings of size experimental evidences (the best of repeat runs)
+    fixture_folder = make_fixtures(size, seed)
+    adapter = install_replay(fixture_folder)
+    if os.path.isdir(run_folder):
+        shutil.rmtree(run_folder)
+    os.makedirs(run_folder)
+    shutil.copy(os.path.join(script_folder, 'biogrid_mi_mapping.xlsx'), run_folder)
+    previous_folder = os.getcwd()
+    os.chdir(run_folder)
+    if script_folder not in sys.path:
+        sys.path.insert(0, script_folder)
+    import main
+    import biogrid_fetching
+    import taxid_fetching
+    import cleaning_data
+    import removing_redundancies
+    import run_report
+    parameters = dict(taxids=[taxid], query=None, max_result=None, biogrid_max_workers=4, format='tab27',
+                      molecular_interaction='protein-protein', psicquic_db_to_use='all', psicquic_max_workers=4,
+                      psicquic_page_size=50000, uniprot_use_stream=True, taxid_max_workers=1,
+                      clean_while_fetching=clean_while_fetching,
+                      mi_fetch_descendants=['MI:0063', 'MI:0362', 'MI:1088'],
+                      mi_to_exclude=['MI:0000', 'MI:0001', 'MI:0686', 'MI:0045'], mi_ontology_file=None,
+                      ols_cache_ttl_days=30, intermediate_format=intermediate_format, chunk_size=chunk_size,
+                      partitions=partitions, partition_max_workers=partition_max_workers, keep_raw=False,
+                      incremental=False, export_sqlite=True, export_graph=True)
+    try:
+        # the interactome as fetched, cleaned again at each run
+        output_file = main.file_handler(parameters['taxids'], None, None, 'tab27', intermediate_format)
+        fetching_time, geneid_map_file = timed(taxid_fetching.fetching, output_file, parameters['taxids'], True, 'all',
+                                               None, None, 'tab27', 'protein-protein', 4, 4, 50000, True,
+                                               intermediate_format, 1)
+        fetched_file = 'fetched_' + output_file
+        copy_interactome(output_file, fetched_file, intermediate_format)
+        base_url, params = biogrid_fetching.get_params(taxid, None, None, 'protein-protein')
+        params['format'] = 'json'
+        n_biogrid = adapter.manifest['counts']['BioGrid']
+        pages = [biogrid_fetching.make_call(base_url, params, n_biogrid, start)
+                 for start in range(0, n_biogrid, biogrid_page_size)]
+        dataset = pd.concat(pages, ignore_index=True)
+        dataset = dataset.loc[~dataset['ENTREZ_GENE_A'].str.match('-') & ~dataset['ENTREZ_GENE_B'].str.match('-')]
+        timings = {'fetching': [fetching_time], 'biogrid_to_tab27': [], 'cleaning': [], 'removing': [],
+                   'pipeline': []}
+        for run in range(repeat):
+            print('Benchmark run ' + str(run + 1) + '/' + str(repeat) + ' for ' + str(size) + ' experimental evidences')
+            timings['biogrid_to_tab27'].append(timed(biogrid_fetching.biogrid_to_tab27, dataset.copy())[0])
+            copy_interactome(fetched_file, output_file, intermediate_format)
+            if os.path.exists(ols_cache_file):  # the geneid map of the fetching is kept, but not the OLS answers
+                os.remove(ols_cache_file)
+            cleaning_time, mi_ancestors = timed(cleaning_data.cleaning, output_file, 'tab27', 'protein-protein',
+                                                geneid_map_file, list(parameters['mi_fetch_descendants']),
+                                                list(parameters['mi_to_exclude']), False, None, 30,
+                                                intermediate_format, chunk_size)
+            timings['cleaning'].append(cleaning_time)
+            timings['removing'].append(timed(removing_redundancies.removing, output_file, mi_ancestors,
+                                             intermediate_format, partitions, partition_max_workers,
+                                             chunk_size or 500000)[0])
+            shutil.rmtree('cache', ignore_errors=True)
+            start = time.perf_counter()
+            main.pipeline(**{name: list(value) if isinstance(value, list) else value  # the lists are modified
+                             for name, value in parameters.items()})
+            timings['pipeline'].append(time.perf_counter() - start)
+        result = {'commit': get_commit(), 'date': datetime.datetime.now().strftime("%d/%m/%Y, %H:%M:%S"),
+                  'size': size, 'seed': seed, 'repeat': repeat, 'intermediate_format': intermediate_format,
+                  'chunk_size': chunk_size, 'partitions': partitions, 'partition_max_workers': partition_max_workers,
+                  'clean_while_fetching': clean_while_fetching, 'python': platform.python_version(),
+                  'pandas': pd.__version__, 'numpy': np.__version__, 'platform': platform.platform(),
+                  'timings_s': {step: round(min(times), 3) for step, times in timings.items()},
+                  'pipeline_stages': run_report.report['stages'], 'peak_rss_mb': run_report.get_peak_rss()}
+    finally:
+        os.chdir(previous_folder)
+    os.makedirs(os.path.dirname(results_file), exist_ok=True)
+    with open(results_file, 'a') as results:
+        results.write(json.dumps(result) + '\n')
+    print('Timings (s) for ' + str(size) + ' experimental evidences: ' + json.dumps(result['timings_s']))
+    return result
+
+
+def compare(size):
+    # the stored results of a size, oldest first, one line per benchmark run
+    if not os.path.exists(results_file):
+        print('No results yet in ' + results_file)
+        return
+    results = pd.read_json(results_file, lines=True, convert_dates=False)
+    results = results.loc[results['size'] == size]
+    if results.shape[0] == 0:
+        print('No results for ' + str(size) + ' experimental evidences in ' + results_file)
+        return
+    timings = pd.DataFrame(results['timings_s'].tolist(), index=results.index)
+    table = pd.concat([results[['commit', 'date', 'intermediate_format', 'chunk_size', 'partitions']], timings], axis=1)
+    print(table.to_string(index=False))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Offline benchmark of the pipeline, on recorded API answers')
+    parser.add_argument('sizes', nargs='*', type=int, default=[10000],
+                        help='numbers of experimental evidences to benchmark (from 10000 to 10000000)')
+    parser.add_argument('--repeat', type=int, default=1, help='runs of each step, the best one is kept')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic recordings')
+    parser.add_argument('--intermediate-format', default='csv', choices=['csv', 'parquet'])
+    parser.add_argument('--chunk-size', type=int, default=None)
+    parser.add_argument('--partitions', type=int, default=None)
+    parser.add_argument('--partition-max-workers', type=int, default=1)
+    parser.add_argument('--clean-while-fetching', action='store_true', help='for the whole pipeline only')
+    parser.add_argument('--compare', type=int, metavar='SIZE', help='print the stored results of a size and exit')
+    args = parser.parse_args()
+    if args.compare:
+        compare(args.compare)
+    else:
+        for size in args.sizes:
+            benchmark(size, args.seed, args.repeat, args.intermediate_format, args.chunk_size, args.partitions,
+                      args.partition_max_workers, args.clean_while_fetching)
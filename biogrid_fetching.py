@@ -5,50 +5,95 @@
 # You need to fetch your own BioGRID API key at https://webservice.thebiogrid.org/, and modify line 84 
 # (params['accesskey']) of the biogrid_fetching.py script with that key!
 
+import os
 import requests
+from requests.adapters import HTTPAdapter, Retry
+from concurrent.futures import ThreadPoolExecutor
 import json
+from urllib.parse import urlencode
 import pandas as pd
-import openpyxl
+import interactome_io
+import run_report
+import fetch_checkpoints
+import stream_cleaning
 
+# the BioGRID requests are retried here only (not with fetch_checkpoints.with_retries), 429 included
+retries = Retry(total=5, backoff_factor=0.25, status_forcelist=[429, 500, 502, 503, 504])
+session = requests.Session()
+session.mount("https://", HTTPAdapter(max_retries=retries))
+session.hooks['response'].append(run_report.response_hook('BioGrid'))  # requests, retries and bytes in the run report
+mapping_file = 'biogrid_mi_mapping.xlsx'
+mapping_cache_file = os.path.join('cache', 'biogrid_mi_mapping.pkl')
+evidence_mapping = None  # the mapping file, loaded once (see load_evidence_mapping)
+genes_per_request = 100  # genes of a list query packed in the geneList of a single request
+# the columns kept from the BioGRID json
+columns = ['ENTREZ_GENE_A', 'ENTREZ_GENE_B', 'OFFICIAL_SYMBOL_A', 'OFFICIAL_SYMBOL_B', 'EXPERIMENTAL_SYSTEM',
+           'PUBMED_AUTHOR', 'PUBMED_ID', 'ORGANISM_A', 'ORGANISM_B', 'THROUGHPUT', 'SOURCEDB', 'INTERACTION_ID',
+           'QUANTITATION']
 
-def make_call(base_url, params, total, start=0, max=10000):
-    # Maximum number of results is limited to 10k. Paginate to retrieve everything
-    print('Processing BioGrid data: ' + str(params['start']) + '/' + str(total))
-    r = requests.get(base_url, params=params)
-    interactions = r.json()
-    # Create a hash of results by interaction identifier
-    data = {}
-    for interaction_id, interaction in interactions.items():
-        data[interaction_id] = interaction
-        # Add the interaction ID to the interaction record, so we can reference it easier
-        data[interaction_id]['INTERACTION_ID'] = interaction_id
-    df = pd.DataFrame.from_dict(data, orient='index')
-    df.reset_index(drop=True, inplace=True)  # it takes the wrong index otherwise
-    columns = [
-        'ENTREZ_GENE_A',
-        'ENTREZ_GENE_B',
-        'OFFICIAL_SYMBOL_A',
-        'OFFICIAL_SYMBOL_B',
-        'EXPERIMENTAL_SYSTEM',
-        'PUBMED_AUTHOR',
-        'PUBMED_ID',
-        'ORGANISM_A',
-        'ORGANISM_B',
-        'THROUGHPUT',
-        'SOURCEDB',
-        'INTERACTION_ID',
-        'QUANTITATION',
-    ]
-    df = df[columns]
+
+def get_page_url(base_url, params):
+    # the url of a page, without the access key, to recognize it in the checkpoints (see fetch_checkpoints.py)
+    return base_url + urlencode({key: value for key, value in params.items() if key != 'accesskey'})
+
+
+def download_page(base_url, params):
+    r = session.get(base_url, params=params)
+    r.raise_for_status()
+    return r.json()
+
+
+def read_interactions(interactions):
+    # the json of a BioGRID page ({interaction id: interaction}) straight into a frame of the columns we keep, the
+    # interaction id as INTERACTION_ID
+    if not interactions:
+        return pd.DataFrame(columns=columns)
+    df = pd.DataFrame.from_records(list(interactions.values()), columns=columns)
+    df['INTERACTION_ID'] = list(interactions.keys())
     return df
 
 
+def make_call(base_url, params, total, start=0, max=10000, output_file=None):
+    # Maximum number of results is limited to 10k. Paginate to retrieve everything. With output_file, the page is
+    # kept in the checkpoints of that file until everything is fetched
+    params = dict(params, start=start)  # each page has its own copy, as the pages are fetched at the same time
+    print('Processing BioGrid data: ' + str(params['start']) + '/' + str(total))
+    if output_file is None:
+        return read_interactions(download_page(base_url, params))
+    return fetch_checkpoints.fetch_page(output_file, 'BioGrid', get_page_url(base_url, params),
+                                        lambda: read_interactions(download_page(base_url, params)), retried=False)
+
+
+def load_evidence_mapping():
+    # the mapping file is read once per process, from its pickle copy in the cache (reading the xlsx with openpyxl is
+    # slow), which is made again when the xlsx file is modified
+    global evidence_mapping
+    if evidence_mapping is None:
+        if os.path.exists(mapping_cache_file) \
+                and os.path.getmtime(mapping_cache_file) >= os.path.getmtime(mapping_file):
+            evidence_mapping = pd.read_pickle(mapping_cache_file)
+        else:
+            evidence_mapping = pd.read_excel(mapping_file, index_col='BIOGRID_evidence_code')
+            os.makedirs('cache', exist_ok=True)
+            # written next to the cache file and then renamed, as several taxids can be fetched at the same time
+            evidence_mapping.to_pickle(mapping_cache_file + '.' + str(os.getpid()))
+            os.replace(mapping_cache_file + '.' + str(os.getpid()), mapping_cache_file)
+    return evidence_mapping
+
+
+def add_prefix(col, prefix):
+    # prefix + value for the whole column at once, the missing values ('-') stay as they are. Done once per distinct
+    # value (the same organisms, pubmed ids and genes appear in many interactions)
+    codes, uniques = pd.factorize(col, use_na_sentinel=False)
+    values = pd.Series(uniques, dtype=object).astype(str)
+    return pd.Series(values.where(values == '-', prefix + values).to_numpy()[codes], index=col.index)
+
+
 def biogrid_to_tab27(df_biogrid):
     # convert BioGRID format to tab27 format, with the mapping file (biogrid_mi_mapping.xlsx)
     source_databases = 'psi-mi:"MI:0463"(biogrid)'
     service_name = 'BioGrid'
-    df_mapping = pd.read_excel('biogrid_mi_mapping.xlsx', index_col='BIOGRID_evidence_code')
-    df_mapping.dropna(how='all')  # otherwise we get useless empty rows at the end
+    df_mapping = load_evidence_mapping()
     df_biogrid = df_biogrid.merge(df_mapping, left_on='EXPERIMENTAL_SYSTEM', right_on='BIOGRID_evidence_code',
                                   how='left')
     df_biogrid.insert(len(df_biogrid.columns), "service_name", service_name, True)
@@ -61,77 +106,140 @@ def biogrid_to_tab27(df_biogrid):
                    'BIOGRID_type', 'THROUGHPUT']
     df_biogrid = df_biogrid[col_ordered]
     # formatting the data to comply with the other DB
-    df_biogrid['ENTREZ_GENE_A'] = df_biogrid['ENTREZ_GENE_A'].apply(
-        lambda x: f"entrez gene/locuslink:{x}" if x != '-' else x)
-    df_biogrid['ENTREZ_GENE_B'] = df_biogrid['ENTREZ_GENE_B'].apply(
-        lambda x: f"entrez gene/locuslink:{x}" if x != '-' else x)
-    df_biogrid['PUBMED_ID'] = df_biogrid['PUBMED_ID'].apply(lambda x: f"pubmed:{x}" if x != '-' else x)
-    df_biogrid['ORGANISM_A'] = df_biogrid['ORGANISM_A'].apply(lambda x: f"taxid:{x}" if x != '-' else x)
-    df_biogrid['ORGANISM_B'] = df_biogrid['ORGANISM_B'].apply(lambda x: f"taxid:{x}" if x != '-' else x)
-    df_biogrid['taxid_host'] = df_biogrid['taxid_host'].apply(lambda x: f"taxid:{x}" if x != '-' else x)
-    df_biogrid['INTERACTION_ID'] = df_biogrid['INTERACTION_ID'].apply(lambda x: f"biogrid:{x}" if x != '-' else x)
-    df_biogrid['QUANTITATION'] = df_biogrid['QUANTITATION'].apply(lambda x: f"score:{x}" if x != '-' else x)
+    df_biogrid['ENTREZ_GENE_A'] = add_prefix(df_biogrid['ENTREZ_GENE_A'], 'entrez gene/locuslink:')
+    df_biogrid['ENTREZ_GENE_B'] = add_prefix(df_biogrid['ENTREZ_GENE_B'], 'entrez gene/locuslink:')
+    df_biogrid['PUBMED_ID'] = add_prefix(df_biogrid['PUBMED_ID'], 'pubmed:')
+    df_biogrid['ORGANISM_A'] = add_prefix(df_biogrid['ORGANISM_A'], 'taxid:')
+    df_biogrid['ORGANISM_B'] = add_prefix(df_biogrid['ORGANISM_B'], 'taxid:')
+    df_biogrid['taxid_host'] = add_prefix(df_biogrid['taxid_host'], 'taxid:')
+    df_biogrid['INTERACTION_ID'] = add_prefix(df_biogrid['INTERACTION_ID'], 'biogrid:')
+    df_biogrid['QUANTITATION'] = add_prefix(df_biogrid['QUANTITATION'], 'score:')
     return df_biogrid
 
+
+def get_gene_lists(query):
+    # the query (a gene name, or a list of gene names, systematic names or uniprot accessions) split in as few
+    # geneLists as possible, genes_per_request genes each. [None] without query
+    if query is None:
+        return [None]
+    genes = list(dict.fromkeys([query] if isinstance(query, str) else query))  # without duplicates, in their order
+    return [genes[i:i + genes_per_request] for i in range(0, len(genes), genes_per_request)]
+
+
+def is_panel(query):
+    # a panel is a list of genes (even of 1 gene), that can also hold systematic names or uniprot accessions
+    return query is not None and not isinstance(query, str)
+
+
+def get_params(species, gene_list, max_result, molecular_interaction, panel=False):
+    # url and parameters of the BioGRID query (gene_list: one of get_gene_lists), asking for the count of interactions
+    # (see 'format'). panel: if the query is a panel (see is_panel)
+    offset = 0
+    if not max_result:
+        max_result = 10000
+    # Parameters outlined in the Wiki: https://wiki.thebiogrid.org/doku.php/biogridrest
+    params = {
+        'accesskey': 'yourBiogridAPIkeyHere',  # fetch your BioGRID API key at https://webservice.thebiogrid.org/
+        'format': 'count',  # for the first run, to know when to stop
+        'taxId': species,
+        'start': offset,
+        'max': max_result,
+        'paginate': 'true',
+    }
+    if params["accesskey"] == 'yourBiogridAPIkey':
+        print("You first need to fetch your own BioGRID API key at https://webservice.thebiogrid.org/, and modify line 84 (params['accesskey']) of the biogrid_fetching.py script with that key!")
+    if species == '*':  # BioGRID API force us to remove the species param if we require all species
+        del params["taxId"]
+    base_url = 'https://webservice.thebiogrid.org/interactions/?'
+    if gene_list:
+        params['geneList'] = '|'.join(gene_list)  # Must be | separated
+        params['searchNames'] = 'true'  # Search against official names
+        # the systematic names and uniprot accessions of a panel are searched too (a single gene is searched as in
+        # the v1.0). additionalIdentifierTypes is only used with searchIds:
+        if panel:
+            params['searchIds'] = 'true'  # Search against systematic names and entrez gene ids
+            params['additionalIdentifierTypes'] = 'SWISS-PROT|TREMBL|UNIPROT-ACCESSION'
+        # true to get any interaction involving EITHER gene, false: interactions between genes:
+        params['includeInteractors'] = 'true'
+        # true to get interactions between the gene_list’s first order interactors:
+        params['includeInteractorInteractions'] = 'false'
+    if molecular_interaction == 'protein-protein':  # else: we fetch ALL interactions (nucleic acid-prot interactions etc): not tested
+        # evidence list to exclude if only protein-protein interactions are desired (to pick from the biogrid_mi_mapping.xlsx)
+        evidence_list = ['Affinity Capture-RNA', 'Protein-RNA', 'Dosage Growth Defect', 'Dosage Lethality',
+                         'Dosage Rescue', 'Synthetic Growth Defect', 'Synthetic Haploinsufficiency',
+                         'Synthetic Lethality', 'Synthetic Rescue', 'Phenotypic Enhancement', 'Phenotypic Suppression',
+                         'Positive Genetic', 'Negative Genetic']
+        params['evidenceList'] = '|'.join(evidence_list)
+        # false -> 'evidence_list' is evidence to exclude, if true -> is evidence to show
+        params['includeEvidence'] = 'false'
+    return base_url, params
+
+
+def count(species, query, max_result, molecular_interaction):
+    # number of interactions BioGRID has for this query (used as a fingerprint by the incremental mode), added up over
+    # the geneLists of a list query
+    total = 0
+    for gene_list in get_gene_lists(query):
+        base_url, params = get_params(species, gene_list, max_result, molecular_interaction, is_panel(query))
+        total += download_page(base_url, params)
+    return total
+
+
+def fetch_gene_list(species, gene_list, max_result, molecular_interaction, max_workers, output_file, panel=False):
+    # all the interactions of a geneList (or of the whole species without query)
+    base_url, params = get_params(species, gene_list, max_result, molecular_interaction, panel)
+    offset = params['start']
+    max_result = params['max']
+    total = download_page(base_url, params)
+    params['format'] = 'json'  # Return results in json format instead of count
+    if total > 10000:
+        # all the offsets are known from the count, so the pages are fetched at the same time (max_workers at
+        # most) and concatenated once at the end
+        offsets = range(offset, total, max_result)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pages = list(executor.map(lambda start: make_call(base_url, params, total, start, max_result,
+                                                              output_file), offsets))
+        dataset = pd.concat(pages, ignore_index=True)
+        print('Finished downloading ' + str(dataset.shape[0]) + ' interactions from BioGRID')
+        return dataset
+    return make_call(base_url, params, total, offset, max_result, output_file)
+
 # -----------------------------------------------------
 
 
-def fetching(output_file, species, query, max_result, molecular_interaction):
+def fetching(output_file, species, query, max_result, molecular_interaction, max_workers=1, intermediate_format='csv'):
     try:
-        offset = 0
-        if not max_result:
-            max_result = 10000
-        # Parameters outlined in the Wiki: https://wiki.thebiogrid.org/doku.php/biogridrest
-        params = {
-            'accesskey': 'yourBiogridAPIkeyHere',  # fetch your BioGRID API key at https://webservice.thebiogrid.org/
-            'format': 'count',  # for the first run, to know when to stop
-            'taxId': species,
-            'start': offset,
-            'max': max_result,
-            'paginate': 'true',
-        }
-        if params["accesskey"] == 'yourBiogridAPIkey':
-            print("You first need to fetch your own BioGRID API key at https://webservice.thebiogrid.org/, and modify line 84 (params['accesskey']) of the biogrid_fetching.py script with that key!")
-        if species == '*':  # BioGRID API force us to remove the species param if we require all species
-            del params["taxId"]
-        base_url = 'https://webservice.thebiogrid.org/interactions/?'
-        if query:
-            # ['PMT2', 'NMD4'] For the v3.0, how to implement list of gene for query from main.py, we can do it like that
-            params['geneList'] = '|'.join([query])  # Must be | separated
-            params['searchNames'] = 'true'  # Search against official names
-            # true to get any interaction involving EITHER gene, false: interactions between genes:
-            params['includeInteractors'] = 'true'
-            # true to get interactions between the gene_list’s first order interactors:
-            params['includeInteractorInteractions'] = 'false'
-        if molecular_interaction == 'protein-protein':  # else: we fetch ALL interactions (nucleic acid-prot interactions etc): not tested
-            # evidence list to exclude if only protein-protein interactions are desired (to pick from the biogrid_mi_mapping.xlsx)
-            evidence_list = ['Affinity Capture-RNA', 'Protein-RNA', 'Dosage Growth Defect', 'Dosage Lethality',
-                             'Dosage Rescue', 'Synthetic Growth Defect', 'Synthetic Haploinsufficiency',
-                             'Synthetic Lethality', 'Synthetic Rescue', 'Phenotypic Enhancement', 'Phenotypic Suppression',
-                             'Positive Genetic', 'Negative Genetic']
-            params['evidenceList'] = '|'.join(evidence_list)
-            # false -> 'evidence_list' is evidence to exclude, if true -> is evidence to show
-            params['includeEvidence'] = 'false'
-        dataset = pd.DataFrame()
-        total = requests.get(base_url, params=params).json()
-        params['format'] = 'json'  # Return results in json format instead of count
-        if total > 10000:
-            for _ in range((total // params['max'])+1):
-                df = make_call(base_url, params, total, offset, max_result)
-                params['start'] = params['start'] + max_result
-                dataset = pd.concat([dataset, df])
-            print('Finished downloading ' + str(dataset.shape[0]) + ' interactions from BioGRID')
+        # a connection pool as big as the number of pages fetched at the same time
+        session.mount("https://", HTTPAdapter(max_retries=retries, pool_maxsize=max_workers))
+        gene_lists = get_gene_lists(query)
+        if len(gene_lists) == 1:
+            dataset = fetch_gene_list(species, gene_lists[0], max_result, molecular_interaction, max_workers,
+                                      output_file, is_panel(query))
         else:
-            dataset = make_call(base_url, params, total, offset, max_result)
+            print('Fetching the ' + str(sum(map(len, gene_lists))) + ' genes of the query in ' + str(len(gene_lists))
+                  + ' geneLists')
+            dataset = pd.concat([fetch_gene_list(species, gene_list, max_result, molecular_interaction, max_workers,
+                                                 output_file, True) for gene_list in gene_lists], ignore_index=True)
+            # an interaction between genes of 2 different geneLists is in both
+            dataset = dataset.drop_duplicates('INTERACTION_ID', ignore_index=True)
         dropped_prot = dataset.loc[(dataset['ENTREZ_GENE_A'].str.match('-')) | (dataset['ENTREZ_GENE_B'].str.match('-'))]
-        header = 'Number of dropped interactions that do not have (a) protein(s) name(s): ' + str(dropped_prot.shape[0])
-        print(header)
+        print('Number of dropped interactions that do not have (a) protein(s) name(s): ' + str(dropped_prot.shape[0]))
         dropped_filename = output_file.replace('interactome', 'dropped')
-        pd.Series([header]).to_csv(dropped_filename, mode='a', index=False, header=False)
-        dropped_prot.to_csv(dropped_filename, mode='a', index=False, header=False)
+        # written like the rows dropped by the cleaning (see cleaning_data.apply_rules): in tab27, with their reason
+        dropped_rows = biogrid_to_tab27(dropped_prot)
+        dropped_rows.columns = interactome_io.tab27_headers
+        dropped_rows = dropped_rows.assign(reason='no protein name')
+
+        def write_dropped():
+            dropped_rows.to_csv(dropped_filename, mode='a', index=False, header=False)
+        stream_cleaning.run_in_order(output_file, write_dropped)  # after the rows dropped by a cleaning in progress
         dataset = dataset.loc[~(dataset['ENTREZ_GENE_A'].str.match('-')) & ~(dataset['ENTREZ_GENE_B'].str.match('-'))]
         dataset = biogrid_to_tab27(dataset)
         print('Final number of interactions kept from BioGRID: ' + str(dataset.shape[0]))
-        dataset.to_csv(output_file, mode='a', index=False, header=False)
+        run_report.record('fetch_biogrid', rows_in=dataset.shape[0] + dropped_prot.shape[0], rows_out=dataset.shape[0])
+        run_report.record_dropped('fetch_biogrid', 'no protein name', dropped_prot.shape[0])
+        run_report.record_source('BioGrid', rows=dataset.shape[0])
+        dataset.columns = interactome_io.tab27_headers
+        stream_cleaning.write(output_file, dataset, intermediate_format)
     except TypeError:
         print('No data from BioGrid with this query.')
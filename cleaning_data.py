@@ -9,31 +9,28 @@
 # - replacing the geneID ids from the bioGRID service to uniprotkb ids,
 # - cleaning the protein names if it is an Uniprot, (this removes the "uniprotkb:" prefix to keep only PXXXXX)
 # - if the gene name is unclear/absent, we try to fetch the gene name from the geneID (this is done with the Uniprot
-# API, the call is made from the uniprotkb_mapping.py script, which uses the Uniprot API to generate a dictionary),
+# API, the call is made from the uniprotkb_mapping.py script, which uses the Uniprot API to generate the geneid map),
 # - cleaning the gene names (similar what is done above for the protein names),
 # - reordering columns if prot1 &gt; prot2. After this step prot1 &lt;= prot2 for all rows. This is
 # necessary to check the redundancies between rows,
 # - retrieving a list of the IDM MIs from the main file,
-# - getting the ancestors of those IDM and if they are obsolete from the OLS API (see https://www.ebi.ac.uk/ols4),
+# - getting the ancestors of those IDM and if they are obsolete from the OLS API (see https://www.ebi.ac.uk/ols4), or
+# from a local copy of the ontology (both done in mi_ontology.py),
 # - and finally removing obsolete IDMs (in iRefIndex, some experimental evidences are annotated with 2 IDMs,
 # one which is up to date and one which is obsolete). This step is kept in the code in case a similar problem occurs
 # with other databases).
 
+import numpy as np
 import pandas as pd
 import re
 import datetime
-import requests
+import mi_ontology
+import uniprotkb_mapping
+import interactome_io
+import run_report
 
-# We need both "has" and "no" to handle the "one column true but the other one is false"
-# For geneid_to_uniprotkb_prot:
-has_uniprotkb_equivalencies = []
-no_uniprotkb_equivalencies = []
-# For clean_uniprotkb_name:
-regex_uniprotkb = '([OPQ][0-9][A-Z0-9]|[A-NR-Z][0-9][A-Z])[A-Z0-9][A-Z0-9][0-9]([A-Z][A-Z0-9][A-Z0-9][0-9])?'
-has_clear_uniprotkb_id = []
-no_clear_uniprotkb_id = []
-# For get_gene_name:
-no_gene_name = []
+# a uniprotkb accession, to recognize the clear uniprotkb ids:
+regex_uniprotkb = re.compile('(?:[OPQ][0-9][A-Z0-9]|[A-NR-Z][0-9][A-Z])[A-Z0-9][A-Z0-9][0-9](?:[A-Z][A-Z0-9][A-Z0-9][0-9])?')
 
 
 def clean_pub_id(row):
@@ -64,141 +61,135 @@ def clean_idm(row, mi_obsolete):
     return value
 
 
-def to_remove_contains(dropped_filename, string, col, df, text):
-    # a series of 4 generic function, could be aggregated later to avoid unnecessary repetitions in the code
-    dropped_prot = df.loc[df[col].str.contains(string)]
-    header = 'Number of dropped experimental evidences ' + text + str(dropped_prot.shape[0])
-    print(header)
-    pd.Series([header]).to_csv(dropped_filename, mode='a', index=False, header=False)
-    dropped_prot.to_csv(dropped_filename, mode='a', header=False, index=False)
-    df = df.loc[~(df[col].str.contains(string))]
-    return df
-
-
-def to_keep_contains(dropped_filename, string, col1, col2, df, text):
-    # a series of 4 generic function, could be aggregated later to avoid unnecessary repetitions in the code
-    dropped_prot = df.loc[
-        ~(df[col1].str.contains(string)) |
-        ~(df[col2].str.contains(string))]
-    header = 'Number of dropped experimental evidences ' + text + str(dropped_prot.shape[0])
-    print(header)
-    pd.Series([header]).to_csv(dropped_filename, mode='a', index=False, header=False)
-    dropped_prot.to_csv(dropped_filename, mode='a', header=False, index=False)
-    df = df.loc[
-        (df[col1].str.contains(string)) &
-        (df[col2].str.contains(string))]
-    return df
-
-
-def col_remove_empty_data(dropped_filename, col, df, text):
-    # a series of 4 generic functions, could be aggregated later to avoid unnecessary repetitions in the code
-    dropped_prot = df.loc[(df[col].str.match('-'))]
-    header = 'Number of dropped experimental evidences ' + text + str(dropped_prot.shape[0])
-    print(header)
-    pd.Series([header]).to_csv(dropped_filename, mode='a', index=False, header=False)
-    dropped_prot.to_csv(dropped_filename, mode='a', header=False, index=False)
-    df = df.loc[~(df[col].str.match('-'))]
-    return df
-
-
-def to_remove_list(dropped_filename, list, df, text):
-    # a series of 4 generic functions, could be aggregated later to avoid unnecessary repetitions in the code
-    header = 'Number of dropped experimental evidences ' + text + str(len(list))
-    print(header)
-    pd.Series([header]).to_csv(dropped_filename, mode='a', index=False, header=False)
-    if len(list) != 0:
-        dropped_prot = df.loc[df.index.isin(list)]
-        dropped_prot.to_csv(dropped_filename, mode='a', header=False, index=False)
-        df = df.loc[~df.index.isin(list)]
-    return df
-
-
-def get_psicquic_query_descendants(mi_fetch_descendants, mi_to_exclude):
-    # We get the IDM's MIs of all the ancestors, but only of the IDM's MIs we have in our file, to avoid excess calculs
+def contains_both(string, col1, col2, df):
+    # True for the rows where both columns contain string (a regex)
+    return df[col1].str.contains(string, na=False) & df[col2].str.contains(string, na=False)
+
+
+def is_empty(col, df):
+    # True for the rows where the column has no data ('-')
+    return df[col].str.match('-', na=True)
+
+
+def has_mi_to_exclude(col, mi_to_exclude):
+    # True for the rows where one of the MIs of the column is in the set mi_to_exclude (done once per distinct value)
+    return on_distinct(col, lambda values: values.str.findall(regex_mi).apply(
+        lambda mis: not mi_to_exclude.isdisjoint(mis)))
+
+
+def apply_rules(dropped_filename, rules, df):
+    # rules is the ordered list of the filters of the cleaning: (reason, text, mask), the mask being True for the rows
+    # that fail the filter. Each row is tagged with the reason of the first filter it fails, and all the dropped rows
+    # are appended at once to the dropped file, as fetched, with their reason. Returns the mask of the kept rows
+    reasons = pd.Series(np.select([mask.to_numpy(dtype=bool) for reason, text, mask in rules],
+                                  [reason for reason, text, mask in rules], default=''), index=df.index)
+    for reason, text, mask in rules:
+        print('Number of dropped experimental evidences ' + text + str((reasons == reason).sum()))
+        run_report.record_dropped('cleaning', reason, (reasons == reason).sum())
+    dropped = reasons != ''
+    df.loc[dropped].assign(reason=reasons.loc[dropped]).to_csv(dropped_filename, mode='a', header=False, index=False)
+    return ~dropped
+
+
+def get_psicquic_query_descendants(mi_fetch_descendants, mi_to_exclude, mi_ontology_file=None, ols_cache_ttl_days=30):
+    # We get the IDM's MIs of all the descendants of the IDMs to exclude (from the local ontology or the OLS API cache)
+    cache = mi_ontology.load_ols_cache()
     for mi in mi_fetch_descendants:
-        api_url = 'https://www.ebi.ac.uk/ols/api/ontologies/mi/descendants?id=' + mi + '&size=500'
-        response = requests.get(api_url)
-        mi_infos = response.json()['_embedded']['terms']
         mi_to_exclude.append(mi)
-        for mi_info in mi_infos:
-            mi_to_exclude.append(mi_info['annotation']['id'][0])
+        mi_to_exclude.extend(mi_ontology.get_descendants(mi, cache, mi_ontology_file, ols_cache_ttl_days))
+    if not mi_ontology_file:
+        mi_ontology.save_ols_cache(cache)
     return mi_to_exclude
 
 
-def get_prot_name(row, geneid_dict, total):
-    # main cleaning step for the protein columns (0 and 1)
-    for prot_num in [0, 1]:
-        value = row[prot_num]
+def last_tagged_field(tag, stop='(:|'):
+    # regex extracting, from the last '|' separated field containing tag, the part after its first ':' (up to the
+    # first character of stop). The greedy start makes the last tagged field win, as in the v1.0
+    return re.compile(r'^(?:.*\|)?(?=[^|]*' + re.escape(tag) + r')[^|:]*:([^' + re.escape(stop) + r']*)')
+
+
+regex_mi = re.compile(r'"(MI:[0-9]+)"')  # the MIs of an idm field (psi-mi:"MI:0018"(two hybrid))
+# the 4 identifier tokens, compiled once:
+regex_entrez = re.compile(r'^[^:]*:([^:]*)')  # the geneid of 'entrez gene/locuslink:[geneid]'
+regex_uniprotkb_field = last_tagged_field('uniprotkb')
+regex_gene_name_field = last_tagged_field('(gene name)')
+regex_hgnc_field = last_tagged_field('hgnc:', stop=':|')
+
+
+def on_distinct(col, function):
+    # applies function (Series -> Series) only once per distinct value of col: a protein or a gene appears in many
+    # experimental evidences, so there are far less distinct values than rows
+    codes, uniques = pd.factorize(col, use_na_sentinel=False)
+    return pd.Series(function(pd.Series(uniques, dtype=object)).to_numpy()[codes], index=col.index)
+
+
+def extract_token(col, regex):
+    # the token extracted by regex, or the value itself if there is no such token
+    return on_distinct(col, lambda values: values.str.extract(regex, expand=False).fillna(values))
+
+
+def get_prot_name(df, geneid_map_file):
+    # main cleaning step for the protein columns (prot1 and prot2), done column by column instead of row by row.
+    # Returns the cleaned columns and 2 boolean masks of the rows to ditch (True = the row is dropped)
+    no_uniprotkb_equivalencies = pd.Series(False, index=df.index)
+    no_clear_uniprotkb_id = pd.Series(False, index=df.index)
+    prot_names = pd.DataFrame(index=df.index)
+    for col in ['prot1', 'prot2']:
+        value = df[col].copy()
         # cleaning the proteins' name if it is an entrez gene/locuslink: ------------------------------------------
-        if 'entrez gene/locuslink' in value:
-            value = value.split(':')[1]
-            for geneid in geneid_dict:  # we try mapping the geneid to a uniprot id
-                if geneid == value:
-                    uniprotkb_id = geneid_dict[geneid]['uniprotkb_id']
-                    value = uniprotkb_id  # P1414
-                    if row.name not in no_uniprotkb_equivalencies and row.name not in has_uniprotkb_equivalencies:
-                        has_uniprotkb_equivalencies.append(row.name)  # to get the index of those lines
-            # we didn't find an uniprot equivalency, we ditch the whole row:
-            if value == row[prot_num].split(':')[1]:
-                if row.name not in no_uniprotkb_equivalencies:
-                    no_uniprotkb_equivalencies.append(row.name)
-                    if row.name in has_uniprotkb_equivalencies:
-                        has_uniprotkb_equivalencies.remove(row.name)
-        # cleaning the proteins' name if it is an uniprot: ------------------------------------------
-        if 'uniprotkb' in value:
-            fields = value.split('|')
-            for field in fields:
-                if 'uniprotkb' in field:
-                    parts = field.split(':')
-                    value = parts[1].split('(')[0]
-                    if row.name not in no_clear_uniprotkb_id and row.name not in has_clear_uniprotkb_id:
-                        has_clear_uniprotkb_id.append(row.name)
-        # it was a weird uniprotkb format, we ditch the whole row
-        if value == row[prot_num] and not re.search(regex_uniprotkb, row[prot_num]):
-            if row.name not in no_clear_uniprotkb_id:
-                no_clear_uniprotkb_id.append(row.name)
-                if row.name in has_clear_uniprotkb_id:
-                    has_clear_uniprotkb_id.remove(row.name)
-        if row.name % 100000 == 0 or row.name == int(total) - 1:
-            print('Processing prot ' + str(prot_num + 1) + ': ' + str(row.name + 1) + '/' + str(total) + '...')
-        row[prot_num] = value
-    return row[0], row[1]
-
-
-def get_gene_name(row, geneid_dict, total):
-    # main cleaning step for the gene columns (2 and 3)
-    for gene_num in [2, 3]:
-        value = row[gene_num]
-        if '(gene name)' in value:
-            fields = value.split('|')
-            for field in fields:
-                if '(gene name)' in field:
-                    parts = field.split(':')
-                    value = parts[1].split('(')[0]
-        # the gene name is unclear/absent, we try to fetch the gene name from the geneID to uniprotkb mapping dictionary
-        if (value == row[gene_num] and row['service_name'] != 'BioGrid') or (
-                row['service_name'] == 'BioGrid' and row[gene_num] == '-'):
-            for dict in geneid_dict.values():
-                if row[gene_num - 2] == dict['uniprotkb_id']:
-                    if dict['gene_name'] != '-':
-                        value = dict['gene_name']
-                    else:
-                        value = dict['ordered_locus_name']
+        is_entrez = on_distinct(df[col], lambda values: values.str.contains('entrez gene/locuslink', regex=False,
+                                                                            na=False))
+        geneid = on_distinct(df.loc[is_entrez, col], lambda values: values.str.extract(regex_entrez, expand=False))
+        # we try mapping the geneid to a uniprot id, P1414 (only the geneids of df are asked to the geneid map):
+        uniprotkb_id = geneid.map(uniprotkb_mapping.get_uniprotkb_ids(geneid_map_file, geneid.dropna().unique()))
+        # we didn't find an uniprot equivalency, we will ditch the whole row:
+        no_uniprotkb_equivalencies.loc[uniprotkb_id.index[uniprotkb_id.isna()]] = True
+        value.loc[is_entrez] = uniprotkb_id.fillna(geneid)
+        # cleaning the proteins' name if it is an uniprot (this removes the "uniprotkb:" prefix): ------------------
+        value = extract_token(value, regex_uniprotkb_field)
+        # it was a weird uniprotkb format, we will ditch the whole row
+        no_clear_uniprotkb_id |= (value == df[col]) & ~on_distinct(df[col], lambda values: values.str.contains(
+            regex_uniprotkb, na=False))
+        prot_names[col] = value
+    return prot_names, no_uniprotkb_equivalencies, no_clear_uniprotkb_id
+
+
+def get_gene_name(df, geneid_map_file):
+    # main cleaning step for the gene columns (gene1 and gene2), done column by column instead of row by row.
+    # prot1 and prot2 must already be cleaned. Returns the cleaned columns and a boolean mask of the rows without a
+    # clear gene name (they are kept)
+    not_biogrid = df['service_name'] != 'BioGrid'
+    no_gene_name = pd.Series(False, index=df.index)
+    gene_names = pd.DataFrame(index=df.index)
+    for gene_col, prot_col in [('gene1', 'prot1'), ('gene2', 'prot2')]:
+        original = df[gene_col]
+        value = extract_token(original, regex_gene_name_field)
+        # the gene name is unclear/absent, we try to fetch the gene name from the uniprotkb id, in the geneid map:
+        to_backfill = ((value == original) & not_biogrid) | (~not_biogrid & (original == '-'))
+        uniprotkb_ids = df.loc[to_backfill, prot_col]
+        backfill = uniprotkb_ids.map(uniprotkb_mapping.get_gene_names(geneid_map_file,
+                                                                      uniprotkb_ids.dropna().unique())).dropna()
+        value.loc[backfill.index] = backfill
         # the gene name is still unclear/absent, we try to keep only the hgnc if it is present
-        if value == row[gene_num] and row['service_name'] != 'BioGrid' and 'hgnc:' in row[gene_num]:
-            fields = value.split('|')
-            for field in fields:
-                if 'hgnc:' in field:
-                    parts = field.split(':')
-                    value = parts[1].split('|')[0]  # /!\ if it is alone or at the end of the line, will crash
+        has_hgnc = (value == original) & not_biogrid
+        value.loc[has_hgnc] = extract_token(original.loc[has_hgnc], regex_hgnc_field)
         # the gene name is still unclear/absent, we keep the row, but it will be empty:
-        if value == row[gene_num] and row['service_name'] != 'BioGrid':
-            value = '-'
-            no_gene_name.append(row.name)
-        if row.name % 100000 == 0 or row.name == int(total) - 1:  # TODO : Remettre à 100 pour les tests
-            print('Processing gene ' + str(gene_num - 1) + ': ' + str(row.name + 1) + '/' + str(total) + '...')
-        row[gene_num] = value
-    return row[2], row[3]
+        unclear = (value == original) & not_biogrid
+        value.loc[unclear] = '-'
+        no_gene_name |= unclear
+        gene_names[gene_col] = value
+    return gene_names, no_gene_name
+
+
+def normalize_identifiers(df, geneid_map_file):
+    # cleans prot1, prot2, gene1 and gene2 of all the rows at once. Returns the cleaned columns and the 3 masks:
+    # no uniprotkb equivalency to the entrez gene id (dropped), no clear uniprotkb id (dropped), no clear gene name
+    # (kept, only for the rows that are not dropped)
+    prot_names, no_uniprotkb_equivalencies, no_clear_uniprotkb_id = get_prot_name(df, geneid_map_file)
+    gene_names, no_gene_name = get_gene_name(df.assign(prot1=prot_names['prot1'], prot2=prot_names['prot2']),
+                                             geneid_map_file)
+    no_gene_name &= ~(no_uniprotkb_equivalencies | no_clear_uniprotkb_id)
+    return pd.concat([prot_names, gene_names], axis=1), no_uniprotkb_equivalencies, no_clear_uniprotkb_id, no_gene_name
 
 
 def get_mi_idm_list(row, idm_list):
@@ -211,47 +202,65 @@ def get_mi_idm_list(row, idm_list):
     return row
 
 
-def get_psicquic_query_ancestors(mi_list):
+def get_psicquic_query_ancestors(mi_list, mi_ontology_file=None, ols_cache_ttl_days=30):
     # We get the IDM's MIs of all the ancestors, but only of the IDM's MIs we have in our file, to avoid excess calculs
+    # (from the local ontology or the OLS API cache)
+    cache = mi_ontology.load_ols_cache()
     mi_ancestors_dict = {}
     mi_obsolete = []
     for mi in mi_list:
-        api_url = 'https://www.ebi.ac.uk/ols/api/ontologies/mi/ancestors?id=' + mi + '&size=500'
-        response = requests.get(api_url)
-        mi_infos = response.json()['_embedded']['terms']
-        ancestors_list = []
-        for mi_info in mi_infos:
-            if mi_info['is_obsolete'] or mi_infos[0]['description'] == [] and mi != 'MI:0000':
-                mi_obsolete.append(mi)
-                continue
-            elif mi_info['has_children']:
-                ancestors_list.append(mi_info['annotation']['id'][0])
-        if mi not in mi_obsolete:
+        ancestors_list, is_obsolete = mi_ontology.get_ancestors(mi, cache, mi_ontology_file, ols_cache_ttl_days)
+        if is_obsolete:
+            mi_obsolete.append(mi)
+        else:
             mi_ancestors_dict.update({mi: ancestors_list})
+    if not mi_ontology_file:
+        mi_ontology.save_ols_cache(cache)
     return mi_ancestors_dict, mi_obsolete
 
 
 # -----------------------------------------------------
 
 
-def cleaning(output_file, format, molecular_interaction, geneid_dict, mi_fetch_descendants, mi_to_exclude, keep_raw):
-    dropped_filename = output_file.replace('interactome', 'dropped')
-    df = pd.read_csv(output_file)
-    if keep_raw:
-        raw_file = output_file[:-4] + '_raw' + output_file[-4:]
-        df.to_csv(raw_file, index=False)  # we save it before the cleaning, as a new filename if keep_raw = True
+def clean_frame(df, dropped_filename, format, molecular_interaction, geneid_map_file, idm_to_exclude,
+                mi_ontology_file=None, ols_cache_ttl_days=30):
+    # cleans the experimental evidences of df (the whole interactome, or a chunk of it). Returns the cleaned frame,
+    # the ancestors of its IDMs, and its rows without a clear gene name
     print('Initial number of experimental evidences: ' + str(df.shape[0]))
     df['pub_id'] = df['pub_id'].apply(clean_pub_id)  # cleaning the pubmed: we keep only the pubmed id
+    # all the filters are evaluated on the whole frame, in this order, before any row is dropped: (reason written in
+    # the dropped file, text of the printed count, mask of the rows that fail the filter)
+    rules = []
     if molecular_interaction == 'protein-protein' and format == 'tab27':
-        df = to_keep_contains(dropped_filename, 'MI:0326', 'interactor_type1', 'interactor_type2', df,
-                              'fetched from psicquic that are not a protein: ')
-    df = to_keep_contains(dropped_filename, 'uniprotkb|entrez gene/locuslink', 'prot1', 'prot2', df,
-                          'that do not have a uniprotkb or entrez gene protein id: ')
-    df = col_remove_empty_data(dropped_filename, 'idm', df, 'that do not have an idm: ')
-    df = to_keep_contains(dropped_filename, 'pubmed', 'pub_id', 'pub_id', df, 'that do not have a pubmed id: ')
-    df = col_remove_empty_data(dropped_filename, 'interaction_identifiers', df, 'that do not have an interaction id: ')
-    idm_to_exclude = get_psicquic_query_descendants(mi_fetch_descendants, mi_to_exclude)
-    df = to_remove_contains(dropped_filename, "|".join(idm_to_exclude), 'idm', df, 'that have an idm to exclude: ')
+        rules.append(('not a protein', 'fetched from psicquic that are not a protein: ',
+                      ~contains_both('MI:0326', 'interactor_type1', 'interactor_type2', df)))
+    rules.append(('no protein id', 'that do not have a uniprotkb or entrez gene protein id: ',
+                  ~contains_both('uniprotkb|entrez gene/locuslink', 'prot1', 'prot2', df)))
+    rules.append(('no idm', 'that do not have an idm: ', is_empty('idm', df)))
+    rules.append(('no pubmed id', 'that do not have a pubmed id: ', ~contains_both('pubmed', 'pub_id', 'pub_id', df)))
+    rules.append(('no interaction id', 'that do not have an interaction id: ', is_empty('interaction_identifiers', df)))
+    rules.append(('idm to exclude', 'that have an idm to exclude: ', has_mi_to_exclude(df['idm'], idm_to_exclude)))
+    # cleaning the prot and gene parts, mapping the geneid to uniprotkb id if necessary:
+    print("Starting to normalize the identifiers: " + datetime.datetime.now().strftime("%d/%m/%Y, %H:%M:%S"))
+    names, no_uniprotkb_equivalencies, no_clear_uniprotkb_id, no_gene_name = normalize_identifiers(
+        df, geneid_map_file)
+    rules.append(('no uniprotkb equivalency',
+                  'that do not contain a uniprotkb equivalency to their entrez gene protein id: ',
+                  no_uniprotkb_equivalencies))
+    rules.append(('no clear uniprotkb id', 'that do not contain a clear uniprotkb id: ', no_clear_uniprotkb_id))
+    # the obsolete IDMs are looked for only in the rows that pass all the other filters
+    passing = ~np.logical_or.reduce([mask.to_numpy(dtype=bool) for reason, text, mask in rules])
+    idm_list = []
+    for idm in df.loc[passing, 'idm'].unique():
+        get_mi_idm_list(idm, idm_list)
+    mi_ancestors, mi_obsolete = get_psicquic_query_ancestors(idm_list, mi_ontology_file, ols_cache_ttl_days)
+    idm = on_distinct(df.loc[passing, 'idm'], lambda values: values.apply(clean_idm, args=(mi_obsolete,)))
+    rules.append(('only obsolete idms', 'that have only obsolete idms: ',
+                  (idm == '-').reindex(df.index, fill_value=False)))
+    kept = apply_rules(dropped_filename, rules, df)
+    df = df.loc[kept].copy()
+    df[['prot1', 'prot2', 'gene1', 'gene2']] = names.loc[kept]
+    no_gene_name = no_gene_name.loc[kept]
     # cleaning the species columns from all the text:
     df['species1'] = df['species1'].apply(
         lambda x: x.split('(')[0] if ('-1' not in x) and ('-2' not in x) and ('-3' not in x) else x.split('|')[0])
@@ -268,45 +277,89 @@ def cleaning(output_file, format, molecular_interaction, geneid_dict, mi_fetch_d
            'psi-mi:"MI:0000"(unspecified)', 'exp_role1'] = 'psi-mi:"MI:0499"(unspecified role)'
     df.loc[df['exp_role2'] ==
            'psi-mi:"MI:0000"(unspecified)', 'exp_role2'] = 'psi-mi:"MI:0499"(unspecified role)'
-    # cleaning the prot parts and mapping the geneid to uniprotkb id if necessary:
-    print("Starting get_prot_name: " + datetime.datetime.now().strftime("%d/%m/%Y, %H:%M:%S"))
-    df[['prot1', 'prot2']] = df.apply(get_prot_name, args=(geneid_dict, df.shape[0]), axis=1, result_type="expand")
-    df = to_remove_list(dropped_filename, no_uniprotkb_equivalencies, df,
-                        'that do not contain a uniprotkb equivalency to their entrez gene protein id: ')
-    # cleaning the proteins' name if it is an uniprot
-    df = to_remove_list(dropped_filename, no_clear_uniprotkb_id, df, 'that do not contain a clear uniprotkb id: ')
-    # cleaning the genes' name
-    print("Starting get_gene_name: " + datetime.datetime.now().strftime("%d/%m/%Y, %H:%M:%S"))
-    df[['gene1', 'gene2']] = df.apply(get_gene_name, args=(geneid_dict, df.shape[0]), axis=1, result_type="expand")
-    # v3.0: if there are a lot of no_gene_name, we could try to take that array and use it again in uniprotkb mapping
-    if len(no_gene_name) != 0:
-        print('Note: number of experimental evidences that do not contain a clear gene name: ' + str(len(no_gene_name)))
-        print('Those rows are kept in the main frame, but to investigate')
-        df.loc[df.index.isin(no_gene_name)].to_csv('no_gene_name.csv', mode='w', header=False, index=False)
+    no_gene_name_rows = df.loc[no_gene_name]
     # to clean the source_databases that are not formatted the same:
     df['source_databases'] = df['source_databases'].apply(lambda x: x.split('(')[0] + '(' + x.split('(')[1].lower())
+    # keeping only the IDMs that are not obsolete:
+    df['idm'] = idm.loc[df.index]
     # As proteins can be filled in the database in ony order, we put them all in the same order in the line:
-    # prot1 = alphanumerically inferior to prot2, so that the redundancies are all took into account
+    # prot1 = alphanumerically inferior to prot2, so that the redundancies are all took into account. The rows to swap
+    # are found once, on the integer codes of the accessions, and each pair of columns is swapped on numpy arrays
+    prot1_codes, prot2_codes, _ = interactome_io.encode_proteins(df['prot1'], df['prot2'])
+    swap = prot1_codes > prot2_codes
+    pairs = [('gene1', 'gene2'), ('species1', 'species2'), ('prot1', 'prot2')]
     if format == 'tab27':
-        df[['biological_role1', 'biological_role2']] = df[['biological_role2', 'biological_role1']] \
-            .where(df['prot1'] > df['prot2'], df[['biological_role1', 'biological_role2']].values)
-        df[['exp_role1', 'exp_role2']] = df[['exp_role2', 'exp_role1']] \
-            .where(df['prot1'] > df['prot2'], df[['exp_role1', 'exp_role2']].values)
-        df[['interactor_type1', 'interactor_type2']] = df[['interactor_type2', 'interactor_type1']] \
-            .where(df['prot1'] > df['prot2'], df[['interactor_type1', 'interactor_type2']].values)
-        df[['participant_id_method1', 'participant_id_method2']] = df[
-            ['participant_id_method2', 'participant_id_method1']] \
-            .where(df['prot1'] > df['prot2'], df[['participant_id_method1', 'participant_id_method2']].values)
-    df[['gene1', 'gene2']] = df[['gene2', 'gene1']] \
-        .where(df['prot1'] > df['prot2'], df[['gene1', 'gene2']].values)
-    df[['species1', 'species2']] = df[['species2', 'species1']] \
-        .where(df['prot1'] > df['prot2'], df[['species1', 'species2']].values)
-    df[['prot1', 'prot2']] = df[['prot2', 'prot1']] \
-        .where(df['prot1'] > df['prot2'], df[['prot1', 'prot2']].values)
-    idm_list = []
-    mi_idm_list = df['idm'].apply(get_mi_idm_list, args=(idm_list,))
-    mi_ancestors, mi_obsolete = get_psicquic_query_ancestors(idm_list)
-    df['idm'] = df['idm'].apply(clean_idm, args=(mi_obsolete,))
-    df = col_remove_empty_data(dropped_filename, 'idm', df, 'that have only obsolete idms: ')
-    df.to_csv(output_file, index=False)
-    return mi_ancestors
+        pairs = [('biological_role1', 'biological_role2'), ('exp_role1', 'exp_role2'),
+                 ('interactor_type1', 'interactor_type2'), ('participant_id_method1', 'participant_id_method2')] + pairs
+    for col1, col2 in pairs:
+        values1 = df[col1].to_numpy()
+        values2 = df[col2].to_numpy()
+        df[col1] = np.where(swap, values2, values1)
+        df[col2] = np.where(swap, values1, values2)
+    return df, mi_ancestors, no_gene_name_rows
+
+
+def start_cleaning(output_file, format, molecular_interaction, geneid_map_file, mi_fetch_descendants, mi_to_exclude,
+                   keep_raw, mi_ontology_file=None, ols_cache_ttl_days=30, intermediate_format='csv'):
+    # the cleaning of output_file, one chunk after another (see clean_chunk and end_cleaning): its parameters, and what
+    # is added up over the chunks
+    cleaned_file = output_file[:-4] + '_cleaned' + output_file[-4:]  # replaces the interactome file at the end
+    interactome_io.create(cleaned_file, interactome_io.get_headers(format), intermediate_format)
+    idm_to_exclude = set(get_psicquic_query_descendants(mi_fetch_descendants, mi_to_exclude, mi_ontology_file,
+                                                        ols_cache_ttl_days))
+    return {'output_file': output_file, 'cleaned_file': cleaned_file,
+            'dropped_filename': output_file.replace('interactome', 'dropped'),
+            'raw_file': output_file[:-4] + '_raw' + output_file[-4:], 'format': format,
+            'molecular_interaction': molecular_interaction, 'geneid_map_file': geneid_map_file,
+            'idm_to_exclude': idm_to_exclude, 'keep_raw': keep_raw, 'mi_ontology_file': mi_ontology_file,
+            'ols_cache_ttl_days': ols_cache_ttl_days, 'intermediate_format': intermediate_format,
+            'chunks': 0, 'mi_ancestors': {}, 'number_no_gene_name': 0}
+
+
+def clean_chunk(cleaning_state, df):
+    # cleans a chunk of the interactome and appends it to the cleaned file
+    if cleaning_state['keep_raw']:  # we save it before the cleaning, as a new filename if keep_raw = True
+        df.to_csv(cleaning_state['raw_file'], mode='w' if cleaning_state['chunks'] == 0 else 'a',
+                  header=cleaning_state['chunks'] == 0, index=False)
+    cleaning_state['chunks'] += 1
+    rows_in = df.shape[0]
+    df, chunk_mi_ancestors, no_gene_name_rows = clean_frame(df, cleaning_state['dropped_filename'],
+                                                            cleaning_state['format'],
+                                                            cleaning_state['molecular_interaction'],
+                                                            cleaning_state['geneid_map_file'],
+                                                            cleaning_state['idm_to_exclude'],
+                                                            cleaning_state['mi_ontology_file'],
+                                                            cleaning_state['ols_cache_ttl_days'])
+    cleaning_state['mi_ancestors'].update(chunk_mi_ancestors)
+    run_report.record('cleaning', rows_in=rows_in, rows_out=df.shape[0], no_gene_name=no_gene_name_rows.shape[0])
+    interactome_io.append(cleaning_state['cleaned_file'], df, cleaning_state['intermediate_format'])
+    # v3.0: if there are a lot of no_gene_name, we could try to take that array and use it again in uniprotkb mapping
+    if no_gene_name_rows.shape[0] != 0:
+        no_gene_name_rows.to_csv('no_gene_name.csv', mode='a' if cleaning_state['number_no_gene_name'] else 'w',
+                                 header=False, index=False)
+        cleaning_state['number_no_gene_name'] += no_gene_name_rows.shape[0]
+
+
+def end_cleaning(cleaning_state):
+    # the cleaned file replaces the interactome file. Returns the ancestors of the IDMs of all the chunks
+    if cleaning_state['number_no_gene_name']:
+        print('Note: number of experimental evidences that do not contain a clear gene name: ' +
+              str(cleaning_state['number_no_gene_name']))
+        print('Those rows are kept in the main frame, but to investigate')
+    interactome_io.replace(cleaning_state['cleaned_file'], cleaning_state['output_file'],
+                           cleaning_state['intermediate_format'])
+    return cleaning_state['mi_ancestors']
+
+
+def cleaning(output_file, format, molecular_interaction, geneid_map_file, mi_fetch_descendants, mi_to_exclude, keep_raw,
+             mi_ontology_file=None, ols_cache_ttl_days=30, intermediate_format='csv', chunk_size=None):
+    # with chunk_size, the interactome file is cleaned chunk_size rows at a time instead of all at once
+    cleaning_state = start_cleaning(output_file, format, molecular_interaction, geneid_map_file, mi_fetch_descendants,
+                              mi_to_exclude, keep_raw, mi_ontology_file, ols_cache_ttl_days, intermediate_format)
+    if chunk_size:
+        chunks = interactome_io.read_chunks(output_file, intermediate_format, chunk_size)
+    else:
+        chunks = [interactome_io.read(output_file, intermediate_format)]
+    for df in chunks:
+        clean_chunk(cleaning_state, df)
+    return end_cleaning(cleaning_state)
@@ -0,0 +1,116 @@
+# Author: Lunelys RUNESHAW <lunelys.runeshaw@etudiant.univ-rennes.fr>
+#
+# This script is keeping the pages already downloaded by the fetching steps, so a run that failed halfway (a PSICQUIC
+# service that times out, a BioGRID page that fails during an all species run...) can be launched again without
+# downloading everything again. Each downloaded page (a BioGRID page, a page of a PSICQUIC service, or the whole service
+# without psicquic_page_size) is written to its own part file in cache/checkpoints/[interactome name]/, and recorded in
+# a manifest with its url. When the pipeline is launched again with the same query, the pages of the manifest are read
+# from their part files instead of being downloaded, and the download resumes from the first missing page.
+# The checkpoints are deleted once everything is fetched. A page that fails because of the network or of the server
+# (connection error, timeout, truncated answer, status 5xx or 429) is downloaded again, retry_attempts times at most,
+# waiting longer and longer between the attempts (backoff), instead of being skipped. The other errors (status 4xx, an
+# answer that cannot be parsed) would fail again the same way: they are raised at once.
+
+import os
+import json
+import time
+import pickle
+import shutil
+import hashlib
+import threading
+import http.client
+import urllib.error
+import requests
+import run_report
+
+retry_attempts = 5
+backoff_seconds = 2  # waits 2, 4, 8 then 16 seconds between the attempts
+lock = threading.Lock()  # the pages are downloaded by several threads at the same time
+manifests = {}  # checkpoint folder: its manifest, loaded once
+
+
+def get_checkpoint_folder(output_file):
+    return os.path.join('cache', 'checkpoints', os.path.basename(output_file)[:-4])
+
+
+def load_manifest(checkpoint_folder):
+    if checkpoint_folder not in manifests:
+        manifest_file = os.path.join(checkpoint_folder, 'manifest.json')
+        if os.path.exists(manifest_file):
+            with open(manifest_file) as manifest:
+                manifests[checkpoint_folder] = json.load(manifest)
+            print('Resuming the download: ' + str(len(manifests[checkpoint_folder])) + ' pages already downloaded in '
+                  + checkpoint_folder)
+        else:
+            manifests[checkpoint_folder] = {}
+    return manifests[checkpoint_folder]
+
+
+def save_manifest(checkpoint_folder, manifest):
+    # written next to the previous one and then renamed, so a crash never leaves half a manifest
+    manifest_file = os.path.join(checkpoint_folder, 'manifest.json')
+    with open(manifest_file + '.tmp', 'w') as manifest_tmp:
+        json.dump(manifest, manifest_tmp, indent=1)
+    os.replace(manifest_file + '.tmp', manifest_file)
+
+
+def is_transient(error):
+    # True if trying again later can work: network errors, and the server down or busy (5xx, 429)
+    if isinstance(error, (requests.HTTPError, urllib.error.HTTPError)):
+        status = error.code if isinstance(error, urllib.error.HTTPError) else getattr(error.response, 'status_code', 0)
+        return status >= 500 or status == 429
+    return isinstance(error, (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+                              urllib.error.URLError, http.client.IncompleteRead, ConnectionError, TimeoutError))
+
+
+def with_retries(download, source_name, description):
+    # returns download(), called again after a pause if it fails with a transient error (see is_transient)
+    for attempt in range(retry_attempts):
+        try:
+            return download()
+        except (OSError, http.client.HTTPException) as error:  # requests and urllib errors are OSError
+            if not is_transient(error):
+                print(description + ' failed: ' + str(error))
+                raise
+            if attempt == retry_attempts - 1:
+                print(description + ' failed ' + str(retry_attempts) + ' times: ' + str(error))
+                raise
+            wait = backoff_seconds * 2 ** attempt
+            print(description + ' failed (' + str(error) + '), new attempt in ' + str(wait) + ' s')
+            run_report.record_source(source_name, retries=1)
+            time.sleep(wait)
+
+
+# -----------------------------------------------------
+
+
+def fetch_page(output_file, source_name, url, download, retried=True):
+    # returns download() for this url: from its part file if it was already downloaded, else downloaded (with retries)
+    # and written to a part file. url must not contain any key, it is written in the manifest. retried = False if
+    # download already goes through a session that retries (BioGRID): it is then called once
+    checkpoint_folder = get_checkpoint_folder(output_file)
+    key = hashlib.sha1(url.encode()).hexdigest()
+    with lock:
+        part = load_manifest(checkpoint_folder).get(key, {}).get('part')
+    if part is not None:
+        with open(os.path.join(checkpoint_folder, part), 'rb') as part_file:
+            return pickle.load(part_file)
+    result = with_retries(download, source_name, source_name + ' ' + url) if retried else download()
+    os.makedirs(checkpoint_folder, exist_ok=True)
+    part = key + '.pkl'
+    with open(os.path.join(checkpoint_folder, part + '.tmp'), 'wb') as part_file:
+        pickle.dump(result, part_file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(os.path.join(checkpoint_folder, part + '.tmp'), os.path.join(checkpoint_folder, part))
+    with lock:
+        manifest = load_manifest(checkpoint_folder)
+        manifest[key] = {'source': source_name, 'url': url, 'part': part}
+        save_manifest(checkpoint_folder, manifest)
+    return result
+
+
+def clear(output_file):
+    # once everything is fetched
+    checkpoint_folder = get_checkpoint_folder(output_file)
+    manifests.pop(checkpoint_folder, None)
+    if os.path.isdir(checkpoint_folder):
+        shutil.rmtree(checkpoint_folder)
@@ -0,0 +1,171 @@
+# Author: Lunelys RUNESHAW <lunelys.runeshaw@etudiant.univ-rennes.fr>
+#
+# This script is handling the incremental mode (see incremental in main.py). Instead of fetching, cleaning and removing
+# the redundancies of everything at each run, we record a fingerprint of each source (the number of experimental
+# evidences of each BioGRID/PSICQUIC service for each taxid, and the Uniprot release used for the mapping) in a
+# manifest, and at the next run:
+# - only the sources whose fingerprint changed are fetched again. The raw experimental evidences of each source are
+# kept in cache/incremental/[interactome name]/, so the unchanged ones are reused from there,
+# - only the experimental evidences of the changed sources are cleaned again,
+# - and only the (prot1, prot2, pub_id) groups in which one of those experimental evidences was (or is now) are merged
+# again to update the file without redundancies (redundancies are only looked for inside those groups).
+# If the query itself changed (taxids, query, format...), everything is fetched again. If the cleaning parameters or
+# the Uniprot release changed, everything is cleaned and merged again, but only the changed sources are fetched again.
+
+import os
+import json
+import pandas as pd
+import biogrid_fetching
+import psicquic_fetching
+import uniprotkb_mapping
+import cleaning_data
+import removing_redundancies
+import interactome_io
+
+keys = ['prot1', 'prot2', 'pub_id']
+
+
+def get_store_folder(output_file):
+    return os.path.join('cache', 'incremental', output_file[:-4])
+
+
+def get_raw_file(output_file, service_name):
+    return os.path.join(get_store_folder(output_file), 'raw_' + service_name + '.csv')
+
+
+def get_cleaned_file(output_file):
+    return os.path.join(get_store_folder(output_file), 'cleaned.csv')
+
+
+def exists(file, intermediate_format):
+    if intermediate_format == 'parquet':
+        return os.path.isdir(interactome_io.get_parquet_folder(file))
+    return os.path.isfile(file)
+
+
+def load_manifest(output_file):
+    manifest_file = os.path.join(get_store_folder(output_file), 'manifest.json')
+    if os.path.exists(manifest_file):
+        with open(manifest_file) as manifest:
+            return json.load(manifest)
+    return None
+
+
+def save_manifest(output_file, manifest):
+    with open(os.path.join(get_store_folder(output_file), 'manifest.json'), 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=1)
+
+
+def get_fingerprints(taxids, query, max_result, format, molecular_interaction, psicquic_db_to_use):
+    # for each source (service name), the number of experimental evidences it has for each taxid, and the Uniprot
+    # release of each taxid. Only counts are asked, nothing is downloaded
+    print('Fetching the fingerprints of the sources...')
+    sources = {}
+    if format == 'tab27':
+        sources['BioGrid'] = {taxid: biogrid_fetching.count(taxid, query, max_result, molecular_interaction)
+                              for taxid in taxids}
+    for service in psicquic_fetching.select_services(format, molecular_interaction, psicquic_db_to_use):
+        sources[service.name] = {taxid: psicquic_fetching.count_psicquic(service, taxid, query) for taxid in taxids}
+    uniprot = {taxid: uniprotkb_mapping.get_release(taxid) for taxid in taxids}
+    return {'sources': sources, 'uniprot': uniprot}
+
+
+def get_changes(output_file, fingerprints, fetch_config, clean_config):
+    # returns the sources to fetch again, the sources to clean again (the fetched ones + the ones that disappeared),
+    # and if everything has to be cleaned and merged again
+    manifest = load_manifest(output_file)
+    intermediate_format = clean_config['intermediate_format']
+    same_query = manifest is not None and manifest['fetch_config'] == fetch_config
+    fetched_services = [service_name for service_name, fingerprint in fingerprints['sources'].items()
+                        if not same_query or manifest['sources'].get(service_name) != fingerprint
+                        or not exists(get_raw_file(output_file, service_name), intermediate_format)]
+    print('Sources to fetch again: ' + str(fetched_services))
+    if not same_query:
+        return fetched_services, fetched_services, True
+    removed_services = [service_name for service_name in manifest['sources']
+                        if service_name not in fingerprints['sources']]
+    same_uniprot = all(release is None or manifest['uniprot'].get(taxid) == release
+                       for taxid, release in fingerprints['uniprot'].items())
+    full_rebuild = manifest['clean_config'] != clean_config or not same_uniprot \
+        or not exists(get_cleaned_file(output_file), intermediate_format) \
+        or not os.path.isfile(removing_redundancies.get_no_redundancies_file(output_file))
+    if removed_services:
+        print('Sources not fetched anymore: ' + str(removed_services))
+    return fetched_services, fetched_services + removed_services, full_rebuild
+
+
+def store_raw(output_file, fetched_services, intermediate_format):
+    # the raw experimental evidences just fetched (in the interactome file) are kept per source in the store
+    os.makedirs(get_store_folder(output_file), exist_ok=True)
+    fetched = interactome_io.read(output_file, intermediate_format)
+    for service_name in fetched_services:
+        interactome_io.write(get_raw_file(output_file, service_name),
+                             fetched.loc[fetched['service_name'] == service_name], intermediate_format)
+
+
+def read_raw(output_file, service_names, intermediate_format):
+    return pd.concat([interactome_io.read(get_raw_file(output_file, service_name), intermediate_format)
+                      for service_name in service_names], ignore_index=True)
+
+
+def in_groups(df, groups):
+    # True for the rows of df that belong to one of the (prot1, prot2, pub_id) groups
+    return pd.MultiIndex.from_frame(df[keys].astype(str)).isin(groups)
+
+
+# -----------------------------------------------------
+
+
+def rebuild(output_file, fetched_services, rebuilt_services, full_rebuild, fingerprints, fetch_config, clean_config,
+            format, molecular_interaction, geneid_map_file, mi_fetch_descendants, mi_to_exclude, keep_raw,
+            mi_ontology_file, ols_cache_ttl_days, intermediate_format, chunk_size=None, partitions=None,
+            partition_max_workers=1):
+    store_raw(output_file, fetched_services, intermediate_format)
+    cleaned_file = get_cleaned_file(output_file)
+    no_redundancies_file = removing_redundancies.get_no_redundancies_file(output_file)
+    if keep_raw:
+        raw_file = output_file[:-4] + '_raw' + output_file[-4:]
+        read_raw(output_file, fingerprints['sources'], intermediate_format).to_csv(raw_file, index=False)
+    if not full_rebuild and not rebuilt_services:
+        print('Nothing changed since the last run: ' + no_redundancies_file + ' is kept as it is')
+        interactome_io.write(output_file, interactome_io.read(cleaned_file, intermediate_format), intermediate_format)
+    elif full_rebuild:
+        print('Cleaning and removing the redundancies of all the sources')
+        interactome_io.write(output_file, read_raw(output_file, fingerprints['sources'], intermediate_format),
+                             intermediate_format)
+        mi_ancestors = cleaning_data.cleaning(output_file, format, molecular_interaction, geneid_map_file,
+                                              mi_fetch_descendants, mi_to_exclude, False, mi_ontology_file,
+                                              ols_cache_ttl_days, intermediate_format, chunk_size)
+        removing_redundancies.removing(output_file, mi_ancestors, intermediate_format, partitions,
+                                       partition_max_workers, chunk_size or 500000)
+        interactome_io.write(cleaned_file, interactome_io.read(output_file, intermediate_format), intermediate_format)
+    else:
+        print('Cleaning and removing the redundancies of the sources: ' + str(rebuilt_services))
+        # the interactome file holds the raw experimental evidences of the fetched sources only: we clean them
+        cleaning_data.cleaning(output_file, format, molecular_interaction, geneid_map_file, mi_fetch_descendants,
+                               mi_to_exclude, False, mi_ontology_file, ols_cache_ttl_days, intermediate_format,
+                               chunk_size)
+        cleaned_new = interactome_io.read(output_file, intermediate_format)
+        previous = interactome_io.read(cleaned_file, intermediate_format)
+        is_rebuilt = previous['service_name'].isin(rebuilt_services)
+        cleaned = pd.concat([previous.loc[~is_rebuilt], cleaned_new], ignore_index=True)
+        interactome_io.write(output_file, cleaned, intermediate_format)
+        interactome_io.write(cleaned_file, cleaned, intermediate_format)
+        # the groups where an experimental evidence was removed, changed or added
+        groups = pd.MultiIndex.from_frame(pd.concat([previous.loc[is_rebuilt, keys], cleaned_new[keys]]).astype(str))
+        groups = groups.unique()
+        print('Number of (prot1, prot2, pub_id) groups to merge again: ' + str(len(groups)))
+        previous_final = pd.read_csv(no_redundancies_file)
+        final = previous_final.loc[~in_groups(previous_final, groups)]
+        to_merge = cleaned.loc[in_groups(cleaned, groups)]
+        if to_merge.shape[0] != 0:
+            idm_list = []
+            to_merge['idm'].apply(cleaning_data.get_mi_idm_list, args=(idm_list,))
+            mi_ancestors, mi_obsolete = cleaning_data.get_psicquic_query_ancestors(idm_list, mi_ontology_file,
+                                                                                 ols_cache_ttl_days)
+            final = pd.concat([final, removing_redundancies.removing_frame(to_merge, mi_ancestors)])
+        final = final.sort_values(keys, kind='stable')
+        print('Final number of experimental evidences, without any redundancies: ' + str(final.shape[0]))
+        final.to_csv(no_redundancies_file, index=False)
+    save_manifest(output_file, {'fetch_config': fetch_config, 'clean_config': clean_config,
+                                'sources': fingerprints['sources'], 'uniprot': fingerprints['uniprot']})
@@ -0,0 +1,123 @@
+# Author: Lunelys RUNESHAW <lunelys.runeshaw@etudiant.univ-rennes.fr>
+#
+# This script is writing the final interactome (interactome_[query]_[species]_[format]_no_redundancies.csv) as a protein
+# graph, in numpy files (.npy) that network tools can open as memory maps (np.load(file, mmap_mode='r')), without
+# parsing the csv file and building the graph again. The files are in the folder
+# interactome_[query]_[species]_[format]_graph:
+# - nodes.npy (and nodes.csv): the uniprotkb accession of each node, sorted, so the index of an accession is its
+# position (np.searchsorted),
+# - src.npy, dst.npy: the edges (one per pair of proteins, src <= dst), in COO format,
+# - indptr.npy, indices.npy, edge.npy: the same edges in both directions, in CSR format (the neighbours of node i are
+# indices[indptr[i]:indptr[i + 1]], and edge gives the position of each of them in the COO edges),
+# - evidences.npy: the number of experimental evidences of each edge (the count_evidences of its rows: the cleaned
+# experimental evidences merged in each of them),
+# - publications.npy: the number of distinct publications of each edge,
+# - services.npy: the services of each edge, as a bitmask (bit i = the i-th service of service_names in graph.json),
+# - graph.json: the number of nodes and edges, the service_names of the bitmask, and the type of each file.
+
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+import interactome_io
+
+columns = ['prot1', 'prot2', 'pub_id', 'service_name', 'count_evidences']
+
+
+def get_service_bits(service_names, edge):
+    # the bitmask of the services of each edge: bit i for the i-th service (alphabetical order). A merged row can come
+    # from several services (IntAct|MINT)
+    services = service_names.fillna('-').str.split('|').explode()
+    codes, names = pd.factorize(services.to_numpy(dtype=object), sort=True)
+    if len(names) > 64:
+        raise ValueError('More than 64 services, they do not fit in the bitmask of the edges')
+    masks = np.zeros(edge.max() + 1 if len(edge) else 0, dtype=np.uint64)
+    np.bitwise_or.at(masks, edge[services.index.to_numpy()], np.left_shift(np.uint64(1), codes.astype(np.uint64)))
+    return masks, list(names)
+
+
+def get_csr(n_nodes, src, dst):
+    # both directions of each edge (once for a protein interacting with itself), sorted by node then neighbour
+    edge = np.arange(len(src), dtype=np.int32)
+    loop = src == dst
+    rows = np.concatenate([src, dst[~loop]])
+    cols = np.concatenate([dst, src[~loop]])
+    edges = np.concatenate([edge, edge[~loop]])
+    order = np.lexsort((cols, rows))
+    indptr = np.zeros(n_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_nodes), out=indptr[1:])
+    return indptr, cols[order], edges[order]
+
+
+# -----------------------------------------------------
+
+
+def get_graph_folder(output_file):
+    return output_file[:-4] + '_graph'
+
+
+def export(no_redundancies_file, graph_folder):
+    # the graph is written in a temporary folder and then renamed, so the readers never see half a graph
+    print('Writing the interactome graph in ' + graph_folder)
+    df = pd.read_csv(no_redundancies_file, usecols=columns,
+                     dtype={'prot1': str, 'prot2': str, 'pub_id': str, 'service_name': str})
+    # prot1 <= prot2 in the interactome, and the codes are sorted like the accessions: src <= dst
+    src, dst, nodes = interactome_io.encode_proteins(df['prot1'], df['prot2'])
+    pairs, edge = np.unique(src.astype(np.int64) * len(nodes) + dst, return_inverse=True)
+    edge = edge.reshape(-1)
+    n_edges = len(pairs)
+    evidences = np.bincount(edge, weights=df['count_evidences'].to_numpy(dtype=np.int64),
+                            minlength=n_edges).astype(np.int32)
+    pub_codes, pub_ids = pd.factorize(df['pub_id'].to_numpy(dtype=object))
+    edge_publications = np.unique(edge.astype(np.int64) * max(len(pub_ids), 1) + pub_codes)
+    publications = np.bincount(edge_publications // max(len(pub_ids), 1), minlength=n_edges).astype(np.int32)
+    services, service_names = get_service_bits(df['service_name'], edge)
+    src = (pairs // max(len(nodes), 1)).astype(np.int32)
+    dst = (pairs % max(len(nodes), 1)).astype(np.int32)
+    indptr, indices, csr_edge = get_csr(len(nodes), src, dst)
+    arrays = {'nodes': np.array(nodes, dtype=str), 'src': src, 'dst': dst, 'indptr': indptr, 'indices': indices,
+              'edge': csr_edge, 'evidences': evidences, 'publications': publications, 'services': services}
+    graph_tmp_folder = graph_folder + '_tmp'
+    if os.path.isdir(graph_tmp_folder):
+        shutil.rmtree(graph_tmp_folder)
+    os.makedirs(graph_tmp_folder)
+    for name, array in arrays.items():
+        np.save(os.path.join(graph_tmp_folder, name + '.npy'), array)
+    pd.DataFrame({'index': np.arange(len(nodes)), 'accession': nodes}).to_csv(
+        os.path.join(graph_tmp_folder, 'nodes.csv'), index=False)
+    with open(os.path.join(graph_tmp_folder, 'graph.json'), 'w') as graph_json:
+        json.dump({'nodes': len(nodes), 'edges': n_edges, 'service_names': service_names,
+                   'files': {name + '.npy': str(array.dtype) for name, array in arrays.items()}}, graph_json, indent=1)
+    if os.path.isdir(graph_folder):
+        shutil.rmtree(graph_folder)
+    os.replace(graph_tmp_folder, graph_folder)
+    print('Number of nodes and edges of the interactome graph: ' + str(len(nodes)) + ', ' + str(n_edges))
+    return graph_folder
+
+
+def load(graph_folder):
+    # the arrays of the graph as read-only memory maps (nothing is read before it is used), and graph.json
+    with open(os.path.join(graph_folder, 'graph.json')) as graph_json:
+        graph = json.load(graph_json)
+    for file in graph['files']:
+        graph[file[:-4]] = np.load(os.path.join(graph_folder, file), mmap_mode='r')
+    return graph
+
+
+def get_node(graph, accession):
+    # the index of a protein in the graph, None if it is not in it
+    index = int(np.searchsorted(graph['nodes'], accession))
+    if index < len(graph['nodes']) and graph['nodes'][index] == accession:
+        return index
+    return None
+
+
+def get_neighbours(graph, accession):
+    # the accessions of the partners of a protein, with the position of the edge to each of them (for the evidences,
+    # publications and services arrays)
+    index = get_node(graph, accession)
+    if index is None:
+        return [], np.zeros(0, dtype=np.int32)
+    start, end = graph['indptr'][index], graph['indptr'][index + 1]
+    return list(graph['nodes'][graph['indices'][start:end]]), np.asarray(graph['edge'][start:end])
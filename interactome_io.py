@@ -0,0 +1,127 @@
+# Author: Lunelys RUNESHAW <lunelys.runeshaw@etudiant.univ-rennes.fr>
+#
+# This script is reading and writing the interactome file between the steps of the pipeline (fetching, cleaning,
+# removing redundancies). The file keeps its csv name (interactome_[query]_[species]_[format].csv) everywhere in the
+# pipeline, but depending on the intermediate_format parameter (see main.py) the data is stored:
+# - in csv: that file, appended to by the fetching steps and rewritten by the cleaning step,
+# - in parquet: a folder next to it (interactome_[query]_[species]_[format]_parquet), with one parquet file per
+# appended frame, as a parquet file can not be appended to. The heavy repeated columns are stored as categorical
+# columns, and nothing is parsed from text again between the steps. Needs the pyarrow module.
+# The final file without redundancies is always written in csv, by removing_redundancies.py.
+
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+tab27_headers = ['prot1', 'prot2', 'gene1', 'gene2', 'idm', 'authors', 'pub_id', 'species1', 'species2',
+                 'interaction_type', 'source_databases', 'interaction_identifiers', 'confidence_score',
+                 'biological_role1', 'biological_role2', 'exp_role1', 'exp_role2', 'interactor_type1',
+                 'interactor_type2', 'taxid_host', 'participant_id_method1', 'participant_id_method2',
+                 'service_name', 'biogrid_experimental_system', 'biogrid_description', 'biogrid_type', 'throughput']
+tab25_headers = ['prot1', 'prot2', 'gene1', 'gene2', 'idm', 'authors', 'pub_id', 'species1', 'species2',
+                 'interaction_type', 'source_databases', 'interaction_identifiers', 'confidence_score',
+                 'service_name']
+# columns with few distinct values repeated on millions of rows: stored as categorical in parquet
+categorical_columns = ['idm', 'source_databases', 'service_name', 'species1', 'species2', 'taxid_host']
+
+
+def get_headers(format):
+    if format == 'tab25':
+        return tab25_headers
+    return tab27_headers
+
+
+def get_parquet_folder(output_file):
+    return output_file[:-4] + '_parquet'
+
+
+def create(output_file, headers, intermediate_format='csv'):
+    # creates an empty interactome file (or folder), deleting the previous one if there is one
+    if intermediate_format == 'parquet':
+        parquet_folder = get_parquet_folder(output_file)
+        if os.path.isdir(parquet_folder):
+            shutil.rmtree(parquet_folder)
+        os.makedirs(parquet_folder)
+        append(output_file, pd.DataFrame(columns=headers), intermediate_format)  # empty first part, for the headers
+    else:
+        pd.DataFrame(columns=headers).to_csv(output_file, index=False)
+
+
+def to_parquet_frame(df):
+    # the same type for every column of every part: nullable strings (missing values stay missing, like in a csv)
+    df = df.astype('string')
+    for col in categorical_columns:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    return df
+
+
+def append(output_file, df, intermediate_format='csv'):
+    # df must already have the columns of the interactome file
+    if intermediate_format == 'parquet':
+        parquet_folder = get_parquet_folder(output_file)
+        part_number = len([part for part in os.listdir(parquet_folder) if part.endswith('.parquet')])
+        part_file = os.path.join(parquet_folder, 'part-' + str(part_number).zfill(5) + '.parquet')
+        to_parquet_frame(df).to_parquet(part_file, index=False)
+    else:
+        df.to_csv(output_file, mode='a', index=False, header=False)
+
+
+def from_parquet_frame(df):
+    # back to plain columns, missing values as NaN like with a csv: the cleaning modifies them, and grouping on
+    # categorical columns is not what we want
+    return df.astype(object).where(df.notna(), np.nan)
+
+
+def encode_proteins(prot1, prot2):
+    # the accessions of prot1 and prot2 dictionary-encoded with the same dictionary: int32 codes given in the
+    # alphanumerical order of the accessions (comparing or sorting the codes is comparing or sorting the accessions).
+    # Returns the codes of prot1, the codes of prot2 and the accessions (accessions.take(codes) gives them back)
+    codes, accessions = pd.factorize(np.concatenate([np.asarray(prot1, dtype=object), np.asarray(prot2, dtype=object)]),
+                                     sort=True)
+    codes = codes.astype(np.int32)
+    return codes[:len(prot1)], codes[len(prot1):], accessions
+
+
+def get_parquet_parts(output_file):
+    parquet_folder = get_parquet_folder(output_file)
+    return [os.path.join(parquet_folder, part) for part in sorted(os.listdir(parquet_folder)) if part.endswith('.parquet')]
+
+
+def read(output_file, intermediate_format='csv'):
+    if intermediate_format == 'parquet':
+        df = pd.concat([pd.read_parquet(part) for part in get_parquet_parts(output_file)], ignore_index=True)
+        return from_parquet_frame(df)
+    return pd.read_csv(output_file)
+
+
+def read_chunks(output_file, intermediate_format='csv', chunk_size=500000):
+    # the interactome file, chunk_size rows at a time (in parquet, one part at a time), so that it never has to fit in
+    # memory at once
+    if intermediate_format == 'parquet':
+        for part in get_parquet_parts(output_file):
+            df = pd.read_parquet(part)
+            if df.shape[0] != 0:
+                yield from_parquet_frame(df)
+    else:
+        yield from pd.read_csv(output_file, chunksize=chunk_size, dtype=str)  # a chunk can have a column of NaN only
+
+
+def replace(source_file, output_file, intermediate_format='csv'):
+    # the interactome file (or folder) source_file becomes output_file
+    if intermediate_format == 'parquet':
+        if os.path.isdir(get_parquet_folder(output_file)):
+            shutil.rmtree(get_parquet_folder(output_file))
+        os.replace(get_parquet_folder(source_file), get_parquet_folder(output_file))
+    else:
+        os.replace(source_file, output_file)
+
+
+def write(output_file, df, intermediate_format='csv'):
+    # replaces the whole interactome file by df
+    if intermediate_format == 'parquet':
+        create(output_file, df.columns, intermediate_format)
+        append(output_file, df, intermediate_format)
+    else:
+        df.to_csv(output_file, index=False)
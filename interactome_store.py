@@ -0,0 +1,145 @@
+# Author: Lunelys RUNESHAW <lunelys.runeshaw@etudiant.univ-rennes.fr>
+#
+# This script is writing the final interactome (interactome_[query]_[species]_[format]_no_redundancies.csv) into an
+# indexed sqlite file next to it (interactome_[query]_[species]_[format]_no_redundancies.sqlite), so that the usual
+# lookups do not have to read the whole csv: the partners of a protein, the experimental evidences of a pair of
+# proteins, of a gene, of a publication or of an interaction detection method (IDM). The store is opened in read-only
+# mode by the lookups, so several programs can query it at the same time.
+# It can also be used in command line, e.g.:
+# python3 interactome_store.py interactome_all_559292_tab27_no_redundancies.sqlite partners P30771
+# (see the end of this script for the other lookups)
+
+import os
+import re
+import sys
+import time
+import sqlite3
+import argparse
+from urllib.request import pathname2url
+import pandas as pd
+
+re_mi = re.compile(r'MI:\d{4}')
+indexed_columns = ['prot1', 'prot2', 'gene1', 'gene2', 'pub_id', 'idm']
+
+
+def connect(store_file):
+    # read-only connection: the store is never modified once written, and readers never lock each other
+    if not os.path.isfile(store_file):
+        raise FileNotFoundError('No interactome store ' + store_file + ' (see export_sqlite in main.py)')
+    return sqlite3.connect('file:' + pathname2url(os.path.abspath(store_file)) + '?mode=ro', uri=True)
+
+
+def select(store_file, where, values):
+    # the experimental evidences of the store matching the where clause, in the order of the csv file
+    connection = connect(store_file)
+    try:
+        return pd.read_sql_query('SELECT * FROM interactions WHERE ' + where + ' ORDER BY rowid', connection,
+                                 params=values)
+    finally:
+        connection.close()
+
+
+def create_tables(connection, columns):
+    # the columns of the csv file (the counts as integers), and the IDMs of each row in their own table, as a merged
+    # row can have several IDMs (psi-mi:"MI:0018"(two hybrid)|psi-mi:"MI:0397"(two hybrid array))
+    connection.execute('CREATE TABLE interactions (' + ', '.join(
+        '"' + col + '" ' + ('INTEGER' if col.startswith('count_') else 'TEXT') for col in columns) + ')')
+    connection.execute('CREATE TABLE interaction_methods (interaction INTEGER, mi TEXT)')
+
+
+def create_indexes(connection, columns):
+    # created once all the rows are inserted, which is much faster than updating them at each insert
+    for col in indexed_columns:
+        if col in columns:
+            connection.execute('CREATE INDEX interactions_' + col + ' ON interactions ("' + col + '")')
+    connection.execute('CREATE INDEX interactions_pair ON interactions (prot1, prot2)')
+    connection.execute('CREATE INDEX interaction_methods_mi ON interaction_methods (mi)')
+
+
+# -----------------------------------------------------
+
+
+def get_store_file(output_file):
+    return output_file[:-4] + '_no_redundancies.sqlite'
+
+
+def export(no_redundancies_file, store_file, chunk_size=500000):
+    # writes the final csv file into the store, chunk_size rows at a time. The store is written next to the previous
+    # one and then renamed, so the readers never see half a store
+    print('Writing the interactome store ' + store_file)
+    columns = list(pd.read_csv(no_redundancies_file, nrows=0).columns)
+    store_tmp_file = store_file + '.tmp'
+    if os.path.exists(store_tmp_file):
+        os.remove(store_tmp_file)
+    connection = sqlite3.connect(store_tmp_file)
+    connection.execute('PRAGMA journal_mode = OFF')  # a crash only loses the temporary file
+    connection.execute('PRAGMA synchronous = OFF')
+    connection.execute('PRAGMA cache_size = -262144')  # 256 MB, for the creation of the indexes
+    create_tables(connection, columns)
+    insert = 'INSERT INTO interactions VALUES (' + ', '.join('?' * len(columns)) + ')'
+    rows = 0
+    for df in pd.read_csv(no_redundancies_file, chunksize=chunk_size, dtype=str):
+        # the rows of a new table get the rowids 1, 2, 3... in their order of insertion
+        rowids = range(rows + 1, rows + df.shape[0] + 1)
+        df = df.astype(object).where(df.notna(), None)
+        connection.executemany(insert, df.itertuples(index=False, name=None))
+        methods = pd.Series(df['idm'].fillna('').str.findall(re_mi).to_numpy(), index=rowids).explode().dropna()
+        connection.executemany('INSERT INTO interaction_methods VALUES (?, ?)',
+                               zip(methods.index.tolist(), methods.tolist()))
+        rows += df.shape[0]
+    create_indexes(connection, columns)
+    connection.commit()
+    connection.close()
+    os.replace(store_tmp_file, store_file)
+    print('Number of experimental evidences in the interactome store: ' + str(rows))
+    return store_file
+
+
+def get_partners(store_file, protein):
+    # the experimental evidences of a protein (uniprotkb accession), whatever its side
+    return select(store_file, 'prot1 = ? OR prot2 = ?', [protein, protein])
+
+
+def get_pair(store_file, protein1, protein2):
+    # prot1 is always alphanumerically inferior to prot2 in the interactome (see cleaning_data.py)
+    return select(store_file, 'prot1 = ? AND prot2 = ?', sorted([protein1, protein2]))
+
+
+def get_gene(store_file, gene):
+    return select(store_file, 'gene1 = ? OR gene2 = ?', [gene, gene])
+
+
+def get_publication(store_file, pub_id):
+    # 'pubmed:10000711' or '10000711'
+    if ':' not in pub_id:
+        pub_id = 'pubmed:' + pub_id
+    return select(store_file, 'pub_id = ?', [pub_id])
+
+
+def get_method(store_file, mi):
+    # the experimental evidences with this IDM ('MI:0018' or '0018'), alone or merged with other ones
+    if not mi.startswith('MI:'):
+        mi = 'MI:' + mi
+    return select(store_file, 'rowid IN (SELECT interaction FROM interaction_methods WHERE mi = ?)', [mi])
+
+
+lookups = {'partners': (get_partners, ['protein']), 'pair': (get_pair, ['protein1', 'protein2']),
+           'gene': (get_gene, ['gene']), 'publication': (get_publication, ['pub_id']),
+           'method': (get_method, ['mi'])}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Lookups in an interactome store (see export_sqlite in main.py)')
+    parser.add_argument('store_file', help='interactome_[query]_[species]_[format]_no_redundancies.sqlite')
+    subparsers = parser.add_subparsers(dest='lookup', required=True)
+    for lookup_name, (lookup, arguments) in lookups.items():
+        subparser = subparsers.add_parser(lookup_name, help=lookup_name + ' of ' + ', '.join(arguments))
+        for argument in arguments:
+            subparser.add_argument(argument)
+    args = parser.parse_args()
+    lookup, arguments = lookups[args.lookup]
+    start = time.perf_counter()
+    result = lookup(args.store_file, *[getattr(args, argument) for argument in arguments])
+    elapsed = time.perf_counter() - start
+    result.to_csv(sys.stdout, index=False)
+    print(str(result.shape[0]) + ' experimental evidences (' + str(round(elapsed * 1000, 1)) + ' ms)', file=sys.stderr)
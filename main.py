@@ -2,7 +2,14 @@
 #
 # This is a wrapper file. It is also here that the parameters the user can modify are. There is no reason for
 # the user to change anything else than the parameters, or anywhere else than in this script, apart from the BioGRID API key in the biogrid_fetching.py script, line 84
-# The parameters (taxids, query, max_result, format, molecular_interaction, psicquic_db_to_use, mi_fetch_descendants, mi_to_exclude, keep_raw) specify the query
+# The parameters (taxids, query, max_result, biogrid_max_workers, format, molecular_interaction, psicquic_db_to_use, psicquic_max_workers, psicquic_page_size, uniprot_use_stream, taxid_max_workers, clean_while_fetching, mi_fetch_descendants, mi_to_exclude, mi_ontology_file, ols_cache_ttl_days, intermediate_format, chunk_size, partitions, partition_max_workers, keep_raw, incremental, export_sqlite, export_graph) specify the query
+# They can also be given in command line (python3 main.py --taxids 559292 --chunk-size 500000), or in a json file
+# (python3 main.py --config config.json), instead of modifying them here. The pipeline can be run all at once
+# (python3 main.py, or python3 main.py run) or one stage at a time: fetch, clean, dedupe (removing the redundancies),
+# export (sqlite and graph), and status (what was done for the interactome of the parameters). python3 main.py --help
+# for the details.
+# The modules of the stages (and pandas, numpy, requests...) are only imported by the stage that needs them, so that
+# --help and status answer at once.
 # FIRST RUN:
 # You need to fetch your own BioGRID API key at https://webservice.thebiogrid.org/, and modify line 84 (params['accesskey']) of the biogrid_fetching.py script with that key!
 # Consult the documentation for more information
@@ -10,44 +17,72 @@
 import os
 import sys
 import csv
+import json
+import time
+import hashlib
+import argparse
 import datetime
-import biogrid_fetching
-import psicquic_fetching
-import uniprotkb_mapping
-import cleaning_data
-import removing_redundancies
+import run_report
 
 # ========================== THE CODE SHOULD ONLY BE MODIFIED AT THIS LOCATION =======================================
 
 taxids = ['4932', '559292', '580240']  # taxids = ['559292'] if you want only for one species or several. ['*'] if you want all species
-query = None  # query = 'NAM7' if you want only for one protein. None if you want everything
+query = None  # query = 'NAM7' if you want only for one protein, ['NAM7', 'YMR080C', 'P30771'] for a panel. None if you want everything
 # max_result must be < 10000 if you want to download a specific number of interactions
 max_result = None  # None = download everything
+biogrid_max_workers = 4  # number of BioGRID pages (of 10000 interactions) fetched at the same time
 format = 'tab27'  # if you use tab25, the protein-protein tag will still retrieve some other interactions
 molecular_interaction = 'protein-protein'  # if you want everything, put None here. Tested only with prot-prot for the moment
 # add here the db you want psicquic to fetch, all in lowercase. Be mindful to the orthographe
 # iRefIndex eliminated by default + if you are in tab27, BioGrid is eliminated by default
 psicquic_db_to_use = 'all'  # 'all' = query all active services, ['mint'] if you want only one db or several
+psicquic_max_workers = 4  # number of PSICQUIC services fetched at the same time. 1 = one service after another
+psicquic_page_size = 50000  # experimental evidences downloaded per request to a PSICQUIC service. None = all at once
+uniprot_use_stream = True  # True = the geneID mapping is downloaded in one compressed transfer, False = page by page
+taxid_max_workers = 1  # number of taxids fetched at the same time (in separate processes). 1 = one taxid after another
+clean_while_fetching = False  # True = each fetched page is cleaned while the next ones are downloaded (see stream_cleaning.py)
 # add here the MI IDM you want to eliminate from the beginning:
 mi_fetch_descendants = ['MI:0063', 'MI:0362', 'MI:1088']  # themselves + their descendants will be automatically added to mi_to_exclude
 mi_to_exclude = ['MI:0000', 'MI:0001', 'MI:0686', 'MI:0045']
 # MI:0000(molecular interaction), MI:0001(interaction detection method)
 # MI:0686(unspecified method), MI:0045(experimental interaction detection)
 # MI:0063(interaction prediction), MI:0362(inference), MI:1088(phenotype-based detection assay)
+# local copy of the PSI-MI ontology (OBO file) to compute the ancestors/descendants of the IDMs without the OLS API:
+mi_ontology_file = None  # None = use the OLS API. 'psi-mi.obo' if you downloaded it next to the scripts
+ols_cache_ttl_days = 30  # the OLS API answers are cached in cache/ols_cache.json for this many days. 0 = refresh
+intermediate_format = 'csv'  # 'csv' or 'parquet' (needs the pyarrow module) for the files between the steps
+chunk_size = None  # None = the interactome is cleaned all at once. 500000 = cleaned 500000 experimental evidences at a time
+partitions = None  # None = the redundancies are removed all at once. 64 = in 64 on-disk shards, one after another
+partition_max_workers = 1  # number of shards processed at the same time (in separate processes)
 keep_raw = False  # False if you want only the interactome file cleaned, True if you want to have an additional file raw with all the data before the cleaning
+incremental = False  # True = on a rerun, fetch, clean and merge again only the sources that changed since the last run
+export_sqlite = True  # True = the final interactome is also written in an indexed sqlite file, for fast lookups (see interactome_store.py)
+export_graph = True  # True = the final interactome is also written as a graph of memory-mappable numpy files, for network tools (see interactome_graph.py)
 
 # ========================== ************************************************ =========================================
 
+parameter_names = ['taxids', 'query', 'max_result', 'biogrid_max_workers', 'format', 'molecular_interaction',
+                   'psicquic_db_to_use', 'psicquic_max_workers', 'psicquic_page_size', 'uniprot_use_stream',
+                   'taxid_max_workers', 'clean_while_fetching', 'mi_fetch_descendants', 'mi_to_exclude',
+                   'mi_ontology_file', 'ols_cache_ttl_days', 'intermediate_format', 'chunk_size', 'partitions',
+                   'partition_max_workers', 'keep_raw', 'incremental', 'export_sqlite', 'export_graph']
+# the parameters given as several values in command line (--taxids 4932 559292). query and psicquic_db_to_use are a
+# string when there is only one value (--query NAM7, --psicquic-db-to-use all)
+list_parameters = ['taxids', 'query', 'psicquic_db_to_use', 'mi_fetch_descendants', 'mi_to_exclude']
+stage_names = ['fetch', 'clean', 'dedupe', 'export']  # in the order of the pipeline
 
-def file_handler(taxids, query, max_result, format):
-    tab27_headers = ['prot1', 'prot2', 'gene1', 'gene2', 'idm', 'authors', 'pub_id', 'species1', 'species2',
-                     'interaction_type', 'source_databases', 'interaction_identifiers', 'confidence_score',
-                     'biological_role1', 'biological_role2', 'exp_role1', 'exp_role2', 'interactor_type1',
-                     'interactor_type2', 'taxid_host', 'participant_id_method1', 'participant_id_method2',
-                     'service_name', 'biogrid_experimental_system', 'biogrid_description', 'biogrid_type', 'throughput']
-    tab25_headers = ['prot1', 'prot2', 'gene1', 'gene2', 'idm', 'authors', 'pub_id', 'species1', 'species2',
-                     'interaction_type', 'source_databases', 'interaction_identifiers', 'confidence_score',
-                     'service_name']
+
+def get_query_name(query):
+    # just for the filename: the gene, or for a panel (list of genes) its size and a short hash of its genes
+    if isinstance(query, str):
+        return query
+    if len(query) == 1:
+        return query[0]
+    return 'panel' + str(len(query)) + '_' + hashlib.sha1('|'.join(query).encode()).hexdigest()[:8]
+
+
+def get_interactome_file(taxids, query, max_result, format):
+    # the name of the interactome file, without creating it
     if taxids == ['*']:
         taxids = 'ALL_SPECIES'  # just for the filename
     elif len(taxids) > 1:
@@ -55,46 +90,423 @@ def file_handler(taxids, query, max_result, format):
     else:  # there is only one species in the list, we can use it in the filename
         taxids = taxids[0]
     if query is None and max_result is None:
-        interactome_filename = 'interactome_all_' + taxids + '_' + format + '.csv'
+        return 'interactome_all_' + taxids + '_' + format + '.csv'
+    if query is None:
+        return 'interactome_' + taxids + '_' + format + '.csv'
+    return 'interactome_' + get_query_name(query) + '_' + taxids + '_' + format + '.csv'
+
+
+def file_handler(taxids, query, max_result, format, intermediate_format):
+    import interactome_io
+    interactome_filename = get_interactome_file(taxids, query, max_result, format)
+    if format == 'tab25':
+        headers = interactome_io.tab25_headers
+    elif format == 'tab27':
+        headers = interactome_io.tab27_headers
     else:
-        if query is None:
-            interactome_filename = 'interactome_' + taxids + '_' + format + '.csv'
-        else:
-            interactome_filename = 'interactome_' + query + '_' + taxids + '_' + format + '.csv'
+        sys.exit('The input format is wrong. Use "tab25" or "tab27"')
     if os.path.exists(interactome_filename) and os.path.isfile(interactome_filename):
         os.remove(interactome_filename)
         print(interactome_filename + ' deleted')
     else:
         print(interactome_filename + ' not found, is created')
-    with open(interactome_filename, mode='w') as interactome_file:
-        psicquic_writer = csv.writer(interactome_file, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-        if format == 'tab25':
-            headers = tab25_headers
-        elif format == 'tab27':
-            headers = tab27_headers
-        else:
-            sys.exit('The input format is wrong. Use "tab25" or "tab27"')
-        psicquic_writer.writerow(headers)
+    interactome_io.create(interactome_filename, headers, intermediate_format)
     dropped_filename = interactome_filename.replace('interactome', 'dropped')
     with open(dropped_filename, mode='w') as dropped_file:
         dropped_writer = csv.writer(dropped_file, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-        dropped_writer.writerow(headers)
+        dropped_writer.writerow(headers + ['reason'])  # the reason of the drop, see cleaning_data.py
     return interactome_filename
 
 
-print("Starting pipeline: " + datetime.datetime.now().strftime("%d/%m/%Y, %H:%M:%S"))
-output_file = file_handler(taxids, query, max_result, format)
-geneid_dict = {}
-for taxid in taxids:
-    if format == 'tab27':
-        print("Starting to fetch BioGRID data for taxid " + taxid + ": " + datetime.datetime.now().strftime("%d/%m/%Y, %H:%M:%S"))
-        biogrid_fetching.fetching(output_file, taxid, query, max_result, molecular_interaction)
-    print("Starting to fetch PSICQUIC data for taxid " + taxid + ": " + datetime.datetime.now().strftime("%d/%m/%Y, %H:%M:%S"))
-    psicquic_fetching.fetching(output_file, taxid, query, max_result, format, molecular_interaction, psicquic_db_to_use)
-    print("Starting to fetch mapping data for taxid " + taxid + ": " + datetime.datetime.now().strftime("%d/%m/%Y, %H:%M:%S"))
-    geneid_dict = geneid_dict | uniprotkb_mapping.mapping(taxid)  # to merge the dictionaries
-print("Starting to clean data: " + datetime.datetime.now().strftime("%d/%m/%Y, %H:%M:%S"))
-mi_ancestors = cleaning_data.cleaning(output_file, format, molecular_interaction, geneid_dict, mi_fetch_descendants, mi_to_exclude, keep_raw)
-print("Starting to remove redundancies: " + datetime.datetime.now().strftime("%d/%m/%Y, %H:%M:%S"))
-removing_redundancies.removing(output_file, mi_ancestors)
-print("End pipeline: " + datetime.datetime.now().strftime("%d/%m/%Y, %H:%M:%S"))
+def get_stages_file(output_file):
+    return os.path.join('cache', 'stages', os.path.basename(output_file)[:-4] + '.json')
+
+
+def load_stages(output_file):
+    # the stages already run for this interactome: {'fetch': {'date': ..., 'wall_time_s': ...}, 'clean': {...}...}
+    stages_file = get_stages_file(output_file)
+    if not os.path.exists(stages_file):
+        return {}
+    with open(stages_file) as stages_json:
+        return json.load(stages_json)
+
+
+def save_stage(output_file, stage_name, started, **values):
+    # started: time.perf_counter() at the start of the stage. A stage that is run again makes the next ones out of
+    # date: they are forgotten
+    stages = load_stages(output_file)
+    for next_stage_name in stage_names[stage_names.index(stage_name):]:
+        stages.pop(next_stage_name, None)
+    stages[stage_name] = {'date': datetime.datetime.now().strftime("%d/%m/%Y, %H:%M:%S"),
+                          'wall_time_s': round(time.perf_counter() - started, 3), **values}
+    stages_file = get_stages_file(output_file)
+    os.makedirs(os.path.dirname(stages_file), exist_ok=True)
+    with open(stages_file + '.tmp', 'w') as stages_json:
+        json.dump(stages, stages_json, indent=1)
+    os.replace(stages_file + '.tmp', stages_file)
+
+
+def require_stage(output_file, stage_name, next_stage_name):
+    if stage_name not in load_stages(output_file):
+        sys.exit('No ' + stage_name + ' stage recorded for ' + output_file + ': run "python3 main.py ' + stage_name
+                 + '" (with the same parameters) before "python3 main.py ' + next_stage_name + '"')
+
+
+def get_mi_ancestors(output_file, parameters):
+    # the ancestors of the IDMs of the cleaned interactome: kept by the clean stage, or found again in the file (after
+    # an incremental run)
+    mi_ancestors = load_stages(output_file)['clean'].get('mi_ancestors')
+    if mi_ancestors is not None:
+        return mi_ancestors
+    import interactome_io
+    import cleaning_data
+    idm_list = []
+    for df in interactome_io.read_chunks(output_file, parameters['intermediate_format'],
+                                         parameters['chunk_size'] or 500000):
+        for idm in df['idm'].dropna().unique():
+            cleaning_data.get_mi_idm_list(idm, idm_list)
+    return cleaning_data.get_psicquic_query_ancestors(idm_list, parameters['mi_ontology_file'],
+                                                      parameters['ols_cache_ttl_days'])[0]
+
+
+def fetch_and_clean(output_file, parameters, started):
+    # the fetched pages are cleaned while the next ones are downloaded (see stream_cleaning.py): the mapping data is
+    # fetched first, and the taxids one after another. Returns the ancestors of the IDMs of the interactome
+    import taxid_fetching
+    import stream_cleaning
+    if parameters['taxid_max_workers'] > 1:
+        print('clean_while_fetching = True: the taxids are fetched one after another')
+    with run_report.stage('fetching'):
+        geneid_map_file = taxid_fetching.fetch_mappings(output_file, parameters['taxids'],
+                                                        parameters['uniprot_use_stream'])
+        stream_cleaning.start(output_file, parameters['format'], parameters['molecular_interaction'], geneid_map_file,
+                              list(parameters['mi_fetch_descendants']), list(parameters['mi_to_exclude']),
+                              parameters['keep_raw'], parameters['mi_ontology_file'],
+                              parameters['ols_cache_ttl_days'], parameters['intermediate_format'],
+                              parameters['chunk_size'])
+        try:
+            taxid_fetching.fetching(output_file, parameters['taxids'], parameters['format'] == 'tab27',
+                                    parameters['psicquic_db_to_use'], parameters['query'], parameters['max_result'],
+                                    parameters['format'], parameters['molecular_interaction'],
+                                    parameters['biogrid_max_workers'], parameters['psicquic_max_workers'],
+                                    parameters['psicquic_page_size'], parameters['uniprot_use_stream'],
+                                    parameters['intermediate_format'], 1, with_mapping=False)
+        except BaseException:
+            stream_cleaning.stop(output_file, discard=True)
+            raise
+        print("Waiting for the cleaning of the last pages: " + datetime.datetime.now().strftime("%d/%m/%Y, %H:%M:%S"))
+        mi_ancestors = stream_cleaning.stop(output_file)
+    # the rows dropped by the fetching and by the cleaning are mixed in the dropped file: no dropped_size
+    save_stage(output_file, 'fetch', started)
+    save_stage(output_file, 'clean', started, mi_ancestors=mi_ancestors)
+    return mi_ancestors
+
+
+def fetch(parameters):
+    # creates the interactome file and fills it with everything that is fetched (and cleaned, with
+    # clean_while_fetching). Returns its name
+    import taxid_fetching
+    started = time.perf_counter()
+    output_file = file_handler(parameters['taxids'], parameters['query'], parameters['max_result'],
+                               parameters['format'], parameters['intermediate_format'])
+    if parameters['clean_while_fetching']:
+        fetch_and_clean(output_file, parameters, started)
+        return output_file
+    with run_report.stage('fetching'):
+        taxid_fetching.fetching(output_file, parameters['taxids'], parameters['format'] == 'tab27',
+                                parameters['psicquic_db_to_use'], parameters['query'], parameters['max_result'],
+                                parameters['format'], parameters['molecular_interaction'],
+                                parameters['biogrid_max_workers'], parameters['psicquic_max_workers'],
+                                parameters['psicquic_page_size'], parameters['uniprot_use_stream'],
+                                parameters['intermediate_format'], parameters['taxid_max_workers'])
+    # the size of the dropped file once fetched: the rows dropped by a previous cleaning are cut from it when the
+    # interactome is cleaned again
+    save_stage(output_file, 'fetch', started,
+               dropped_size=os.path.getsize(output_file.replace('interactome', 'dropped')))
+    return output_file
+
+
+def restore_fetched(output_file, parameters):
+    # to clean again an interactome already cleaned: its raw file (see keep_raw) is what was fetched
+    import interactome_io
+    raw_file = output_file[:-4] + '_raw' + output_file[-4:]
+    if not os.path.exists(raw_file):
+        sys.exit(output_file + ' is already cleaned: run "python3 main.py fetch" again, or set keep_raw = True to be '
+                 'able to clean it again without fetching it')
+    print('Cleaning again what was fetched, from ' + raw_file)
+    interactome_io.create(output_file, interactome_io.get_headers(parameters['format']),
+                          parameters['intermediate_format'])
+    for df in interactome_io.read_chunks(raw_file, 'csv', parameters['chunk_size'] or 500000):
+        interactome_io.append(output_file, df, parameters['intermediate_format'])
+    dropped_size = load_stages(output_file)['fetch'].get('dropped_size')
+    if dropped_size is not None:  # not known after an incremental run
+        os.truncate(output_file.replace('interactome', 'dropped'), dropped_size)
+
+
+def clean(output_file, parameters):
+    import cleaning_data
+    import uniprotkb_mapping
+    require_stage(output_file, 'fetch', 'clean')
+    started = time.perf_counter()
+    if 'clean' in load_stages(output_file):
+        restore_fetched(output_file, parameters)
+    print("Starting to clean data: " + datetime.datetime.now().strftime("%d/%m/%Y, %H:%M:%S"))
+    with run_report.stage('cleaning'):
+        mi_ancestors = cleaning_data.cleaning(output_file, parameters['format'], parameters['molecular_interaction'],
+                                              uniprotkb_mapping.get_geneid_map_file(output_file),
+                                              list(parameters['mi_fetch_descendants']),
+                                              list(parameters['mi_to_exclude']), parameters['keep_raw'],
+                                              parameters['mi_ontology_file'], parameters['ols_cache_ttl_days'],
+                                              parameters['intermediate_format'], parameters['chunk_size'])
+    save_stage(output_file, 'clean', started, mi_ancestors=mi_ancestors)
+    return mi_ancestors
+
+
+def dedupe(output_file, parameters):
+    import removing_redundancies
+    require_stage(output_file, 'clean', 'dedupe')
+    started = time.perf_counter()
+    mi_ancestors = get_mi_ancestors(output_file, parameters)
+    print("Starting to remove redundancies: " + datetime.datetime.now().strftime("%d/%m/%Y, %H:%M:%S"))
+    with run_report.stage('removing_redundancies'):
+        removing_redundancies.removing(output_file, mi_ancestors, parameters['intermediate_format'],
+                                       parameters['partitions'], parameters['partition_max_workers'],
+                                       parameters['chunk_size'] or 500000)
+    save_stage(output_file, 'dedupe', started)
+
+
+def export(output_file, parameters):
+    # the sqlite store and the graph of the final interactome, if export_sqlite / export_graph
+    import removing_redundancies
+    require_stage(output_file, 'dedupe', 'export')
+    started = time.perf_counter()
+    no_redundancies_file = removing_redundancies.get_no_redundancies_file(output_file)
+    if parameters['export_sqlite']:
+        import interactome_store
+        print("Starting to export the interactome store: " + datetime.datetime.now().strftime("%d/%m/%Y, %H:%M:%S"))
+        with run_report.stage('export_sqlite'):
+            interactome_store.export(no_redundancies_file, interactome_store.get_store_file(output_file),
+                                     parameters['chunk_size'] or 500000)
+    if parameters['export_graph']:
+        import interactome_graph
+        print("Starting to export the interactome graph: " + datetime.datetime.now().strftime("%d/%m/%Y, %H:%M:%S"))
+        with run_report.stage('export_graph'):
+            interactome_graph.export(no_redundancies_file, interactome_graph.get_graph_folder(output_file))
+    save_stage(output_file, 'export', started, export_sqlite=parameters['export_sqlite'],
+               export_graph=parameters['export_graph'])
+
+
+def pipeline(taxids, query, max_result, biogrid_max_workers, format, molecular_interaction, psicquic_db_to_use,
+             psicquic_max_workers, psicquic_page_size, uniprot_use_stream, taxid_max_workers, clean_while_fetching,
+             mi_fetch_descendants, mi_to_exclude, mi_ontology_file, ols_cache_ttl_days, intermediate_format,
+             chunk_size, partitions, partition_max_workers, keep_raw, incremental, export_sqlite, export_graph):
+    # the whole pipeline, with the parameters of the top of this script (or other ones, see benchmark.py)
+    parameters = {'taxids': taxids, 'query': query, 'max_result': max_result,
+                  'biogrid_max_workers': biogrid_max_workers, 'format': format,
+                  'molecular_interaction': molecular_interaction, 'psicquic_db_to_use': psicquic_db_to_use,
+                  'psicquic_max_workers': psicquic_max_workers, 'psicquic_page_size': psicquic_page_size,
+                  'uniprot_use_stream': uniprot_use_stream, 'taxid_max_workers': taxid_max_workers,
+                  'clean_while_fetching': clean_while_fetching,
+                  'mi_fetch_descendants': mi_fetch_descendants, 'mi_to_exclude': mi_to_exclude,
+                  'mi_ontology_file': mi_ontology_file, 'ols_cache_ttl_days': ols_cache_ttl_days,
+                  'intermediate_format': intermediate_format, 'chunk_size': chunk_size, 'partitions': partitions,
+                  'partition_max_workers': partition_max_workers, 'keep_raw': keep_raw, 'incremental': incremental,
+                  'export_sqlite': export_sqlite, 'export_graph': export_graph}
+    print("Starting pipeline: " + datetime.datetime.now().strftime("%d/%m/%Y, %H:%M:%S"))
+    run_report.reset()
+    if incremental:
+        output_file = incremental_pipeline(parameters)
+    else:
+        output_file = fetch(parameters)
+        if not clean_while_fetching:
+            clean(output_file, parameters)
+        dedupe(output_file, parameters)
+    if export_sqlite or export_graph:
+        export(output_file, parameters)
+    run_report.write(output_file, {'taxids': taxids, 'query': query, 'max_result': max_result, 'format': format,
+                                   'molecular_interaction': molecular_interaction,
+                                   'psicquic_db_to_use': psicquic_db_to_use, 'intermediate_format': intermediate_format,
+                                   'chunk_size': chunk_size, 'partitions': partitions,
+                                   'taxid_max_workers': taxid_max_workers,
+                                   'clean_while_fetching': clean_while_fetching, 'incremental': incremental,
+                                   'export_sqlite': export_sqlite, 'export_graph': export_graph})
+    print("End pipeline: " + datetime.datetime.now().strftime("%d/%m/%Y, %H:%M:%S"))
+    return output_file
+
+
+def incremental_pipeline(parameters):
+    # fetches, cleans and merges again only the sources that changed since the last run (see incremental_rebuild.py).
+    # The fetched sources are kept before their cleaning: clean_while_fetching is not used
+    import taxid_fetching
+    import incremental_rebuild
+    started = time.perf_counter()
+    taxids, query, max_result, format = (parameters['taxids'], parameters['query'], parameters['max_result'],
+                                         parameters['format'])
+    output_file = file_handler(taxids, query, max_result, format, parameters['intermediate_format'])
+    fetch_config = {'taxids': taxids, 'query': query, 'max_result': max_result, 'format': format,
+                    'molecular_interaction': parameters['molecular_interaction']}
+    clean_config = {'mi_fetch_descendants': list(parameters['mi_fetch_descendants']),
+                    'mi_to_exclude': list(parameters['mi_to_exclude']),
+                    'mi_ontology_file': parameters['mi_ontology_file'],
+                    'intermediate_format': parameters['intermediate_format']}
+    with run_report.stage('incremental_fingerprints'):
+        fingerprints = incremental_rebuild.get_fingerprints(taxids, query, max_result, format,
+                                                            parameters['molecular_interaction'],
+                                                            parameters['psicquic_db_to_use'])
+    fetched_services, rebuilt_services, full_rebuild = incremental_rebuild.get_changes(output_file, fingerprints,
+                                                                                       fetch_config, clean_config)
+    fetch_biogrid = format == 'tab27' and 'BioGrid' in fetched_services
+    psicquic_to_fetch = [service_name.lower() for service_name in fetched_services
+                         if not (format == 'tab27' and service_name == 'BioGrid')]
+    with run_report.stage('fetching'):
+        geneid_map_file = taxid_fetching.fetching(output_file, taxids, fetch_biogrid, psicquic_to_fetch, query,
+                                                  max_result, format, parameters['molecular_interaction'],
+                                                  parameters['biogrid_max_workers'],
+                                                  parameters['psicquic_max_workers'],
+                                                  parameters['psicquic_page_size'],
+                                                  parameters['uniprot_use_stream'],
+                                                  parameters['intermediate_format'],
+                                                  parameters['taxid_max_workers'])
+    print("Starting to clean data and remove redundancies: " + datetime.datetime.now().strftime("%d/%m/%Y, %H:%M:%S"))
+    with run_report.stage('incremental_rebuild'):
+        incremental_rebuild.rebuild(output_file, fetched_services, rebuilt_services, full_rebuild, fingerprints,
+                                    fetch_config, clean_config, format, parameters['molecular_interaction'],
+                                    geneid_map_file, parameters['mi_fetch_descendants'], parameters['mi_to_exclude'],
+                                    parameters['keep_raw'], parameters['mi_ontology_file'],
+                                    parameters['ols_cache_ttl_days'], parameters['intermediate_format'],
+                                    parameters['chunk_size'], parameters['partitions'],
+                                    parameters['partition_max_workers'])
+    for stage_name in ['fetch', 'clean', 'dedupe']:
+        save_stage(output_file, stage_name, started)
+    return output_file
+
+
+def get_size(path):
+    # in MB, for a file or a folder
+    if os.path.isdir(path):
+        size = sum(os.path.getsize(os.path.join(folder, file)) for folder, _, files in os.walk(path) for file in files)
+    else:
+        size = os.path.getsize(path)
+    return round(size / 1024 ** 2, 1)
+
+
+def status(output_file):
+    # what was done for the interactome of the parameters, without importing anything heavy
+    print('Interactome: ' + output_file)
+    stages = load_stages(output_file)
+    for stage_name in stage_names:
+        if stage_name in stages:
+            print('  ' + stage_name + ': done ' + stages[stage_name]['date'] + ' (' +
+                  str(stages[stage_name]['wall_time_s']) + ' s)')
+        else:
+            print('  ' + stage_name + ': not done')
+    # the names of the output files (see interactome_io.py, removing_redundancies.py, interactome_store.py,
+    # interactome_graph.py and run_report.py)
+    no_redundancies_file = output_file[:-4] + '_no_redundancies.csv'
+    output_files = [output_file, output_file[:-4] + '_parquet', output_file.replace('interactome', 'dropped'),
+                    output_file[:-4] + '_raw.csv', no_redundancies_file, no_redundancies_file[:-4] + '.sqlite',
+                    output_file[:-4] + '_graph', run_report.get_report_file(output_file)]
+    for path in output_files:
+        if os.path.exists(path):
+            print('  ' + path + ': ' + str(get_size(path)) + ' MB, modified ' +
+                  datetime.datetime.fromtimestamp(os.path.getmtime(path)).strftime("%d/%m/%Y, %H:%M:%S"))
+    manifest_file = os.path.join('cache', 'checkpoints', os.path.basename(output_file)[:-4], 'manifest.json')
+    if os.path.exists(manifest_file):
+        with open(manifest_file) as manifest:
+            print('  fetch interrupted: ' + str(len(json.load(manifest))) + ' pages already downloaded in ' +
+                  os.path.dirname(manifest_file) + ' (run fetch again to resume)')
+
+
+def get_value(text):
+    # a value of the command line: None, True, False, an integer, or a string
+    if text in ('None', 'True', 'False'):
+        return {'None': None, 'True': True, 'False': False}[text]
+    try:
+        return int(text)
+    except ValueError:
+        return text
+
+
+def get_list_value(parameter_name, values):
+    if values == ['None']:
+        return None
+    if parameter_name in ('query', 'psicquic_db_to_use') and len(values) == 1:
+        return values[0]
+    return values
+
+
+def get_parameters(args):
+    # the parameters of the top of this script, replaced by the ones of the config file, replaced by the ones of the
+    # command line
+    parameters = {parameter_name: globals()[parameter_name] for parameter_name in parameter_names}
+    config_file = getattr(args, 'config', None)
+    if config_file:
+        with open(config_file) as config_json:
+            config = json.load(config_json)
+        unknown = sorted(set(config) - set(parameter_names))
+        if unknown:
+            sys.exit('Unknown parameters in ' + config_file + ': ' + ', '.join(unknown))
+        parameters.update(config)
+    for parameter_name in parameter_names:
+        if hasattr(args, parameter_name):
+            value = getattr(args, parameter_name)
+            if parameter_name in list_parameters:
+                value = get_list_value(parameter_name, value)
+            parameters[parameter_name] = value
+    if parameters['format'] not in ('tab25', 'tab27'):
+        sys.exit('The input format is wrong. Use "tab25" or "tab27"')
+    return parameters
+
+
+def get_parser():
+    # the parameters can be given to every command, before or after it (their default is the value at the top of
+    # this script)
+    parameters_parser = argparse.ArgumentParser(add_help=False)
+    parameters_parser.add_argument('--config', default=argparse.SUPPRESS,
+                                   help='json file of parameters ({"taxids": ["559292"], "chunk_size": 500000})')
+    for parameter_name in parameter_names:
+        flag = '--' + parameter_name.replace('_', '-')
+        default = globals()[parameter_name]
+        if parameter_name in list_parameters:
+            parameters_parser.add_argument(flag, dest=parameter_name, nargs='+', default=argparse.SUPPRESS,
+                                           help='default: ' + (' '.join(default) if isinstance(default, list)
+                                                               else str(default)))
+        else:
+            parameters_parser.add_argument(flag, dest=parameter_name, type=get_value, default=argparse.SUPPRESS,
+                                           help='default: ' + str(default))
+    parser = argparse.ArgumentParser(description='Builds a protein-protein interactome from BioGRID and PSICQUIC, '
+                                                 'without redundancies (see the README)',
+                                     parents=[parameters_parser])
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('run', parents=[parameters_parser], help='the whole pipeline (default)')
+    commands.add_parser('fetch', parents=[parameters_parser],
+                        help='fetch BioGRID, PSICQUIC and the Uniprot mapping data into the interactome file (and '
+                             'clean it, with clean_while_fetching)')
+    commands.add_parser('clean', parents=[parameters_parser],
+                        help='clean the fetched interactome (again from the raw file if keep_raw was True)')
+    commands.add_parser('dedupe', parents=[parameters_parser],
+                        help='remove the redundancies of the cleaned interactome')
+    commands.add_parser('export', parents=[parameters_parser],
+                        help='write the sqlite store and the graph of the final interactome (see export_sqlite and '
+                             'export_graph)')
+    commands.add_parser('status', parents=[parameters_parser],
+                        help='the stages done and the output files of the interactome of the parameters')
+    return parser
+
+
+# the processes of taxid_max_workers and partition_max_workers import this script again: the pipeline must only run when it is launched
+if __name__ == '__main__':
+    args = get_parser().parse_args()
+    parameters = get_parameters(args)
+    command = args.command or 'run'
+    if command == 'run':
+        pipeline(**parameters)
+    else:
+        output_file = get_interactome_file(parameters['taxids'], parameters['query'], parameters['max_result'],
+                                           parameters['format'])
+        if command == 'status':
+            status(output_file)
+        elif command == 'fetch':
+            fetch(parameters)
+        else:
+            {'clean': clean, 'dedupe': dedupe, 'export': export}[command](output_file, parameters)
@@ -0,0 +1,138 @@
+# Author: Lunelys RUNESHAW <lunelys.runeshaw@etudiant.univ-rennes.fr>
+#
+# This script is giving the descendants and the ancestors of the PSI-MI terms used in cleaning_data.py, and if they are
+# obsolete. They come either:
+# - from a local copy of the PSI-MI ontology (OBO file, see mi_ontology_file in main.py), everything is then computed
+# here and there is no call to the OLS API, so the cleaning also works offline,
+# - or from the OLS API (see https://www.ebi.ac.uk/ols4). The answers are kept in an on-disk cache
+# (cache/ols_cache.json), so a rerun does not call the OLS API again for the terms it already knows, until they are
+# older than ols_cache_ttl_days (see main.py). Delete that file, or call clear_ols_cache(), to empty the cache.
+
+import os
+import json
+import time
+import requests
+import run_report
+
+ols_cache_file = os.path.join('cache', 'ols_cache.json')
+ontology = None  # the parsed OBO file, loaded once
+ontology_file = None
+
+
+def load_ols_cache():
+    if os.path.exists(ols_cache_file):
+        with open(ols_cache_file) as cache_file:
+            return json.load(cache_file)
+    return {'descendants': {}, 'ancestors': {}}
+
+
+def save_ols_cache(cache):
+    os.makedirs(os.path.dirname(ols_cache_file), exist_ok=True)
+    with open(ols_cache_file + '.tmp', 'w') as cache_file:
+        json.dump(cache, cache_file)
+    os.replace(ols_cache_file + '.tmp', ols_cache_file)  # so that an interrupted run never leaves a broken cache
+
+
+def clear_ols_cache():
+    # to invalidate the cache manually
+    if os.path.exists(ols_cache_file):
+        os.remove(ols_cache_file)
+        print(ols_cache_file + ' deleted')
+
+
+def is_fresh(entry, ttl_days):
+    return entry is not None and time.time() - entry['fetched'] < ttl_days * 24 * 3600
+
+
+def fetch_ols_terms(kind, mi):
+    # kind is 'descendants' or 'ancestors'. A failed lookup raises, so that it is never cached as a term without
+    # descendants or ancestors: only a successful answer (200) without _embedded means that there are no terms
+    api_url = 'https://www.ebi.ac.uk/ols/api/ontologies/mi/' + kind + '?id=' + mi + '&size=500'
+    response = requests.get(api_url, hooks={'response': run_report.response_hook('OLS')})
+    response.raise_for_status()
+    if response.status_code != 200:
+        raise requests.HTTPError('OLS ' + kind + ' of ' + mi + ': unexpected status ' + str(response.status_code),
+                                 response=response)
+    return response.json().get('_embedded', {}).get('terms', [])
+
+
+def read_obo(obo_file):
+    # minimal OBO reader: for each [Term], its parents (is_a) and if it is obsolete
+    terms = {}
+    term = None
+    with open(obo_file, encoding='utf-8') as obo:
+        for line in obo:
+            line = line.strip()
+            if line.startswith('['):
+                term = {'parents': [], 'is_obsolete': False} if line == '[Term]' else None
+            elif term is not None and line.startswith('id: '):
+                terms[line[4:]] = term
+            elif term is not None and line.startswith('is_a: '):
+                term['parents'].append(line[6:].split(' ')[0])
+            elif term is not None and line == 'is_obsolete: true':
+                term['is_obsolete'] = True
+    for mi, term in terms.items():
+        term['children'] = []
+    for mi, term in terms.items():
+        for parent in term['parents']:
+            if parent in terms:
+                terms[parent]['children'].append(mi)
+    return terms
+
+
+def get_ontology(obo_file):
+    global ontology, ontology_file
+    if ontology is None or ontology_file != obo_file:
+        print('Loading the PSI-MI ontology from ' + obo_file)
+        ontology = read_obo(obo_file)
+        ontology_file = obo_file
+    return ontology
+
+
+def walk(terms, mi, relation):
+    # all the terms reachable from mi by following relation ('parents' or 'children'), mi excluded
+    found = []
+    to_visit = list(terms.get(mi, {}).get(relation, []))
+    while to_visit:
+        next_mi = to_visit.pop()
+        if next_mi not in found:
+            found.append(next_mi)
+            to_visit.extend(terms.get(next_mi, {}).get(relation, []))
+    return found
+
+
+# -----------------------------------------------------
+
+
+def get_descendants(mi, cache, obo_file=None, ttl_days=30):
+    # returns the list of the descendants of mi
+    if obo_file:
+        return walk(get_ontology(obo_file), mi, 'children')
+    entry = cache['descendants'].get(mi)
+    if not is_fresh(entry, ttl_days):
+        mi_infos = fetch_ols_terms('descendants', mi)
+        entry = {'fetched': time.time(), 'descendants': [mi_info['annotation']['id'][0] for mi_info in mi_infos]}
+        cache['descendants'][mi] = entry
+    return entry['descendants']
+
+
+def get_ancestors(mi, cache, obo_file=None, ttl_days=30):
+    # returns the list of the ancestors of mi (only the ones that have children), and if mi is obsolete
+    if obo_file:
+        terms = get_ontology(obo_file)
+        is_obsolete = mi not in terms or terms[mi]['is_obsolete']
+        return walk(terms, mi, 'parents'), is_obsolete
+    entry = cache['ancestors'].get(mi)
+    if not is_fresh(entry, ttl_days):
+        mi_infos = fetch_ols_terms('ancestors', mi)
+        ancestors_list = []
+        is_obsolete = False
+        for mi_info in mi_infos:
+            if mi_info['is_obsolete'] or mi_infos[0]['description'] == [] and mi != 'MI:0000':
+                is_obsolete = True
+                continue
+            elif mi_info['has_children']:
+                ancestors_list.append(mi_info['annotation']['id'][0])
+        entry = {'fetched': time.time(), 'ancestors': ancestors_list, 'is_obsolete': is_obsolete}
+        cache['ancestors'][mi] = entry
+    return entry['ancestors'], entry['is_obsolete']
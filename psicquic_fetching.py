@@ -5,12 +5,21 @@
 
 import requests
 from urllib.request import urlopen
+from urllib.parse import quote, urlencode
 import xml.etree.ElementTree as ET
 import pandas as pd
 import datetime
 from io import StringIO
 import numpy as np
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import interactome_io
+import run_report
+import fetch_checkpoints
+import stream_cleaning
 
+interactors_per_query = 50  # interactors of a list query packed in a single MIQL query (A OR B OR ...)
 
 class PsicquicService:
     def __init__(self, name, rest_url):
@@ -19,15 +28,15 @@ class PsicquicService:
 
 
 def read_url(url):
-    # fetch the content of a psicquic service
-    try:
+    # fetch the content of a psicquic service. If it fails, it is tried again (see fetch_checkpoints.py), and the error
+    # is raised if it still fails
+    def download():
         file_handle = urlopen(url)
         content = file_handle.read()
         file_handle.close()
-    except IOError:
-        print('Cannot open URL ' + url)
-        content = ''
-    return content
+        run_report.record_source('PSICQUIC registry', requests=1, bytes=len(content))
+        return content
+    return fetch_checkpoints.with_retries(download, 'PSICQUIC registry', 'Opening URL ' + url)
 
 
 def read_active_services_from_registry(tags):
@@ -50,67 +59,209 @@ def read_active_services_from_registry(tags):
     return services
 
 
-def query_psicquic(psicquic_service, output_file, species, interactor=None,
-                max_results=None, format='tab25', tags='protein-protein'):
-    # fetch data from psicquic
-    psicquic_rest_url_query = psicquic_service.rest_url
-    if interactor is None:
-        psicquic_part_url = psicquic_rest_url_query + 'query/'
-    else:
-        psicquic_part_url = psicquic_rest_url_query + 'interactor/' + interactor + '?'
-    if species == '*':
-        psicquic_url = psicquic_part_url + species + '?&format=' + format
-    else:
-        psicquic_url = psicquic_part_url + 'species%3A' + species
-    if max_results is None:
-        psicquic_url = psicquic_url + '?&format=' + format
-    else:
-        psicquic_url = psicquic_url + '?firstResult=0&maxResults=' + str(max_results) + '&format=' + format
-    print('\t\tURL: ' + psicquic_url)
-    r = requests.get(psicquic_url)
-    if r.text != 'Format not supported: tab27':
-        total = r.headers['X-PSICQUIC-Count']
-        if r.text:
-            print('\t\tDownloading ' + total + ' experimental evidences, please wait...')
-            df = pd.read_csv(StringIO(r.text), sep="\t", header=None)
-            if format == 'tab27':
-                df.drop(df.iloc[:, np.r_[2, 3, 15, 22:28, 29:40]], inplace=True, axis=1)
-                df.insert(len(df.columns), "service_name", psicquic_service.name, True)
-                df.insert(len(df.columns), "biogrid_experimental_system", '-', True)
-                df.insert(len(df.columns), "biogrid_description", '-', True)
-                df.insert(len(df.columns), "biogrid_type", '-', True)
-                df.insert(len(df.columns), "throughput", '-', True)
-            else:  # default to tab25 format
-                df.drop(df.columns[[2, 3]], axis=1, inplace=True)
-                df.insert(len(df.columns), "service_name", psicquic_service.name, True)
-            df.columns = list(pd.read_csv(output_file).columns)
-            df.to_csv(output_file, mode='a', index=False, header=False)
+def get_interactor_lists(query):
+    # the query (a gene name, or a list of gene names, systematic names or uniprot accessions) split in as few MIQL
+    # queries as possible, interactors_per_query interactors each. [None] without query
+    if query is None:
+        return [None]
+    interactors = list(dict.fromkeys([query] if isinstance(query, str) else query))  # without duplicates, in order
+    return [interactors[i:i + interactors_per_query] for i in range(0, len(interactors), interactors_per_query)]
+
+
+def build_psicquic_url(psicquic_service, species, interactors=None, first_result=None, max_results=None,
+                       format='tab25'):
+    # build the url of a psicquic query (interactors: one of get_interactor_lists). With first_result and max_results,
+    # only that page of results is asked. The query is a single MIQL query (identifier (id or alias) A or B or ..., in
+    # the species), and the other parameters are & separated after a single ?
+    terms = []
+    if interactors is not None:
+        terms.append('identifier:' + (interactors[0] if len(interactors) == 1 else
+                                      '(' + ' OR '.join(interactors) + ')'))
+    if species != '*':
+        terms.append('species:' + species)
+    miql = ' AND '.join(terms) if terms else '*'
+    params = {}
+    if max_results is not None:
+        params['firstResult'] = str(first_result or 0)
+        params['maxResults'] = str(max_results)
+    params['format'] = format
+    return psicquic_service.rest_url + 'query/' + quote(miql, safe='*') + '?' + urlencode(params)
+
+
+def format_psicquic_frame(df, psicquic_service, format):
+    # keep only the columns we use, and add the ones of the interactome file
+    if format == 'tab27':
+        df.drop(df.iloc[:, np.r_[2, 3, 15, 22:28, 29:40]], inplace=True, axis=1)
+        df.insert(len(df.columns), "service_name", psicquic_service.name, True)
+        df.insert(len(df.columns), "biogrid_experimental_system", '-', True)
+        df.insert(len(df.columns), "biogrid_description", '-', True)
+        df.insert(len(df.columns), "biogrid_type", '-', True)
+        df.insert(len(df.columns), "throughput", '-', True)
+    else:  # default to tab25 format
+        df.drop(df.columns[[2, 3]], axis=1, inplace=True)
+        df.insert(len(df.columns), "service_name", psicquic_service.name, True)
+    return df
+
+
+def download_page(psicquic_service, psicquic_url):
+    # a page of results: (frame, total). The frame is None if there is no (more) result, and the total is None if the
+    # service does not support the format
+    r = requests.get(psicquic_url, hooks={'response': run_report.response_hook(psicquic_service.name)})
+    if r.text == 'Format not supported: tab27':
+        return None, None
+    r.raise_for_status()
+    total = r.headers['X-PSICQUIC-Count']
+    if not r.text:
+        return None, total
+    return pd.read_csv(StringIO(r.text), sep="\t", header=None), total
+
+
+def query_interactors(psicquic_service, frames, cancel, species, interactors, max_results, format, page_size,
+                      output_file, seen):
+    # the pages of a query (interactors: one of get_interactor_lists), put in the frames queue. With seen (the hashes
+    # of the rows of the previous queries of a list query), the rows already fetched are not put again: an interaction
+    # between interactors of 2 different queries is in both. Returns the hashes of the rows of this query (empty
+    # without seen), or None if the service does not support the format or if the fetching is cancelled (cancel set
+    # by the writer, see fetching)
+    first_result = 0
+    hashes = set()
+    while True:
+        if cancel.is_set():
+            return None
+        if page_size is None:
+            page_max_results = max_results
+        elif max_results is None:
+            page_max_results = page_size
+        else:
+            page_max_results = min(page_size, max_results - first_result)
+        psicquic_url = build_psicquic_url(psicquic_service, species, interactors, first_result, page_max_results,
+                                          format)
+        print('\t\t' + psicquic_service.name + ' URL: ' + psicquic_url)
+        if output_file is None:
+            df, total = fetch_checkpoints.with_retries(lambda: download_page(psicquic_service, psicquic_url),
+                                                       psicquic_service.name, psicquic_service.name + ' ' + psicquic_url)
         else:
-            print('\t\tNo experimental evidences found in the service')
-    else:
-        print('\t\tFormat not supported: tab27')
+            df, total = fetch_checkpoints.fetch_page(output_file, psicquic_service.name, psicquic_url,
+                                                     lambda: download_page(psicquic_service, psicquic_url))
+        if total is None:
+            print('\t\t' + psicquic_service.name + ': format not supported: tab27')
+            return None
+        if df is None:
+            if first_result == 0:
+                print('\t\t' + psicquic_service.name + ': no experimental evidences found in the service')
+            return hashes
+        if first_result == 0:
+            print('\t\t' + psicquic_service.name + ': downloading ' + total + ' experimental evidences, please wait...')
+        page_rows = df.shape[0]
+        first_result += page_rows
+        if seen is not None:
+            row_hashes = pd.util.hash_pandas_object(df, index=False)
+            hashes.update(row_hashes)
+            df = df.loc[~row_hashes.isin(seen).to_numpy()]
+        if df.shape[0] != 0:
+            frames.put(format_psicquic_frame(df, psicquic_service, format))
+        if page_size is None:
+            return hashes
+        print('\t\t' + psicquic_service.name + ': ' + str(first_result) + '/' + total + ' experimental evidences')
+        if page_rows < page_max_results or first_result >= int(total) or first_result == max_results:
+            return hashes
 
 
-# -----------------------------------------------------
+def query_psicquic(psicquic_service, frames, cancel, species, interactor=None,
+                max_results=None, format='tab25', tags='protein-protein', page_size=None, output_file=None):
+    # fetch data from psicquic. The frames are not written here but put in the frames queue: only one writer (the
+    # fetching function) appends to the output file, so the services can be fetched at the same time.
+    # With page_size, the results are downloaded page by page (firstResult/maxResults) and each page is parsed and
+    # handed to the writer as soon as it arrives, so we never hold more than a page in memory.
+    # With output_file, each page is kept in the checkpoints of that file until everything is fetched.
+    # interactor: None, a gene name or a list of them, fetched in as few queries as possible (see get_interactor_lists)
+    print("Starting to retrieve data from: " + psicquic_service.name + ', ' + datetime.datetime.now().strftime(
+        "%d/%m/%Y, %H:%M:%S"))
+    interactor_lists = get_interactor_lists(interactor)
+    seen = set() if len(interactor_lists) > 1 else None
+    for interactors in interactor_lists:
+        hashes = query_interactors(psicquic_service, frames, cancel, species, interactors, max_results, format,
+                                   page_size, output_file, seen)
+        if hashes is None:
+            return
+        if seen is not None:
+            seen.update(hashes)
 
 
-def fetching(output_file, species, query, max_result, format, molecular_interaction, psicquic_db_to_use):
-    offset = 0
-    services = read_active_services_from_registry(molecular_interaction)
-    for service in services:
+def count_psicquic(psicquic_service, species, interactor=None):
+    # number of experimental evidences the service has for this query (used as a fingerprint by the incremental mode),
+    # added up over the queries of a list query
+    counts = []
+    for interactors in get_interactor_lists(interactor):
+        def download():
+            r = requests.get(build_psicquic_url(psicquic_service, species, interactors, format='count'),
+                             hooks={'response': run_report.response_hook(psicquic_service.name)})
+            r.raise_for_status()
+            return r.text.strip()
+        counts.append(fetch_checkpoints.with_retries(download, psicquic_service.name,
+                                                     psicquic_service.name + ' count'))
+    if len(counts) == 1:
+        return counts[0]
+    return str(sum(int(count) for count in counts))
+
+
+def select_services(format, molecular_interaction, psicquic_db_to_use):
+    # the active services of the registry we want to fetch
+    services = []
+    for service in read_active_services_from_registry(molecular_interaction):
         if (format == 'tab27' and service.name == 'BioGrid') or service.name == 'iRefIndex':
             continue  # we do not fetch twice BioGrid data in that case ... and we eliminate by default iRefIndex
-        if psicquic_db_to_use == 'all':
-            print('Service: ' + service.name + ' ================================================================== ')
-            print("Starting to retrieve data from: " + service.name + ', ' + datetime.datetime.now().strftime(
-                "%d/%m/%Y, %H:%M:%S"))
-            query_psicquic(service, output_file, species, query, max_result, format, molecular_interaction)
-            print('\n')
-        else:
-            if service.name.lower() in psicquic_db_to_use:
-                print(
-                    'Service: ' + service.name + ' ================================================================== ')
-                print("Starting to retrieve data from: " + service.name + ', ' + datetime.datetime.now().strftime(
-                    "%d/%m/%Y, %H:%M:%S"))
-                query_psicquic(service, output_file, species, query, max_result, format, molecular_interaction)
-                print('\n')
+        if psicquic_db_to_use == 'all' or service.name.lower() in psicquic_db_to_use:
+            services.append(service)
+    return services
+
+
+def query_psicquic_worker(psicquic_service, frames, cancel, *args):
+    # run by each thread of the pool: whatever happens, we tell the writer that this service is done (None)
+    try:
+        if not cancel.is_set():
+            query_psicquic(psicquic_service, frames, cancel, *args)
+    finally:
+        frames.put(None)
+
+
+# -----------------------------------------------------
+
+
+def fetching(output_file, species, query, max_result, format, molecular_interaction, psicquic_db_to_use,
+             max_workers=1, page_size=None, intermediate_format='csv'):
+    services = select_services(format, molecular_interaction, psicquic_db_to_use)
+    for service in services:
+        print('Service: ' + service.name + ' ================================================================== ')
+    headers = interactome_io.get_headers(format)
+    # max_workers services are fetched at the same time, and their frames are appended to the output file here, by
+    # a single writer, so the appends never interleave. The queue is bounded so the downloads wait for the writer
+    frames = queue.Queue(maxsize=2 * max_workers)
+    cancel = threading.Event()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(query_psicquic_worker, service, frames, cancel, species, query, max_result, format,
+                                   molecular_interaction, page_size, output_file) for service in services]
+        services_done = 0
+        try:
+            while services_done < len(services):
+                df = frames.get()
+                if df is None:
+                    services_done += 1
+                    continue
+                df.columns = headers
+                stream_cleaning.write(output_file, df, intermediate_format)
+                run_report.record('fetch_psicquic', rows_out=df.shape[0])
+                run_report.record_source(df['service_name'].iloc[0], rows=df.shape[0])
+                print('\t\t' + df['service_name'].iloc[0] + ': ' + str(df.shape[0]) +
+                      ' experimental evidences written')
+        except BaseException:
+            # the writer failed: the threads stop before their next page, and the queue is emptied until each service
+            # has sent its None, so that no thread stays blocked on the full queue (the pool waits for them on exit)
+            cancel.set()
+            while services_done < len(services):
+                if frames.get() is None:
+                    services_done += 1
+            raise
+    for future in futures:
+        future.result()  # to raise the errors of the threads, if any
+    print('\n')
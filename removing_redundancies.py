@@ -1,12 +1,21 @@
 # Author: Lunelys RUNESHAW <lunelys.runeshaw@etudiant.univ-rennes.fr>
 #
 # This script is eliminating explicit, implicit redundancies, and creating 1 csv files summarizing the redundancies.
+# The redundancies are only looked for inside the (prot1, prot2, pub_id) groups. So when the interactome is too big to
+# fit in memory (see partitions in main.py), the cleaned rows are split by prot1 into on-disk shards (all the rows of a
+# group are then in the same shard), and the redundancies of each shard are removed independently.
 
+import os
+import shutil
+import itertools
 import pandas as pd
 import datetime
-import itertools
 import numpy as np
-external_columns = ['only_mi_idms', 'ancestors', 'count_impl']
+from concurrent.futures import ProcessPoolExecutor
+import interactome_io
+import run_report
+
+count_columns = ['count_expl', 'count_impl', 'count_evidences']  # added after the tab27 columns
 
 
 def clean_authors(row):
@@ -25,69 +34,195 @@ def clean_authors(row):
             return values
 
 
-def same_merge(x):
-    # to merge the data in each field but without repetitions
-    if x.name not in external_columns:  # concatenate the count_expl (cond add)?
-        zipped = [str(inner).split('|') for inner in list(set(x))]
-        unzipped = set(list(itertools.chain.from_iterable(zipped)))
-        if '-' in unzipped and unzipped != {'-'}:
-            unzipped.remove('-')
-        return '|'.join(unzipped)
+def merge_redundancies(df, keys, dropna=True, summed=()):
+    # merges the rows of df that have the same keys, like a groupby(keys).agg() keeping the values of every column
+    # without repetitions (the '-' are dropped if there is anything else), except the integer columns of summed, which
+    # are added up. Returns the merged frame (one row per group, sorted by keys) and the number of rows of each group,
+    # both from the same groupby. Instead of calling a python function for each column of each group, the values of
+    # the groups with several rows are exploded in a long table (group, column, value), deduplicated, and joined all at
+    # once. The groups of 1 row are kept as they are
+    grouped = df.groupby(keys, sort=True, dropna=dropna, observed=True)
+    group = grouped.ngroup().to_numpy()
+    count = grouped.size().to_numpy()
+    in_group = group >= 0  # -1 for the rows with missing keys, when they are dropped
+    first_rows = in_group & ~pd.Series(group).duplicated().to_numpy()
+    merged = df.loc[first_rows].astype(object)
+    merged.index = group[first_rows]
+    merged = merged.sort_index()
+    for col in summed:
+        merged[col] = np.bincount(group[in_group], weights=df.loc[in_group, col].to_numpy(dtype=np.int64),
+                                  minlength=len(count)).astype(np.int64)
+    values = [col for col in df.columns if col not in keys and col not in summed]
+    several = in_group & (count[np.where(in_group, group, 0)] > 1)
+    if several.any():
+        long = df.loc[several, values].astype(str)
+        long['group'] = group[several]
+        long = long.melt(id_vars='group', var_name='column', value_name='value')
+        long['column'] = long['column'].astype(pd.CategoricalDtype(values))
+        long['value'] = long['value'].str.split('|')
+        long = long.explode('value').drop_duplicates()
+        long = long.loc[long['value'] != '-']
+        # the values of each (group, column) are joined in their order of appearance, on an integer key: stable sort
+        # of the key, then concatenation of each run of the same key ('|' + value, the first '|' is removed)
+        key = long['group'].to_numpy(dtype=np.int64) * len(values) + long['column'].cat.codes.to_numpy()
+        order = np.argsort(key, kind='stable')
+        key = key[order]
+        starts = np.flatnonzero(np.diff(key, prepend=-1))
+        joined = np.add.reduceat(('|' + long['value']).to_numpy(dtype=object)[order], starts)
+        multiple = np.unique(group[several])
+        table = np.full((len(multiple), len(values)), '-', dtype=object)
+        table[np.searchsorted(multiple, key[starts] // len(values)), key[starts] % len(values)] = \
+            [value[1:] for value in joined]
+        merged.loc[multiple, values] = table
+    return merged.reset_index(drop=True), count
+
+
+def encode_keys(df):
+    # the keys of the groups as integers, so that the groupbys and the joins never compare strings: prot1 and prot2
+    # become a single canonical pair key (code of prot1 * number of accessions + code of prot2, sorted like the
+    # (prot1, prot2) accessions) and pub_id becomes int32 codes (sorted like the pub_ids). The strings are given back
+    # by decode_keys, before writing. The keys are never missing in cleaned experimental evidences
+    prot1_codes, prot2_codes, accessions = interactome_io.encode_proteins(df['prot1'], df['prot2'])
+    pub_id_codes, pub_ids = pd.factorize(df['pub_id'].to_numpy(dtype=object), sort=True)
+    df = df.drop(['prot1', 'prot2', 'pub_id'], axis=1)
+    df.insert(0, 'pair', prot1_codes.astype(np.int64) * len(accessions) + prot2_codes)
+    df.insert(1, 'pub_id', pub_id_codes.astype(np.int32))
+    return df, accessions, pub_ids
+
+
+def decode_keys(df, accessions, pub_ids):
+    pair = df['pair'].to_numpy(dtype=np.int64)
+    df = df.drop(['pair'], axis=1)
+    df['prot1'] = accessions.take(pair // len(accessions))
+    df['prot2'] = accessions.take(pair % len(accessions))
+    df['pub_id'] = pub_ids.take(df['pub_id'].to_numpy(dtype=np.int32))
+    return df
+
+
+def find_implicit_redundancies(df):
+    # In a same (prot1, prot2, pub_id) group, an evidence is implicitly redundant with another one if its IDM is an
+    # ancestor of the IDM of the other one. Instead of comparing all the rows of each group 2 by 2, we explode the
+    # ancestors in a long table and join it with the IDMs of the same group: each match is a (general, specific) pair of
+    # rows. Like the comparison 2 by 2 did, each pair gives the position of its general row + 1 (to avoid 0) as impl id
+    # to both rows, the pairs coming later (by general row, then specific row) replacing it: each row keeps the impl id
+    # of its last pair, the one with the highest general position. It is not a transitive clustering: 2 unrelated IDMs
+    # that are both ancestors of a third one are not merged together. The other rows keep their interaction
+    # identifiers as impl id
+    keys = ['pair', 'pub_id']  # see encode_keys
+    evidences = df[keys].reset_index(drop=True)
+    evidences['position'] = np.arange(df.shape[0])
+    ancestors = evidences.assign(mi=df['ancestors'].values).explode('mi').dropna(subset=['mi'])
+    idms = evidences.assign(mi=df['only_mi_idms'].values)
+    edges = ancestors.merge(idms, on=keys + ['mi'], suffixes=('_specific', '_general'))
+    general = edges['position_general'].to_numpy(dtype=np.int64)
+    impl = np.full(df.shape[0], -1, dtype=np.int64)
+    np.maximum.at(impl, general, general)
+    np.maximum.at(impl, edges['position_specific'].to_numpy(dtype=np.int64), general)
+    return np.where(impl >= 0, impl + 1, df['interaction_identifiers'].to_numpy()).astype(object)
+
+
+def get_shard_folder(input_file):
+    return input_file[:-4] + '_shards'
+
+
+def write_shards(input_file, partitions, intermediate_format='csv', chunk_size=500000):
+    # splits the cleaned interactome into partitions csv files, by a hash of prot1, reading it by chunks
+    shard_folder = get_shard_folder(input_file)
+    if os.path.isdir(shard_folder):
+        shutil.rmtree(shard_folder)
+    os.makedirs(shard_folder)
+    shard_files = [os.path.join(shard_folder, 'shard-' + str(shard).zfill(5) + '.csv') for shard in range(partitions)]
+    for df in interactome_io.read_chunks(input_file, intermediate_format, chunk_size):
+        shards = pd.util.hash_pandas_object(df['prot1'], index=False).to_numpy() % partitions
+        for shard, rows in df.groupby(shards):
+            shard_file = shard_files[shard]
+            rows.to_csv(shard_file, mode='a', header=not os.path.exists(shard_file), index=False)
+    return [shard_file for shard_file in shard_files if os.path.exists(shard_file)]
+
+
+def removing_shard(shard_file, mi_ancestors):
+    # run in its own process if partition_max_workers > 1
+    df = removing_frame(pd.read_csv(shard_file), mi_ancestors)
+    no_redundancies_shard = get_no_redundancies_file(shard_file)
+    df.to_csv(no_redundancies_shard, index=False)
+    return no_redundancies_shard
+
+
+def removing_shard_process(shard_file, mi_ancestors):
+    # run in its own process if partition_max_workers > 1: its run report is sent back to the main process
+    run_report.reset()
+    no_redundancies_shard = removing_shard(shard_file, mi_ancestors)
+    return no_redundancies_shard, run_report.collect()
 
 
 # -----------------------------------------------------
 
 
-def removing(input_file, mi_ancestors):
-    df = pd.read_csv(input_file)
-    no_redundancies_file = input_file[:-4] + '_no_redundancies' + input_file[-4:]
-    print('Initial number of experimental evidences: ' + str(df.shape[0]))
+def get_no_redundancies_file(input_file):
+    return input_file[:-4] + '_no_redundancies' + input_file[-4:]
+
+
+def removing_frame(df, mi_ancestors):
+    # eliminates the explicit and implicit redundancies of the cleaned experimental evidences of df
+    rows_in = df.shape[0]
+    print('Initial number of experimental evidences: ' + str(rows_in))
     print("Starting to find explicit redundancies: " + datetime.datetime.now().strftime("%d/%m/%Y, %H:%M:%S"))
-    count_col = df.groupby(['prot1', 'prot2', 'idm', 'pub_id']).size().reset_index(name='count')['count']
-    df = df.groupby(['prot1', 'prot2', 'idm', 'pub_id']).agg(same_merge).reset_index()
-    df['count_expl'] = count_col  # add a count column for the explicit redundancies
-    df['count_expl'] = df['count_expl'] - 1
-    print('Number of explicit redundancies: ' + str(df['count_expl'].sum()))
+    df, accessions, pub_ids = encode_keys(df)
+    df, count = merge_redundancies(df, ['pair', 'idm', 'pub_id'])
+    df['count_expl'] = count - 1  # add a count column for the explicit redundancies
+    # the number of cleaned experimental evidences of each row, added up by the implicit merge (the count_expl of the
+    # merged rows are joined, without repetitions, like the other columns)
+    df['count_evidences'] = count
+    explicit_redundancies = df['count_expl'].sum()
+    print('Number of explicit redundancies: ' + str(explicit_redundancies))
     print("Starting to find implicit redundancies: " + datetime.datetime.now().strftime("%d/%m/%Y, %H:%M:%S"))
     only_mi_idms = df['idm'].apply(lambda x: x.split('"')[1])
     df.insert(len(df.columns), "only_mi_idms", only_mi_idms, True)
     df.insert(len(df.columns), "ancestors", df['only_mi_idms'].map(mi_ancestors), True)
-    df.insert(len(df.columns), 'impl', np.nan, True)
-    grp = df.groupby(['prot1', 'prot2', 'pub_id'])
-    # could be made cleaner in the next version
-    for name, group in grp:
-        for index, row in group.iterrows():
-            for index_int, row_int in group.iterrows():
-                if row['prot1'] == row_int['prot1'] and row['prot2'] == row_int['prot2'] \
-                        and (row['pub_id'] in row_int['pub_id'] or row_int['pub_id'] in row['pub_id']) \
-                        and row['only_mi_idms'] in row_int['ancestors']:
-                    if pd.isna(row_int['impl']) and pd.isna(row_int['impl']):
-                        df.at[row.name, 'impl'] = index + 1  # just to avoid the default value, 0
-                        df.at[row_int.name, 'impl'] = index + 1
-                    else:
-                        if pd.notna(row_int['impl']):
-                            df.at[row.name, 'impl'] = row_int['impl']
-                        else:
-                            df.at[row_int.name, 'impl'] = row['impl']
-        for index, row in group.iterrows():
-            for index_int, row_int in group.iterrows():
-                if row['only_mi_idms'] not in row_int['ancestors'] and pd.isna(df.at[row.name, 'impl']):
-                    df.at[row.name, 'impl'] = df.at[row.name, 'interaction_identifiers']
-    count_col = df.groupby(['prot1', 'prot2', 'pub_id', 'impl'], dropna=False).size().reset_index(name='count')['count']
-    df = df.groupby(['prot1', 'prot2', 'pub_id', 'impl'], dropna=False).agg(same_merge).reset_index()
-    df['count_impl'] = count_col
-    df['count_impl'] = df['count_impl'] - 1
+    df.insert(len(df.columns), 'impl', find_implicit_redundancies(df), True)
+    df.drop(['only_mi_idms', 'ancestors'], inplace=True, axis=1)
+    df, count = merge_redundancies(df, ['pair', 'pub_id', 'impl'], dropna=False, summed=['count_evidences'])
+    df['count_impl'] = count - 1
     print('Number of implicit redundancies: ' + str(df['count_impl'].sum()))
-    df['authors'] = df['authors'].apply(clean_authors)
-    df.drop(['only_mi_idms', 'ancestors', 'impl'], inplace=True, axis=1)
+    df['authors'] = df['authors'].astype(str).apply(clean_authors)
+    df.drop(['impl'], inplace=True, axis=1)
+    df = decode_keys(df, accessions, pub_ids)
     # df.reindex could be made cleaner in the next version
-    tab27_headers = ['prot1', 'prot2', 'gene1', 'gene2', 'idm', 'authors', 'pub_id', 'species1', 'species2',
-                     'interaction_type', 'source_databases', 'interaction_identifiers', 'confidence_score',
-                     'biological_role1', 'biological_role2', 'exp_role1', 'exp_role2', 'interactor_type1',
-                     'interactor_type2', 'taxid_host', 'participant_id_method1', 'participant_id_method2',
-                     'service_name', 'biogrid_experimental_system', 'biogrid_description', 'biogrid_type',
-                     'throughput', 'count_expl', 'count_impl']
-    df = df.reindex(tab27_headers, axis=1)
+    df = df.reindex(interactome_io.tab27_headers + count_columns, axis=1)
     print('Final number of experimental evidences, without any redundancies: ' + str(df.shape[0]))
-    df.to_csv(no_redundancies_file, index=False)
+    run_report.record('removing_redundancies', rows_in=rows_in, rows_out=df.shape[0],
+                      explicit_redundancies=explicit_redundancies, implicit_redundancies=df['count_impl'].sum())
+    return df
+
+
+def removing_partitioned(input_file, mi_ancestors, partitions, max_workers=1, intermediate_format='csv',
+                         chunk_size=500000):
+    # peak memory is the one of a shard (times max_workers) instead of the one of the whole interactome
+    print('Splitting the interactome into ' + str(partitions) + ' shards by prot1')
+    shard_files = write_shards(input_file, partitions, intermediate_format, chunk_size)
+    if max_workers > 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            no_redundancies_shards = []
+            for no_redundancies_shard, shard_report in executor.map(removing_shard_process, shard_files,
+                                                                    itertools.repeat(mi_ancestors)):
+                run_report.merge(shard_report)
+                no_redundancies_shards.append(no_redundancies_shard)
+    else:
+        no_redundancies_shards = [removing_shard(shard_file, mi_ancestors) for shard_file in shard_files]
+    # the shards are concatenated one after another, without loading them (rows are sorted inside each shard)
+    with open(get_no_redundancies_file(input_file), 'w') as no_redundancies_file:
+        no_redundancies_file.write(','.join(interactome_io.tab27_headers + count_columns) + '\n')
+        for no_redundancies_shard in no_redundancies_shards:
+            with open(no_redundancies_shard) as shard:
+                shard.readline()  # header
+                shutil.copyfileobj(shard, no_redundancies_file)
+    shutil.rmtree(get_shard_folder(input_file))
+
 
+def removing(input_file, mi_ancestors, intermediate_format='csv', partitions=None, max_workers=1, chunk_size=500000):
+    if partitions:
+        removing_partitioned(input_file, mi_ancestors, partitions, max_workers, intermediate_format, chunk_size)
+        return
+    df = interactome_io.read(input_file, intermediate_format)
+    df = removing_frame(df, mi_ancestors)
+    df.to_csv(get_no_redundancies_file(input_file), index=False)
@@ -0,0 +1,167 @@
+# Author: Lunelys RUNESHAW <lunelys.runeshaw@etudiant.univ-rennes.fr>
+#
+# This script is recording what each step of the pipeline did, to see which database or which cleaning step is getting
+# slower from one run to another:
+# - for each stage (fetching, cleaning, removing redundancies...): wall time, experimental evidences in and out,
+# experimental evidences dropped per rule, and peak memory (RSS) of the pipeline at the end of the stage. The wall
+# time is the real time the stage was running (its runs in parallel processes are counted once), and the time of
+# these processes added up is kept apart (cpu_time_s),
+# - for each remote source (BioGRID, each PSICQUIC service, Uniprot, OLS...): number of HTTP requests, retries, bytes
+# downloaded and experimental evidences fetched.
+# Everything is written at the end of the run in a json file next to the interactome file:
+# interactome_[query]_[species]_[format]_report.json
+
+import sys
+import json
+import time
+import datetime
+import threading
+import contextlib
+try:
+    import resource  # not available on Windows: the peak memory is then not reported
+except ImportError:
+    resource = None
+
+report = {'stages': {}, 'sources': {}, 'intervals': {}}  # intervals: the (start, end) of each run of each stage
+lock = threading.Lock()  # the sources are fetched by several threads at the same time
+started = time.perf_counter()
+
+
+def reset():
+    global report, started
+    report = {'stages': {}, 'sources': {}, 'intervals': {}}
+    started = time.perf_counter()
+
+
+def get_peak_rss(who=None):
+    # in MB, None if it is not available
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF if who is None else who).ru_maxrss
+    if sys.platform == 'darwin':  # bytes on macOS, kilobytes on Linux
+        return round(peak_rss / 1024 ** 2, 1)
+    return round(peak_rss / 1024, 1)
+
+
+def add(entry, key, value):
+    entry[key] = entry.get(key, 0) + value
+
+
+def get_elapsed(intervals):
+    # the time during which at least one of the (start, end) intervals was running: the runs of a stage done one after
+    # another are added up, the ones done at the same time (in parallel processes) are counted once
+    elapsed = 0
+    last_end = None
+    for start, end in sorted(intervals):
+        if last_end is None or start > last_end:
+            elapsed += end - start
+            last_end = end
+        elif end > last_end:
+            elapsed += end - last_end
+            last_end = end
+    return round(elapsed, 3)
+
+
+def record(stage_name, **values):
+    # adds the values (rows_in=..., rows_out=...) to the ones already recorded for the stage (e.g. one chunk at a time)
+    with lock:
+        entry = report['stages'].setdefault(stage_name, {})
+        for key, value in values.items():
+            add(entry, key, int(value))
+
+
+def record_dropped(stage_name, reason, value):
+    with lock:
+        add(report['stages'].setdefault(stage_name, {}).setdefault('dropped', {}), reason, int(value))
+
+
+def record_source(source_name, **values):
+    # requests=..., retries=..., bytes=..., rows=... for a remote source
+    with lock:
+        entry = report['sources'].setdefault(source_name, {})
+        for key, value in values.items():
+            add(entry, key, int(value))
+
+
+def response_hook(source_name):
+    # hook of the requests module (hooks={'response': ...}), counting each response of a remote source. The urllib3
+    # retries (see Retry in biogrid_fetching.py and uniprotkb_mapping.py) are in the history of the final response
+    def count_response(response, *args, **kwargs):
+        retries = getattr(getattr(response.raw, 'retries', None), 'history', None) or ()
+        downloaded = int(response.headers.get('Content-Length', 0)) if kwargs.get('stream') else len(response.content)
+        record_source(source_name, requests=1, retries=len(retries), bytes=downloaded)
+        return response
+    return count_response
+
+
+@contextlib.contextmanager
+def stage(stage_name):
+    # with run_report.stage('cleaning'): ... records the wall time of the block (see get_elapsed if the stage runs
+    # several times, e.g. for each taxid) and the peak memory at its end. time.time(), as the intervals of the
+    # processes of taxid_max_workers are compared with the ones of this process
+    start = time.time()
+    try:
+        yield
+    finally:
+        with lock:
+            intervals = report['intervals'].setdefault(stage_name, [])
+            intervals.append((start, time.time()))
+            entry = report['stages'].setdefault(stage_name, {})
+            entry['wall_time_s'] = get_elapsed(intervals)
+            entry['peak_rss_mb'] = get_peak_rss()
+
+
+def collect():
+    # the report of this process, emptied for the next task (in the processes of taxid_max_workers and
+    # partition_max_workers)
+    collected = report
+    reset()
+    return collected
+
+
+def merge(other_report):
+    # adds the report of another process (see collect()) to this one. The wall time of its stages is added up in
+    # cpu_time_s, and the wall time of each stage is the elapsed time of its runs in all the processes
+    with lock:
+        for kind in ('stages', 'sources'):
+            for name, values in other_report[kind].items():
+                entry = report[kind].setdefault(name, {})
+                for key, value in values.items():
+                    if key == 'dropped':
+                        for reason, number in value.items():
+                            add(entry.setdefault('dropped', {}), reason, number)
+                    elif key == 'peak_rss_mb':
+                        entry[key] = max([peak_rss for peak_rss in (entry.get(key), value) if peak_rss is not None],
+                                         default=None)
+                    elif key == 'wall_time_s':
+                        entry['cpu_time_s'] = round(entry.get('cpu_time_s', 0) + other_report['stages'][name].get(
+                            'cpu_time_s', value), 3)
+                    elif key != 'cpu_time_s':
+                        add(entry, key, value)
+        for name, intervals in other_report['intervals'].items():
+            report['intervals'].setdefault(name, []).extend(intervals)
+            report['stages'][name]['wall_time_s'] = get_elapsed(report['intervals'][name])
+
+
+# -----------------------------------------------------
+
+
+def get_report_file(output_file):
+    return output_file[:-4] + '_report.json'
+
+
+def write(output_file, parameters=None):
+    # the peak memory of the processes of taxid_max_workers and partition_max_workers is the one of their biggest one
+    report_file = get_report_file(output_file)
+    run_report = {'interactome': output_file,
+                  'date': datetime.datetime.now().strftime("%d/%m/%Y, %H:%M:%S"),
+                  'parameters': parameters or {},
+                  'wall_time_s': round(time.perf_counter() - started, 3),
+                  'peak_rss_mb': get_peak_rss(),
+                  'children_peak_rss_mb': get_peak_rss(resource.RUSAGE_CHILDREN) if resource else None,
+                  'stages': report['stages'],
+                  'sources': report['sources']}
+    with open(report_file, 'w') as report_json:
+        json.dump(run_report, report_json, indent=1)
+    print('Run report written in ' + report_file)
+    return report_file
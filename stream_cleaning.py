@@ -0,0 +1,103 @@
+# Author: Lunelys RUNESHAW <lunelys.runeshaw@etudiant.univ-rennes.fr>
+#
+# This script is cleaning the experimental evidences while they are fetched (see clean_while_fetching in main.py),
+# instead of once everything is fetched, so that the CPU is not idle during the downloads and the network during the
+# cleaning.
+# The fetching steps give each fetched frame (a PSICQUIC page, the BioGRID experimental evidences of a taxid) to write()
+# instead of appending it to the interactome file, and a cleaning thread takes the frames from a bounded queue (the
+# downloads wait when the cleaning is late) and cleans them one after another, like the chunked cleaning does (see
+# clean_chunk in cleaning_data.py). The cleaned frames are appended to the cleaned file, which replaces the interactome
+# file once everything is fetched (see stop()).
+# The mapping data must be fetched before (see taxid_fetching.fetch_mappings), as the cleaning needs the geneid map.
+# The removing of the redundancies, which needs the whole interactome, is still done once everything is cleaned.
+
+import queue
+import threading
+import numpy as np
+import cleaning_data
+import interactome_io
+import run_report
+
+queue_size = 4  # frames fetched and waiting to be cleaned, at most
+streams = {}  # interactome file: its stream (queue, cleaning thread...), while it is fetched
+
+
+def to_text_frame(df):
+    # the frame as the chunked cleaning reads it from the interactome file: text, and the missing or empty values as
+    # NaN (a parsed page can have numbers, and a BioGRID frame empty strings)
+    return df.astype(str).where(df.notna() & (df != ''), np.nan)
+
+
+def clean_frames(stream):
+    # the cleaning thread: cleans the frames of the queue in their order, until None. The functions of the queue (see
+    # run_in_order) are run in the same order. After an error (or if the stream is discarded), the frames are only
+    # taken out of the queue, so the fetching never waits for a cleaning that will not come
+    while True:
+        frame = stream['frames'].get()
+        if frame is None:
+            return
+        if stream['error'] is not None or stream['discard']:
+            continue
+        try:
+            if callable(frame):
+                frame()
+                continue
+            chunk_size = stream['chunk_size'] or frame.shape[0]
+            for start in range(0, frame.shape[0], chunk_size):
+                with run_report.stage('cleaning'):
+                    cleaning_data.clean_chunk(stream['cleaning_state'],
+                                              to_text_frame(frame.iloc[start:start + chunk_size]))
+        except Exception as error:
+            stream['error'] = error
+
+
+# -----------------------------------------------------
+
+
+def start(output_file, format, molecular_interaction, geneid_map_file, mi_fetch_descendants, mi_to_exclude, keep_raw,
+          mi_ontology_file=None, ols_cache_ttl_days=30, intermediate_format='csv', chunk_size=None):
+    # from now on, what is written to output_file by write() is cleaned. With chunk_size, the frames bigger than that
+    # are cleaned chunk_size rows at a time
+    cleaning_state = cleaning_data.start_cleaning(output_file, format, molecular_interaction, geneid_map_file,
+                                                  mi_fetch_descendants, mi_to_exclude, keep_raw, mi_ontology_file,
+                                                  ols_cache_ttl_days, intermediate_format)
+    stream = {'frames': queue.Queue(maxsize=queue_size), 'cleaning_state': cleaning_state, 'chunk_size': chunk_size,
+              'error': None, 'discard': False}
+    stream['thread'] = threading.Thread(target=clean_frames, args=(stream,), daemon=True)
+    streams[output_file] = stream
+    stream['thread'].start()
+
+
+def write(output_file, df, intermediate_format='csv'):
+    # appends df to the interactome file, or gives it to the cleaning thread if the interactome file is cleaned while
+    # it is fetched. Waits if the queue is full. An error of the cleaning is raised by stop(), not here: the PSICQUIC
+    # services still being fetched would wait forever for their frames to be written
+    stream = streams.get(output_file)
+    if stream is None:
+        interactome_io.append(output_file, df, intermediate_format)
+    else:
+        stream['frames'].put(df)
+
+
+def run_in_order(output_file, function):
+    # runs function() now, or after the frames already given to the cleaning thread (the dropped file is written by
+    # the cleaning and by the fetching: the writes must not interleave)
+    stream = streams.get(output_file)
+    if stream is None:
+        function()
+    else:
+        stream['frames'].put(function)
+
+
+def stop(output_file, discard=False):
+    # waits for the cleaning of the last frames: the cleaned file then replaces the interactome file. Returns the
+    # ancestors of the IDMs of the interactome (see cleaning_data.cleaning). discard = True if the fetching failed
+    stream = streams.pop(output_file)
+    stream['discard'] = discard
+    stream['frames'].put(None)
+    stream['thread'].join()
+    if discard:
+        return None
+    if stream['error'] is not None:
+        raise RuntimeError('The cleaning of the fetched experimental evidences failed') from stream['error']
+    return cleaning_data.end_cleaning(stream['cleaning_state'])
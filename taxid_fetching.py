@@ -0,0 +1,121 @@
+# Author: Lunelys RUNESHAW <lunelys.runeshaw@etudiant.univ-rennes.fr>
+#
+# This script is fetching, for each taxid, the BioGRID and PSICQUIC experimental evidences and the Uniprot mapping
+# data. With taxid_max_workers > 1 (see main.py), the taxids are fetched at the same time, each one in its own process
+# and its own interactome file (interactome_[query]_[species]_[format]_[taxid].csv), and those files are merged into the
+# interactome file at the end, in the order of the taxids. The mapping data of all the taxids is then merged into one
+# on-disk geneid map (see uniprotkb_mapping.py).
+# With clean_while_fetching (see main.py), the mapping data is fetched first (fetch_mappings), as the experimental
+# evidences are cleaned while they are fetched (see stream_cleaning.py).
+
+import os
+import shutil
+import datetime
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import biogrid_fetching
+import psicquic_fetching
+import uniprotkb_mapping
+import interactome_io
+import run_report
+import fetch_checkpoints
+
+
+def get_taxid_file(output_file, taxid):
+    return output_file[:-4] + '_' + ('all' if taxid == '*' else taxid) + output_file[-4:]
+
+
+def fetch_mapping(taxid, uniprot_use_stream):
+    # the mapping data is only kept in the cache folder
+    print("Starting to fetch mapping data for taxid " + taxid + ": " + datetime.datetime.now().strftime("%d/%m/%Y, %H:%M:%S"))
+    with run_report.stage('fetch_mapping'):
+        run_report.record('fetch_mapping', rows_out=len(uniprotkb_mapping.mapping(taxid, uniprot_use_stream)))
+
+
+def get_geneid_map(output_file, taxids):
+    print("Merging the mapping data of the taxids: " + datetime.datetime.now().strftime("%d/%m/%Y, %H:%M:%S"))
+    with run_report.stage('geneid_map'):
+        return uniprotkb_mapping.build_geneid_map(uniprotkb_mapping.get_geneid_map_file(output_file),
+                                                  (uniprotkb_mapping.load_mapping(taxid) for taxid in taxids))
+
+
+def fetch_taxid(output_file, taxid, fetch_biogrid, psicquic_db_to_use, query, max_result, format,
+                molecular_interaction, biogrid_max_workers, psicquic_max_workers, psicquic_page_size,
+                uniprot_use_stream, intermediate_format, with_mapping=True):
+    # everything that is fetched for one taxid (with_mapping = False: the mapping data is already fetched)
+    if fetch_biogrid:
+        print("Starting to fetch BioGRID data for taxid " + taxid + ": " + datetime.datetime.now().strftime("%d/%m/%Y, %H:%M:%S"))
+        with run_report.stage('fetch_biogrid'):
+            biogrid_fetching.fetching(output_file, taxid, query, max_result, molecular_interaction,
+                                      biogrid_max_workers, intermediate_format)
+    if psicquic_db_to_use:
+        print("Starting to fetch PSICQUIC data for taxid " + taxid + ": " + datetime.datetime.now().strftime("%d/%m/%Y, %H:%M:%S"))
+        with run_report.stage('fetch_psicquic'):
+            psicquic_fetching.fetching(output_file, taxid, query, max_result, format, molecular_interaction,
+                                       psicquic_db_to_use, psicquic_max_workers, psicquic_page_size,
+                                       intermediate_format)
+    if with_mapping:
+        fetch_mapping(taxid, uniprot_use_stream)
+    return taxid
+
+
+def fetch_taxid_process(*args):
+    # run in its own process if taxid_max_workers > 1: its run report is sent back to the main process
+    run_report.reset()
+    taxid = fetch_taxid(*args)
+    return taxid, run_report.collect()
+
+
+def merge_taxid_file(output_file, taxid_file, intermediate_format):
+    # appends the interactome file of a taxid (and its dropped file, if there is one) to the ones of the run
+    for df in interactome_io.read_chunks(taxid_file, intermediate_format):
+        interactome_io.append(output_file, df, intermediate_format)
+    if intermediate_format == 'parquet':
+        shutil.rmtree(interactome_io.get_parquet_folder(taxid_file))
+    else:
+        os.remove(taxid_file)
+    taxid_dropped_file = taxid_file.replace('interactome', 'dropped')
+    if os.path.exists(taxid_dropped_file):
+        with open(output_file.replace('interactome', 'dropped'), 'a') as dropped_file:
+            with open(taxid_dropped_file) as taxid_dropped:
+                shutil.copyfileobj(taxid_dropped, dropped_file)
+        os.remove(taxid_dropped_file)
+
+
+# -----------------------------------------------------
+
+
+def fetching(output_file, taxids, fetch_biogrid, psicquic_db_to_use, query, max_result, format, molecular_interaction,
+             biogrid_max_workers=1, psicquic_max_workers=1, psicquic_page_size=None, uniprot_use_stream=True,
+             intermediate_format='csv', max_workers=1, with_mapping=True):
+    # returns the geneid map of all the taxids (with_mapping = False: already built by fetch_mappings)
+    args = (fetch_biogrid, psicquic_db_to_use, query, max_result, format, molecular_interaction, biogrid_max_workers,
+            psicquic_max_workers, psicquic_page_size, uniprot_use_stream, intermediate_format, with_mapping)
+    if max_workers > 1 and len(taxids) > 1:
+        taxid_files = [get_taxid_file(output_file, taxid) for taxid in taxids]
+        for taxid_file in taxid_files:
+            interactome_io.create(taxid_file, interactome_io.get_headers(format), intermediate_format)
+        # new processes (spawn), that do not share the connections already opened by this one
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            for taxid, taxid_report in executor.map(fetch_taxid_process, taxid_files, taxids,
+                                                    *[itertools.repeat(arg) for arg in args]):
+                run_report.merge(taxid_report)
+                print('Taxid ' + taxid + ' fetched')
+        for taxid_file in taxid_files:
+            merge_taxid_file(output_file, taxid_file, intermediate_format)
+            fetch_checkpoints.clear(taxid_file)
+    else:
+        for taxid in taxids:
+            fetch_taxid(output_file, taxid, *args)
+        fetch_checkpoints.clear(output_file)  # everything is fetched: a next run starts from scratch
+    if not with_mapping:
+        return uniprotkb_mapping.get_geneid_map_file(output_file)
+    return get_geneid_map(output_file, taxids)
+
+
+def fetch_mappings(output_file, taxids, uniprot_use_stream=True):
+    # only the mapping data of the taxids, merged into the geneid map. Returns the geneid map
+    for taxid in taxids:
+        fetch_mapping(taxid, uniprot_use_stream)
+    return get_geneid_map(output_file, taxids)
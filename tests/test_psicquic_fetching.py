@@ -0,0 +1,37 @@
+# Author: Lunelys RUNESHAW <lunelys.runeshaw@etudiant.univ-rennes.fr>
+#
+# The urls of the PSICQUIC queries must be well formed whatever the shape of the query (all species, one species, one
+# or several interactors): a single MIQL query in the path, and the paging parameters read by the server.
+
+import os
+import sys
+from urllib.parse import urlparse, parse_qs, unquote
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import psicquic_fetching  # noqa: E402
+
+service = psicquic_fetching.PsicquicService('IntAct', 'https://www.ebi.ac.uk/Tools/webservices/psicquic/intact/'
+                                                      'webservices/current/search/')
+shapes = [('*', None, '*'),
+          ('559292', None, 'species:559292'),
+          ('559292', ['NAM7'], 'identifier:NAM7 AND species:559292'),
+          ('*', ['NAM7'], 'identifier:NAM7'),
+          ('559292', ['NAM7', 'P30771'], 'identifier:(NAM7 OR P30771) AND species:559292')]
+
+
+def parse(url):
+    parsed = urlparse(url)
+    assert url.count('?') == 1
+    return unquote(parsed.path.split('/query/')[1]), parse_qs(parsed.query, strict_parsing=True)
+
+
+def test_paged_urls():
+    for species, interactors, miql in shapes:
+        url = psicquic_fetching.build_psicquic_url(service, species, interactors, 50000, 50000, 'tab27')
+        assert parse(url) == (miql, {'firstResult': ['50000'], 'maxResults': ['50000'], 'format': ['tab27']}), url
+
+
+def test_unpaged_urls():
+    for species, interactors, miql in shapes:
+        url = psicquic_fetching.build_psicquic_url(service, species, interactors, format='count')
+        assert parse(url) == (miql, {'format': ['count']}), url
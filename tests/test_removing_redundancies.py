@@ -0,0 +1,103 @@
+# Author: Lunelys RUNESHAW <lunelys.runeshaw@etudiant.univ-rennes.fr>
+#
+# The implicit redundancies found by find_implicit_redundancies must be the ones the comparison of the rows 2 by 2
+# (the loop of the first version of removing_redundancies.py, copied in old_implicit_redundancies) found.
+
+import os
+import sys
+import random
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import interactome_io  # noqa: E402
+import removing_redundancies  # noqa: E402
+
+# a small ontology: the ancestors (with children) of each IDM. MI:0001 and MI:0002 are unrelated, and both ancestors of
+# MI:0003
+mi_ancestors = {'MI:0001': [], 'MI:0002': [], 'MI:0003': ['MI:0001', 'MI:0002'], 'MI:0004': ['MI:0001'],
+                'MI:0005': ['MI:0004', 'MI:0001'], 'MI:0006': ['MI:0002'], 'MI:0007': ['MI:0006', 'MI:0002'],
+                'MI:0008': []}
+
+
+def old_implicit_redundancies(df):
+    # the impl ids of the first version, comparing the rows of each (prot1, prot2, pub_id) group 2 by 2
+    df = df.copy()
+    df['impl'] = np.nan
+    df['impl'] = df['impl'].astype(object)
+    grp = df.groupby(['prot1', 'prot2', 'pub_id'])
+    for name, group in grp:
+        for index, row in group.iterrows():
+            for index_int, row_int in group.iterrows():
+                if row['prot1'] == row_int['prot1'] and row['prot2'] == row_int['prot2'] \
+                        and (row['pub_id'] in row_int['pub_id'] or row_int['pub_id'] in row['pub_id']) \
+                        and row['only_mi_idms'] in row_int['ancestors']:
+                    if pd.isna(row_int['impl']) and pd.isna(row_int['impl']):
+                        df.at[row.name, 'impl'] = index + 1
+                        df.at[row_int.name, 'impl'] = index + 1
+                    else:
+                        if pd.notna(row_int['impl']):
+                            df.at[row.name, 'impl'] = row_int['impl']
+                        else:
+                            df.at[row_int.name, 'impl'] = row['impl']
+        for index, row in group.iterrows():
+            for index_int, row_int in group.iterrows():
+                if row['only_mi_idms'] not in row_int['ancestors'] and pd.isna(df.at[row.name, 'impl']):
+                    df.at[row.name, 'impl'] = df.at[row.name, 'interaction_identifiers']
+    return list(df['impl'])
+
+
+def new_implicit_redundancies(df):
+    df, accessions, pub_ids = removing_redundancies.encode_keys(df)
+    return list(removing_redundancies.find_implicit_redundancies(df))
+
+
+def get_evidences(rows):
+    # rows: (prot1, prot2, pub_id, IDM)
+    df = pd.DataFrame(rows, columns=['prot1', 'prot2', 'pub_id', 'only_mi_idms'])
+    df['ancestors'] = df['only_mi_idms'].map(mi_ancestors)
+    df['interaction_identifiers'] = ['intact:EBI-' + str(index) for index in range(df.shape[0])]
+    return df
+
+
+def get_interactome(rows):
+    # rows: (prot1, prot2, pub_id, IDM), as the cleaned interactome
+    df = pd.DataFrame('-', index=range(len(rows)), columns=interactome_io.tab27_headers)
+    df[['prot1', 'prot2', 'pub_id', 'idm']] = [[prot1, prot2, pub_id, 'psi-mi:"' + mi + '"(method)']
+                                               for prot1, prot2, pub_id, mi in rows]
+    df['interaction_identifiers'] = ['intact:EBI-' + str(index) for index in range(df.shape[0])]
+    return df
+
+
+def test_unrelated_ancestors_are_not_merged():
+    df = get_evidences([('P1', 'P2', 'pubmed:1', 'MI:0001'), ('P1', 'P2', 'pubmed:1', 'MI:0002'),
+                        ('P1', 'P2', 'pubmed:1', 'MI:0003')])
+    assert new_implicit_redundancies(df) == old_implicit_redundancies(df) == [1, 2, 2]
+
+
+def test_chains_and_separate_groups():
+    df = get_evidences([('P1', 'P2', 'pubmed:1', 'MI:0001'), ('P1', 'P2', 'pubmed:1', 'MI:0004'),
+                        ('P1', 'P2', 'pubmed:1', 'MI:0005'), ('P1', 'P2', 'pubmed:1', 'MI:0008'),
+                        ('P1', 'P2', 'pubmed:2', 'MI:0004'), ('P1', 'P3', 'pubmed:1', 'MI:0005')])
+    assert new_implicit_redundancies(df) == old_implicit_redundancies(df)
+
+
+def test_random_fixtures():
+    generator = random.Random(0)
+    for fixture in range(200):
+        rows = [(generator.choice(['P1', 'P2']), generator.choice(['P3', 'P4']),
+                 generator.choice(['pubmed:1', 'pubmed:2']), generator.choice(sorted(mi_ancestors)))
+                for row in range(generator.randint(1, 12))]
+        # the rows arrive sorted by (prot1, prot2, idm, pub_id), one per IDM, from the explicit redundancies
+        rows = sorted(set(rows), key=lambda row: (row[0], row[1], row[3], row[2]))
+        df = get_evidences(rows)
+        assert new_implicit_redundancies(df) == old_implicit_redundancies(df), rows
+
+
+def test_removing_frame_counts():
+    df = get_interactome([('P1', 'P2', 'pubmed:1', 'MI:0001'), ('P1', 'P2', 'pubmed:1', 'MI:0002'),
+                          ('P1', 'P2', 'pubmed:1', 'MI:0003'), ('P1', 'P2', 'pubmed:1', 'MI:0003')])
+    df = removing_redundancies.removing_frame(df, mi_ancestors)
+    assert df.shape[0] == 2
+    assert list(df['count_impl']) == [0, 1]
+    assert list(df['count_evidences']) == [1, 3]
@@ -2,15 +2,26 @@
 #
 # This script is fetching data from the Uniprot API to be used for the mapping geneID ids from the
 # BioGRID service to uniprotkb ids.
+# The mapping of each taxid is kept in the cache folder with the Uniprot release it comes from, and reused as long as
+# Uniprot does not publish a new release. The mappings of all the taxids of a run are then merged into one on-disk map
+# (a sqlite table), which the cleaning queries only for the ids it needs, instead of holding every taxid in memory.
 
+import os
 import re
+import io
+import csv
+import gzip
+import pickle
+import sqlite3
 import requests
 from requests.adapters import HTTPAdapter, Retry
+import run_report
 
 re_next_link = re.compile(r'<(.+)>; rel="next"')
 retries = Retry(total=5, backoff_factor=0.25, status_forcelist=[500, 502, 503, 504])
 session = requests.Session()
 session.mount("https://", HTTPAdapter(max_retries=retries))
+session.hooks['response'].append(run_report.response_hook('Uniprot'))  # requests, retries and bytes in the run report
 
 
 def get_next_link(headers):
@@ -32,19 +43,33 @@ def get_batch(batch_url):
         batch_url = get_next_link(response.headers)
 
 
-# -----------------------------------------------------
-
-
-def mapping(species):
+def get_query(species):
     # Note: we remove protein of uncertain existence (PE5, https://www.uniprot.org/help/dubious_sequences) because they have no gene name nor geneID
-    # &compressed=true? to use or is used by default?
     if species != '*':
-        url = 'https://rest.uniprot.org/uniprotkb/search?query=organism_id%3A' + species + '%20NOT%20existence%3A5&fields=accession,gene_primary,xref_geneid,gene_oln&size=500&format=json'
-    else:
-        url = 'https://rest.uniprot.org/uniprotkb/search?query=NOT%20existence%3A5&fields=accession,gene_primary,xref_geneid,gene_oln&size=500&format=json'
+        return 'organism_id%3A' + species + '%20NOT%20existence%3A5'
+    return 'NOT%20existence%3A5'
+
+
+def get_release(species):
+    # the current Uniprot release, to know if the cached mapping is still up to date. None if Uniprot is unreachable
+    url = 'https://rest.uniprot.org/uniprotkb/search?query=' + get_query(species) + '&fields=accession&size=1&format=json'
+    try:
+        response = session.get(url)
+        response.raise_for_status()
+    except requests.RequestException:
+        return None
+    return response.headers.get('X-UniProt-Release')
+
+
+def get_cache_file(species):
+    return os.path.join('cache', 'uniprotkb_mapping_' + ('all' if species == '*' else species) + '.pkl')
+
+
+def mapping_from_search(species):
+    # paginated search endpoint, json format, 500 entries per call
+    url = 'https://rest.uniprot.org/uniprotkb/search?query=' + get_query(species) + '&fields=accession,gene_primary,xref_geneid,gene_oln&size=500&format=json'
     progress = 0
     geneid_dict = {}
-    print('Downloading of the geneID to uniprotkb mapping data...')
     for batch, total in get_batch(url):
         for object in batch:
             if object.get('genes') and object['genes'] != [{}] and len(object['uniProtKBCrossReferences']) != 0:
@@ -62,5 +87,115 @@ def mapping(species):
                                                     ordered_locus_name=ordered_locus_name)})
         progress += len(batch)
         print(f'{progress} / {total}')
+    return geneid_dict
+
+
+def mapping_from_stream(species):
+    # stream endpoint: the whole mapping in one compressed tsv transfer. The orf names and synonyms are only asked to
+    # keep the same entries as the search endpoint (entries with gene information), they are not used
+    url = 'https://rest.uniprot.org/uniprotkb/stream?query=' + get_query(species) + '&fields=accession,gene_primary,xref_geneid,gene_oln,gene_orf,gene_synonym&format=tsv&compressed=true'
+    response = session.get(url)
+    response.raise_for_status()
+    content = response.content
+    if content[:2] == b'\x1f\x8b':  # still gzipped (it was not decoded as a Content-Encoding)
+        content = gzip.decompress(content)
+    geneid_dict = {}
+    reader = csv.reader(io.StringIO(content.decode('utf-8')), delimiter='\t')
+    next(reader)  # header
+    for uniprotkb_id, gene_primary, geneids, ordered_locus_names, orf_names, synonyms in reader:
+        if geneids and (gene_primary or ordered_locus_names or orf_names or synonyms):
+            geneID_id = geneids.split(';')[0].strip()
+            gene_name = gene_primary.split(';')[0].strip() or '-'
+            ordered_locus_name = ordered_locus_names.split(';')[0].strip().split(' ')[0] or '-'
+            geneid_dict.update({geneID_id: dict(uniprotkb_id=uniprotkb_id, gene_name=gene_name,
+                                                ordered_locus_name=ordered_locus_name)})
+    print(f'{len(geneid_dict)} geneIDs mapped')
+    return geneid_dict
+
+
+# -----------------------------------------------------
+
+
+def mapping(species, use_stream=True):
+    cache_file = get_cache_file(species)
+    release = get_release(species)
+    if os.path.exists(cache_file):
+        with open(cache_file, 'rb') as cached:
+            cached_mapping = pickle.load(cached)
+        if release is None or cached_mapping['release'] == release:
+            if release is None:
+                print('Uniprot is unreachable, using the cached mapping data of release ' + str(cached_mapping['release']))
+            else:
+                print('Mapping data of Uniprot release ' + release + ' already downloaded: using ' + cache_file)
+            return cached_mapping['geneid_dict']
+    print('Downloading of the geneID to uniprotkb mapping data (Uniprot release ' + str(release) + ')...')
+    if use_stream:
+        geneid_dict = mapping_from_stream(species)
+    else:
+        geneid_dict = mapping_from_search(species)
     print("Mapping data downloaded from uniprotkb: complete")
+    os.makedirs('cache', exist_ok=True)
+    with open(cache_file, 'wb') as cached:
+        pickle.dump({'release': release, 'geneid_dict': geneid_dict}, cached, protocol=pickle.HIGHEST_PROTOCOL)
     return geneid_dict
+
+
+def load_mapping(species):
+    # the mapping of a taxid, from the cache folder (see mapping())
+    with open(get_cache_file(species), 'rb') as cached:
+        return pickle.load(cached)['geneid_dict']
+
+
+def get_geneid_map_file(output_file):
+    return os.path.join('cache', os.path.basename(output_file)[:-4] + '_geneid_map.sqlite')
+
+
+def build_geneid_map(geneid_map_file, geneid_dicts):
+    # merges the geneid dictionaries into one sqlite table, one dictionary at a time. If a geneID is in several
+    # dictionaries, the last one wins but keeps its first position (rowid), exactly like merging them with |
+    os.makedirs(os.path.dirname(geneid_map_file) or '.', exist_ok=True)
+    if os.path.exists(geneid_map_file):
+        os.remove(geneid_map_file)
+    connection = sqlite3.connect(geneid_map_file)
+    connection.execute('CREATE TABLE geneid_map (geneid TEXT PRIMARY KEY, uniprotkb_id TEXT, gene_name TEXT, '
+                       'ordered_locus_name TEXT)')
+    for geneid_dict in geneid_dicts:
+        connection.executemany('INSERT INTO geneid_map VALUES (?, ?, ?, ?) ON CONFLICT(geneid) DO UPDATE SET '
+                               'uniprotkb_id = excluded.uniprotkb_id, gene_name = excluded.gene_name, '
+                               'ordered_locus_name = excluded.ordered_locus_name',
+                               ((geneid, infos['uniprotkb_id'], infos['gene_name'], infos['ordered_locus_name'])
+                                for geneid, infos in geneid_dict.items()))
+        connection.commit()
+    connection.execute('CREATE INDEX geneid_map_uniprotkb_id ON geneid_map (uniprotkb_id)')
+    connection.commit()
+    connection.close()
+    return geneid_map_file
+
+
+def query_geneid_map(geneid_map_file, column, values, batch_size=500):
+    # the rows of the map whose column is in values, in the order of the map (rowid)
+    rows = []
+    values = list(values)
+    connection = sqlite3.connect(geneid_map_file)
+    for start in range(0, len(values), batch_size):
+        batch = values[start:start + batch_size]
+        rows.extend(connection.execute('SELECT rowid, geneid, uniprotkb_id, gene_name, ordered_locus_name FROM geneid_map '
+                                       'WHERE ' + column + ' IN (' + ','.join('?' * len(batch)) + ')', batch))
+    connection.close()
+    return sorted(rows)
+
+
+def get_uniprotkb_ids(geneid_map_file, geneids):
+    # {geneID: uniprotkb id} for the geneIDs of the map
+    return {geneid: uniprotkb_id for rowid, geneid, uniprotkb_id, gene_name, ordered_locus_name
+            in query_geneid_map(geneid_map_file, 'geneid', geneids)}
+
+
+def get_gene_names(geneid_map_file, uniprotkb_ids):
+    # {uniprotkb id: gene name (or ordered locus name if there is no gene name)}, to fetch a gene name from a protein id.
+    # If several geneIDs give the same uniprotkb id, the last one wins
+    uniprotkb_to_gene_name = {}
+    for rowid, geneid, uniprotkb_id, gene_name, ordered_locus_name in query_geneid_map(geneid_map_file, 'uniprotkb_id',
+                                                                                       uniprotkb_ids):
+        uniprotkb_to_gene_name[uniprotkb_id] = gene_name if gene_name != '-' else ordered_locus_name
+    return uniprotkb_to_gene_name